@@ -1,8 +1,8 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { FaBoxOpen, FaChartBar, FaSearch, FaExclamationTriangle, FaBox, FaBoxes, FaInfoCircle, FaFilter, FaUndo, FaEdit, FaTimes } from 'react-icons/fa';
-import { getStockData } from '@/lib/api';
+import { getStockData, getStockSummary, subscribeToStockEvents } from '@/lib/api';
 
 interface StockItem {
   id: string;
@@ -17,10 +17,15 @@ interface StockItem {
     location: string;
   };
   quantity: number;
-  threshold: number;
   lastUpdated: string;
 }
 
+// Store.low_stock_threshold default, used until the summary has loaded
+const DEFAULT_THRESHOLD = 20;
+
+// How often to reload while the live stock stream is unavailable
+const POLL_INTERVAL_MS = 30000;
+
 interface StockSummary {
   totalItems: number;
   totalQuantity: number;
@@ -36,43 +41,108 @@ export default function ViewStocks() {
     lowStockItems: 0,
     outOfStockItems: 0
   });
+  // Low stock threshold of each store, by store id
+  const [thresholds, setThresholds] = useState<Record<string, number>>({});
   const [loading, setLoading] = useState(true);
   const [productFilter, setProductFilter] = useState('');
   const [storeFilter, setStoreFilter] = useState('');
   const [statusFilter, setStatusFilter] = useState('');
+  const [streamConnected, setStreamConnected] = useState(false);
+  // Filters of the rows on screen, reused when they are reloaded
+  const appliedFilters = useRef<any>({});
+  // Latest rows, for event handlers that outlive a render
+  const stocksRef = useRef<StockItem[]>([]);
+  stocksRef.current = stocks;
+  const refreshTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const refreshList = useRef(false);
 
   useEffect(() => {
     fetchStockData();
+    fetchSummary();
   }, []);
 
-  const fetchStockData = async (filters = {}) => {
-    setLoading(true);
+  // Follow stock changes of the summary's stores over the event stream
+  const storeIds = Object.keys(thresholds).map(Number);
+  const storeKey = storeIds.join(',');
+  useEffect(() => {
+    return subscribeToStockEvents(storeIds, {
+      onStock: handleStockEvent,
+      onResync: () => scheduleRefresh(true),
+      onStatus: setStreamConnected,
+    });
+  }, [storeKey]);
+
+  // Poll only while the stream is down
+  useEffect(() => {
+    if (streamConnected) return;
+    const timer = setInterval(() => scheduleRefresh(true), POLL_INTERVAL_MS);
+    return () => clearInterval(timer);
+  }, [streamConnected]);
+
+  // Quantities on screen are updated in place; with a status filter a row
+  // may have changed bucket, so the list is reloaded instead. Rows that are
+  // not on screen show up on the next load.
+  const handleStockEvent = (event: { store_id: number; changes: { product_id: number; quantity: number }[] }) => {
+    if (appliedFilters.current.status) {
+      scheduleRefresh(true);
+      return;
+    }
+    const next = [...stocksRef.current];
+    for (const change of event.changes) {
+      const index = next.findIndex((stock) =>
+        String(stock.store.id) === String(event.store_id) && String(stock.product.id) === String(change.product_id)
+      );
+      if (index === -1) continue;
+      next[index] = { ...next[index], quantity: change.quantity, lastUpdated: new Date().toISOString() };
+    }
+    stocksRef.current = next;
+    setStocks(next);
+    scheduleRefresh(false);
+  };
+
+  // A burst of events (a resync per store when the stream opens, or many
+  // movements at once) reloads the summary, and the list if asked, once
+  const scheduleRefresh = (withList: boolean) => {
+    if (withList) refreshList.current = true;
+    if (refreshTimer.current) return;
+    refreshTimer.current = setTimeout(() => {
+      refreshTimer.current = null;
+      if (refreshList.current) {
+        refreshList.current = false;
+        fetchStockData(appliedFilters.current, false);
+      }
+      fetchSummary();
+    }, 1000);
+  };
+
+  // The counts are maintained per store by the backend, so they cover all
+  // stock rather than the rows loaded here
+  const fetchSummary = async () => {
+    try {
+      const data = await getStockSummary();
+      const { out_of_stock, low_stock, in_stock, total_units } = data.totals;
+      setSummary({
+        totalItems: out_of_stock + low_stock + in_stock,
+        totalQuantity: total_units,
+        lowStockItems: low_stock,
+        outOfStockItems: out_of_stock
+      });
+      setThresholds(Object.fromEntries(
+        data.stores.map((store: any) => [String(store.store_id), store.low_stock_threshold])
+      ));
+    } catch (error) {
+      console.error('Error fetching stock summary:', error);
+    }
+  };
+
+  const fetchStockData = async (filters: any = {}, showLoading = true) => {
+    appliedFilters.current = filters;
+    if (showLoading) setLoading(true);
     try {
       const data = await getStockData(filters);
       
       if (data && data.stocks) {
         setStocks(data.stocks);
-        
-        if (data.total_items !== undefined) {
-          setSummary({
-            totalItems: data.total_items,
-            totalQuantity: data.stocks.reduce((sum, item) => sum + item.quantity, 0),
-            lowStockItems: data.low_stock_count || 0,
-            outOfStockItems: data.out_of_stock_count || 0
-          });
-        } else {
-          // Calculate summary if not provided by API
-          const lowStock = data.stocks.filter(s => s.quantity > 0 && s.quantity <= s.threshold).length;
-          const outOfStock = data.stocks.filter(s => s.quantity === 0).length;
-          const totalQty = data.stocks.reduce((sum, item) => sum + item.quantity, 0);
-          
-          setSummary({
-            totalItems: data.stocks.length,
-            totalQuantity: totalQty,
-            lowStockItems: lowStock,
-            outOfStockItems: outOfStock
-          });
-        }
       }
     } catch (error) {
       console.error('Error fetching stock data:', error);
@@ -112,15 +182,16 @@ export default function ViewStocks() {
     }).format(date);
   };
 
+  // Same buckets as the backend: low stock is below the store's threshold
   const getStatusClass = (quantity: number, threshold: number) => {
     if (quantity === 0) return 'badge-out-of-stock';
-    if (quantity <= threshold) return 'badge-low-stock';
+    if (quantity < threshold) return 'badge-low-stock';
     return 'badge-in-stock';
   };
 
   const getStatusText = (quantity: number, threshold: number) => {
     if (quantity === 0) return 'Out of Stock';
-    if (quantity <= threshold) return 'Low Stock';
+    if (quantity < threshold) return 'Low Stock';
     return 'In Stock';
   };
 
@@ -255,9 +326,9 @@ export default function ViewStocks() {
                   onChange={(e) => setStatusFilter(e.target.value)}
                 >
                   <option value="">All Status</option>
-                  <option value="in-stock">In Stock</option>
-                  <option value="low-stock">Low Stock</option>
-                  <option value="out-of-stock">Out of Stock</option>
+                  <option value="in_stock">In Stock</option>
+                  <option value="low_stock">Low Stock</option>
+                  <option value="out_of_stock">Out of Stock</option>
                 </select>
               </div>
             </div>
@@ -321,8 +392,8 @@ export default function ViewStocks() {
                       <td className="logs-table-data">{stock.store.name}</td>
                       <td className="logs-table-data">{stock.quantity}</td>
                       <td className="logs-table-data">
-                        <span className={`badge ${getStatusClass(stock.quantity, stock.threshold)}`}>
-                          {getStatusText(stock.quantity, stock.threshold)}
+                        <span className={`badge ${getStatusClass(stock.quantity, thresholds[stock.store.id] ?? DEFAULT_THRESHOLD)}`}>
+                          {getStatusText(stock.quantity, thresholds[stock.store.id] ?? DEFAULT_THRESHOLD)}
                         </span>
                       </td>
                       <td className="logs-table-data">{formatDate(stock.lastUpdated)}</td>
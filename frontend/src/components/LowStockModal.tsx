@@ -2,6 +2,7 @@
 
 import React, { useState, useEffect } from 'react';
 import { FaTimes } from 'react-icons/fa';
+import { getStockData } from '@/lib/api';
 import '@/styles/components/Modal.css';
 
 // Define interfaces
@@ -28,17 +29,17 @@ interface Stock {
 interface LowStockModalProps {
   isOpen: boolean;
   onClose: () => void;
-  stocks: Stock[];
+  storeId?: number; // All stores when not given
 }
 
-const LowStockModal: React.FC<LowStockModalProps> = ({ isOpen, onClose, stocks }) => {
+const LowStockModal: React.FC<LowStockModalProps> = ({ isOpen, onClose, storeId }) => {
   const [lowStockItems, setLowStockItems] = useState<Stock[]>([]);
 
   useEffect(() => {
-    // Filter stocks to find low stock items (quantity between 1 and 19)
-    const lowItems = stocks.filter(stock => stock.quantity > 0 && stock.quantity < 20);
-    setLowStockItems(lowItems);
-  }, [stocks]);
+    if (!isOpen) return;
+    // The server applies the status filter with each store's threshold
+    getStockData({ status: 'low_stock', store: storeId }).then(data => setLowStockItems(data.stocks));
+  }, [isOpen, storeId]);
 
   if (!isOpen) return null;
 
@@ -2,6 +2,7 @@
 
 import React, { useState, useEffect } from 'react';
 import { FaTimes } from 'react-icons/fa';
+import { getStockData } from '@/lib/api';
 import '@/styles/components/Modal.css';
 
 // Define interfaces
@@ -28,17 +29,17 @@ interface Stock {
 interface OutOfStockModalProps {
   isOpen: boolean;
   onClose: () => void;
-  stocks: Stock[];
+  storeId?: number; // All stores when not given
 }
 
-const OutOfStockModal: React.FC<OutOfStockModalProps> = ({ isOpen, onClose, stocks }) => {
+const OutOfStockModal: React.FC<OutOfStockModalProps> = ({ isOpen, onClose, storeId }) => {
   const [outOfStockItems, setOutOfStockItems] = useState<Stock[]>([]);
 
   useEffect(() => {
-    // Filter stocks to find out of stock items (quantity is 0)
-    const outItems = stocks.filter(stock => stock.quantity === 0);
-    setOutOfStockItems(outItems);
-  }, [stocks]);
+    if (!isOpen) return;
+    // The server applies the status filter
+    getStockData({ status: 'out_of_stock', store: storeId }).then(data => setOutOfStockItems(data.stocks));
+  }, [isOpen, storeId]);
 
   if (!isOpen) return null;
 
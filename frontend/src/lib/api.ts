@@ -94,6 +94,15 @@ export const getSuppliers = async () => {
   return response.data;
 };
 
+// Per-store stock status counts (out of stock / low stock / in stock), maintained
+// by the backend: { totals: {...}, stores: [{ store_id, low_stock_threshold, ... }] }
+export const getStockSummary = async (storeId?: number) => {
+  const response = await api.get('/api/stock/summary/', {
+    params: storeId ? { store: storeId } : {},
+  });
+  return response.data;
+};
+
 // Stocks API
 export const getStocks = async (params?: any) => {
   try {
@@ -140,6 +149,8 @@ export const getStocks = async (params?: any) => {
     
     const response = await fetch(`${API_URL}/api/stocks/${queryString}`, {
       method: 'GET',
+      // Revalidate with the stored ETag; unchanged stock comes back as 304
+      cache: 'no-cache',
       headers: {
         'Content-Type': 'application/json',
         'Authorization': `Token ${token}`
@@ -217,6 +228,8 @@ export const getStockData = async (params = {}) => {
     
     const response = await fetch(`${API_URL}/api/stock/${queryString}`, {
       method: 'GET',
+      // Revalidate with the stored ETag; unchanged stock comes back as 304
+      cache: 'no-cache',
       headers: {
         'Content-Type': 'application/json',
         'Authorization': `Token ${token}`
@@ -238,20 +251,10 @@ export const getStockData = async (params = {}) => {
       stocksArray = data.stocks;
     }
     
-    // Calculate summary data from the stock results
-    const total_items = stocksArray.length;
-    const low_stock_count = stocksArray.filter((stock: any) => 
-      stock && stock.quantity > 0 && stock.quantity < 20
-    ).length;
-    const out_of_stock_count = stocksArray.filter((stock: any) => 
-      stock && stock.quantity === 0
-    ).length;
-    
+    // Status counts come from getStockSummary(), which applies each store's threshold
     return {
       stocks: stocksArray,
-      total_items,
-      low_stock_count,
-      out_of_stock_count,
+      total_items: stocksArray.length,
       growth_percentage: data.growth_percentage || 0 // Use from response if available
     };
   } catch (error) {
@@ -259,13 +262,84 @@ export const getStockData = async (params = {}) => {
     return {
       stocks: [],
       total_items: 0,
-      low_stock_count: 0,
-      out_of_stock_count: 0,
       growth_percentage: 0
     };
   }
 };
 
+// Subscribe to live stock changes of the given stores (Server-Sent Events).
+// A 'resync' event means changes may have been missed: reload those stores.
+// onStatus reports whether the stream is connected, so callers can poll
+// while it is not. Returns a function that closes the subscription.
+export const subscribeToStockEvents = (
+  storeIds: number[],
+  handlers: {
+    onStock?: (event: { store_id: number; changes: { product_id: number; quantity: number; change: number }[] }) => void;
+    onResync?: (event: { store_id: number }) => void;
+    onStatus?: (connected: boolean) => void;
+  }
+) => {
+  const token = localStorage.getItem('token');
+  if (!token || storeIds.length === 0 || typeof EventSource === 'undefined') {
+    handlers.onStatus?.(false);
+    return () => {};
+  }
+
+  let source: EventSource | null = null;
+  let closed = false;
+
+  // EventSource cannot send headers, so the stream is opened with a short-lived
+  // ticket instead of the token, which would end up in access logs
+  const open = async () => {
+    let ticket: string;
+    try {
+      const response = await api.post('/api/stock/events/ticket/');
+      ticket = response.data.ticket;
+    } catch (error) {
+      console.error('Error fetching stock events ticket:', error);
+      if (!closed) {
+        handlers.onStatus?.(false);
+        setTimeout(open, 5000);
+      }
+      return;
+    }
+    if (closed) {
+      return;
+    }
+
+    const queryString = new URLSearchParams({ store: storeIds.join(','), ticket }).toString();
+    source = new EventSource(`${API_URL}/api/stock/events/?${queryString}`);
+
+    source.onopen = () => {
+      handlers.onStatus?.(true);
+    };
+    source.addEventListener('stock', (event) => {
+      handlers.onStock?.(JSON.parse((event as MessageEvent).data));
+    });
+    source.addEventListener('resync', (event) => {
+      handlers.onResync?.(JSON.parse((event as MessageEvent).data));
+    });
+    // The browser reconnects by itself with the same ticket; once that has
+    // expired the reconnect is refused and we start over with a new one
+    source.onerror = () => {
+      if (closed) {
+        return;
+      }
+      handlers.onStatus?.(false);
+      if (source?.readyState === EventSource.CLOSED) {
+        source = null;
+        setTimeout(open, 1000);
+      }
+    };
+  };
+  open();
+
+  return () => {
+    closed = true;
+    source?.close();
+  };
+};
+
 // Stock Movements API
 export const addStockMovement = async (data: any) => {
   try {
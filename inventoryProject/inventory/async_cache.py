@@ -0,0 +1,94 @@
+"""
+Async reads from the Django cache for the async views.
+
+Django's cache API has async methods, but their default implementations,
+which django_redis does not override, run the sync method in a thread. With
+django_redis, the functions here talk to the same Redis server through a
+redis.asyncio client instead, using django_redis's key format and value
+encoding, so a cache hit is served on the event loop. Other backends, like
+the local memory cache used in development, are called in a thread, once
+per lookup rather than once per key.
+
+Errors are raised like the sync cache API raises them; callers catch them
+and fall back to the sync path.
+"""
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+_client = {'loop': None, 'instance': None}
+_client_lock = threading.Lock()
+
+
+def is_redis():
+    return type(cache).__module__.startswith('django_redis')
+
+
+def _location():
+    location = settings.CACHES['default']['LOCATION']
+    if isinstance(location, (list, tuple)):
+        location = location[0]
+    # django_redis reads from and writes to the first server
+    return location.split(',')[0]
+
+
+def get_client():
+    """Return the redis.asyncio client of the running event loop, creating it on first use."""
+    from redis import asyncio as redis_asyncio
+
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        if _client['loop'] is not loop:
+            _client['loop'] = loop
+            _client['instance'] = redis_asyncio.Redis.from_url(_location())
+        return _client['instance']
+
+
+async def aget_many(keys, version=None):
+    """Return {key: value} for the given keys that are cached, like cache.get_many()."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    if not is_redis():
+        # BaseCache.aget_many() leaves the event loop once per key
+        return await sync_to_async(cache.get_many)(keys, version=version)
+
+    values = await get_client().mget([cache.client.make_key(key, version=version) for key in keys])
+    return {key: cache.client.decode(value) for key, value in zip(keys, values) if value is not None}
+
+
+def _incr_counters(deltas):
+    for key, delta in deltas.items():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, timeout=None)
+
+
+async def aget(key, version=None):
+    """Return the cached value of key, or None."""
+    return (await aget_many([key], version=version)).get(key)
+
+
+async def aincr_counters(deltas):
+    """
+    Add to counters that never expire, creating missing ones.
+
+    Args:
+        deltas: Maps each counter key to the amount to add
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if not is_redis():
+        await sync_to_async(_incr_counters)(deltas)
+        return
+
+    # django_redis stores integers unencoded, so INCRBY works on its counters
+    async with get_client().pipeline(transaction=False) as pipe:
+        for key, delta in deltas.items():
+            pipe.incrby(cache.client.make_key(key), delta)
+        await pipe.execute()
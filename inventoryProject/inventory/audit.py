@@ -0,0 +1,187 @@
+"""
+Audit log sink.
+
+Movement processing hands its AuditLog entries to ``audit_sink`` instead of
+inserting them itself. How they are written depends on AUDIT_LOG_DURABILITY:
+
+``sync``
+    Entries are inserted immediately, inside the caller's transaction, so they
+    commit or roll back with the stock change. This is the default.
+
+``on_commit``
+    Entries are inserted with one bulk_create right after the caller's
+    transaction commits and dropped if it rolls back. A crash between the
+    commit and the insert loses them.
+
+``buffered``
+    Committed entries are collected in a per-process buffer and written with
+    bulk_create when AUDIT_LOG_BUFFER_SIZE entries are waiting or the oldest
+    has waited AUDIT_LOG_FLUSH_INTERVAL seconds. The buffer is checked at the
+    end of every request and Celery task and by a background thread, and is
+    flushed when the process exits normally (atexit, or worker process
+    shutdown for Celery). Entries still buffered when a process is killed
+    without shutting down (SIGKILL, OOM) are lost.
+
+    A failed flush keeps its entries for the next one. While the database
+    stays unavailable the buffer holds at most AUDIT_LOG_MAX_BUFFERED
+    entries; older ones are dropped, logged, and counted in the
+    ``audit_log_dropped`` cache counter that ``/api/metrics/`` reports.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from celery.signals import task_postrun, worker_process_shutdown
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+
+from .models import AuditLog
+
+AUDIT_LOG_DURABILITY = getattr(settings, 'AUDIT_LOG_DURABILITY', 'sync')
+AUDIT_LOG_BUFFER_SIZE = getattr(settings, 'AUDIT_LOG_BUFFER_SIZE', 500)
+AUDIT_LOG_FLUSH_INTERVAL = getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 2.0)
+AUDIT_LOG_MAX_BUFFERED = getattr(settings, 'AUDIT_LOG_MAX_BUFFERED', 50000)
+DROPPED_KEY = 'audit_log_dropped'
+
+logger = logging.getLogger(__name__)
+
+
+def dropped_total():
+    """Return the number of audit log entries every process has dropped."""
+    try:
+        return cache.get(DROPPED_KEY, 0)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return 0
+
+
+class AuditSink:
+    """Collect AuditLog entries and write them according to a durability mode."""
+
+    def __init__(self, mode='sync', buffer_size=500, flush_interval=2.0, max_buffered=50000):
+        if mode not in ('sync', 'on_commit', 'buffered'):
+            raise ValueError(f"Unknown audit log durability mode: {mode}")
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max(max_buffered, buffer_size)
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, entries):
+        """
+        Hand over a list of unsaved AuditLog instances.
+        """
+        if not entries:
+            return
+        if self.mode == 'sync':
+            self._write(entries)
+        elif self.mode == 'on_commit':
+            transaction.on_commit(lambda: self._write(entries))
+        else:
+            # Only entries whose transaction committed enter the buffer
+            transaction.on_commit(lambda: self._append(entries))
+
+    def _append(self, entries):
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(entries)
+            dropped = self._trim()
+        self._count_dropped(dropped)
+        self._start_flusher()
+        self.flush_if_due()
+
+    def _trim(self):
+        """Drop the oldest entries beyond max_buffered; call with the lock held."""
+        excess = len(self._buffer) - self.max_buffered
+        if excess <= 0:
+            return 0
+        del self._buffer[:excess]
+        self.dropped += excess
+        return excess
+
+    def _count_dropped(self, dropped):
+        if not dropped:
+            return
+        logger.error("Audit log buffer full, dropped %d entries (%d in this process)", dropped, self.dropped)
+        try:
+            if not cache.add(DROPPED_KEY, dropped, timeout=None):
+                cache.incr(DROPPED_KEY, dropped)
+        except Exception as cache_error:
+            print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+    def _write(self, entries):
+        AuditLog.objects.bulk_create(entries, batch_size=1000)
+        self.written += len(entries)
+
+    def is_due(self):
+        """Return whether the buffer is full or its oldest entry is too old."""
+        with self._lock:
+            return bool(self._buffer) and (
+                len(self._buffer) >= self.buffer_size or
+                time.monotonic() - self._oldest >= self.flush_interval
+            )
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        """Write every buffered entry now."""
+        with self._lock:
+            entries, self._buffer, self._oldest = self._buffer, [], None
+        if not entries:
+            return 0
+        try:
+            self._write(entries)
+        except Exception as e:
+            # Keep the entries for the next flush, up to max_buffered
+            logger.warning("Audit log flush of %d entries failed, will retry: %s", len(entries), e)
+            with self._lock:
+                self._buffer[:0] = entries
+                self._oldest = self._oldest or time.monotonic()
+                dropped = self._trim()
+            self._count_dropped(dropped)
+            return 0
+        return len(entries)
+
+    def _start_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name='audit-log-flusher', daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_if_due()
+            finally:
+                close_old_connections()
+
+
+audit_sink = AuditSink(AUDIT_LOG_DURABILITY, AUDIT_LOG_BUFFER_SIZE, AUDIT_LOG_FLUSH_INTERVAL, AUDIT_LOG_MAX_BUFFERED)
+
+
+def flush_audit_logs(**kwargs):
+    """Flush buffered audit logs; used on process shutdown."""
+    audit_sink.flush()
+
+
+atexit.register(flush_audit_logs)
+worker_process_shutdown.connect(flush_audit_logs, weak=False)
+
+
+@task_postrun.connect(weak=False)
+def flush_audit_logs_after_task(**kwargs):
+    audit_sink.flush_if_due()
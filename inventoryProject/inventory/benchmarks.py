@@ -0,0 +1,554 @@
+"""
+Benchmarks for the inventory hot paths.
+
+Each benchmark builds its own fixture data inside a transaction that is rolled
+back afterwards, or deletes it again when worker threads need to see committed
+rows, so it can be run against a development database without leaving rows
+behind. Run them with ``python manage.py benchmark <name>``.
+"""
+import asyncio
+import json
+import random
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .audit import AuditSink
+from .models import AuditLog, Product, Stock, StockMovement, Store, User
+from .serializers import AuditLogFlatSerializer, AuditLogSerializer, StockFlatSerializer, StockSerializer
+from .tasks import apply_stock_movement, process_movement_batch, process_stock_movement
+from .snapshots import snapshot_date_filter
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function under the given name."""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the enclosed block in a transaction that is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback()
+    except _Rollback:
+        pass
+
+
+def timed(label, count, func):
+    """Run func and return a result row with its throughput."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return {
+        'label': label,
+        'count': count,
+        'seconds': round(elapsed, 4),
+        'per_second': round(count / elapsed, 1) if elapsed else None,
+    }
+
+
+def create_fixture(stores, products, seed=0):
+    """Create stores, products and an initial Stock row for every pair."""
+    rng = random.Random(seed)
+    store_objs = Store.objects.bulk_create([
+        Store(name=f"Bench Store {i}", location=f"Bench Location {i}")
+        for i in range(stores)
+    ])
+    product_objs = Product.objects.bulk_create([
+        Product(name=f"Bench Product {i}", sku=f"BENCH-{seed}-{i:06d}")
+        for i in range(products)
+    ])
+    Stock.objects.bulk_create([
+        Stock(store=store, product=product, quantity=rng.randint(0, 200))
+        for store in store_objs for product in product_objs
+    ])
+    return store_objs, product_objs
+
+
+def create_movements(stores, products, count, seed=0):
+    """Create count unprocessed movements spread over the given stores and products."""
+    rng = random.Random(seed)
+    movements = [
+        StockMovement(
+            store=rng.choice(stores),
+            product=rng.choice(products),
+            movement_type=rng.choice(('IN', 'OUT', 'REM')),
+            quantity=rng.randint(1, 50),
+        )
+        for _ in range(count)
+    ]
+    return StockMovement.objects.bulk_create(movements)
+
+
+@benchmark('movement_processing')
+def movement_processing(size=2000):
+    """
+    Compare the per-movement task with the batched drain.
+
+    The per-row task body is called in-process, so the result excludes broker
+    round trips and is a lower bound for the per-row cost.
+    """
+    results = []
+    with rolled_back():
+        stores, products = create_fixture(stores=10, products=50)
+
+        movements = create_movements(stores, products, size, seed=1)
+        results.append(timed('per_row_task', size, lambda: [
+            process_stock_movement(movement.id) for movement in movements
+        ]))
+
+        create_movements(stores, products, size, seed=2)
+        results.append(timed('batch_drain', size, lambda: process_movement_batch(size)))
+    return results
+
+
+@benchmark('concurrent_movements')
+def concurrent_movements(size=2000, workers=16):
+    """
+    Hammer a single Stock row from a thread pool and check for lost updates.
+
+    Every movement is submitted twice to exercise the processed claim. The
+    fixture is committed so the worker connections can see it, and is deleted
+    afterwards. Raises if the final quantity or audit log count is off.
+    """
+    rng = random.Random(0)
+    store, product = create_fixture(stores=1, products=1, seed=rng.randint(0, 10 ** 6))
+    store, product = store[0], product[0]
+    try:
+        initial = 10 ** 6
+        Stock.objects.filter(store=store, product=product).update(quantity=initial)
+        movements = StockMovement.objects.bulk_create([
+            StockMovement(
+                store=store,
+                product=product,
+                movement_type=rng.choice(('IN', 'OUT')),
+                quantity=rng.randint(1, 50),
+            )
+            for _ in range(size)
+        ])
+        expected = initial + sum(
+            movement.quantity if movement.movement_type == 'IN' else -movement.quantity
+            for movement in movements
+        )
+
+        def work(movement_id):
+            try:
+                apply_stock_movement(movement_id)
+            finally:
+                connection.close()
+
+        ids = [movement.id for movement in movements] * 2
+        rng.shuffle(ids)
+
+        def run():
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(work, ids))
+
+        result = timed(f'{workers}_threads_one_row', size, run)
+
+        final = Stock.objects.get(store=store, product=product).quantity
+        logged = AuditLog.objects.filter(store=store, product=product).count()
+        if final != expected or logged != size:
+            raise RuntimeError(
+                f"Lost updates: quantity {final} (expected {expected}), "
+                f"{logged} audit logs (expected {size})"
+            )
+        return [result]
+    finally:
+        AuditLog.objects.filter(store=store).delete()
+        store.delete()
+        product.delete()
+
+
+def _legacy_date_filter(queryset, movements):
+    """The OR-of-Q (product, store) filter the EXISTS filters replaced."""
+    pairs = movements.values('product_id', 'store_id').distinct()
+    stock_filters = models.Q()
+    for pair in pairs:
+        stock_filters |= models.Q(product_id=pair['product_id'], store_id=pair['store_id'])
+    return queryset.filter(stock_filters)
+
+
+def _movement_exists_filter(start, end):
+    """The correlated EXISTS on StockMovement that snapshot_date_filter replaced."""
+    return models.Exists(StockMovement.objects.filter(
+        product_id=models.OuterRef('product_id'),
+        store_id=models.OuterRef('store_id'),
+        timestamp__gte=start,
+        timestamp__lte=end,
+    ))
+
+
+@benchmark('date_filter')
+def date_filter(size=20000):
+    """
+    Compare the OR-of-Q date filter, the EXISTS subquery on movements and the
+    EXISTS subquery on daily snapshots as data grows.
+
+    Movements are added and processed in four steps up to size; at each step
+    all filters are evaluated for the same date range.
+    """
+    results = []
+    with rolled_back():
+        stores, products = create_fixture(stores=100, products=50)
+        start = timezone.now() - timedelta(days=7)
+        start_date = start.strftime('%Y-%m-%d')
+        end_date = timezone.now().strftime('%Y-%m-%d')
+        stocks = Stock.objects.select_related('product', 'store').filter(store__in=stores)
+
+        step = size // 4
+        for index in range(4):
+            create_movements(stores, products, step, seed=index)
+            while process_movement_batch(5000):
+                pass
+            movements = StockMovement.objects.filter(store__in=stores, timestamp__gte=start)
+            total = step * (index + 1)
+            try:
+                results.append(timed(f'or_of_q_{total}', total, lambda: list(
+                    _legacy_date_filter(stocks, movements)
+                )))
+            except Exception as e:
+                # e.g. SQLite refuses expression trees this deep
+                print(f"or_of_q_{total} failed: {str(e)}")
+            results.append(timed(f'movement_exists_{total}', total, lambda: list(
+                stocks.filter(_movement_exists_filter(start, timezone.now()))
+            )))
+            results.append(timed(f'snapshot_exists_{total}', total, lambda: list(
+                stocks.filter(snapshot_date_filter(start_date, end_date))
+            )))
+    return results
+
+
+@benchmark('serializers')
+def serializer_throughput(size=20000):
+    """
+    Compare DRF serializers with the flat values_list() serializers.
+
+    Both paths include the query. Raises if the two produce different rows.
+    """
+    results = []
+    with rolled_back():
+        stores, products = create_fixture(stores=max(size // 200, 1), products=200)
+        stocks = Stock.objects.select_related('product', 'store').filter(store__in=stores).order_by('id')
+        count = stocks.count()
+
+        drf_rows = []
+        flat_rows = []
+        results.append(timed('stock_drf', count, lambda: drf_rows.extend(
+            StockSerializer(stocks, many=True).data
+        )))
+        results.append(timed('stock_flat', count, lambda: flat_rows.extend(
+            StockFlatSerializer().serialize(stocks)
+        )))
+        if [dict(row) for row in drf_rows] != flat_rows:
+            raise RuntimeError("StockFlatSerializer output differs from StockSerializer")
+
+        AuditLog.objects.bulk_create([
+            AuditLog(action='stock_in', store=stores[i % len(stores)], product=products[i % len(products)],
+                     details={'quantity': i})
+            for i in range(size)
+        ])
+        logs = AuditLog.objects.select_related('user', 'store', 'product').filter(store__in=stores).order_by('id')
+
+        drf_rows = []
+        flat_rows = []
+        results.append(timed('audit_log_drf', size, lambda: drf_rows.extend(
+            AuditLogSerializer(logs, many=True).data
+        )))
+        results.append(timed('audit_log_flat', size, lambda: flat_rows.extend(
+            AuditLogFlatSerializer().serialize(logs)
+        )))
+        if [dict(row) for row in drf_rows] != flat_rows:
+            raise RuntimeError("AuditLogFlatSerializer output differs from AuditLogSerializer")
+    return results
+
+
+@benchmark('bulk_ingest')
+def bulk_ingest(size=10000):
+    """
+    Time the bulk movement endpoint for one request of size movements.
+
+    Drain scheduling is included; processing is not, unless Celery is
+    unavailable and the endpoint falls back to draining inline.
+    """
+    from rest_framework.test import APIClient
+
+    results = []
+    with rolled_back():
+        stores, products = create_fixture(stores=20, products=100)
+        user = User.objects.create(email='bench-ingest@example.com', first_name='Bench', last_name='Ingest')
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+
+        rng = random.Random(0)
+        lines = [
+            {
+                'product_id': rng.choice(products).id,
+                'store_id': rng.choice(stores).id,
+                'movement_type': rng.choice(('IN', 'OUT', 'REM')),
+                'quantity': rng.randint(1, 50),
+            }
+            for _ in range(size)
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines)
+
+        responses = []
+        results.append(timed('bulk_ndjson', size, lambda: responses.append(client.post(
+            '/api/stock-movements/bulk/', body, content_type='application/x-ndjson'
+        ))))
+        if responses[0].status_code != 201:
+            raise RuntimeError(f"Bulk ingest failed with status {responses[0].status_code}")
+    return results
+
+
+@benchmark('audit_sink')
+def audit_sink_throughput(size=5000):
+    """
+    Compare audit log durability modes for single-entry writes.
+
+    Each mode records size entries one at a time, the way the per-movement
+    path does. Entries are committed so on_commit hooks fire, and deleted
+    afterwards.
+    """
+    results = []
+    try:
+        for mode in ('sync', 'on_commit', 'buffered'):
+            sink = AuditSink(mode, buffer_size=500, flush_interval=60)
+
+            def run():
+                for i in range(size):
+                    sink.record([AuditLog(action='bench_audit', details={'sequence': i})])
+                sink.flush()
+
+            results.append(timed(f'audit_{mode}', size, run))
+            sink.flush()
+    finally:
+        AuditLog.objects.filter(action='bench_audit').delete()
+    return results
+
+
+@benchmark('connections')
+def connection_reuse(size=500):
+    """
+    Compare per-request latency with and without connection reuse.
+
+    Each request lists stores through StoreViewSet, wrapped in the
+    close_old_connections() calls Django's request handler makes, so a
+    connection is opened per request unless it is kept or pooled. With
+    DB_CONNECTION_MODE=pool only the configured pool is timed; run the
+    benchmark again in another mode to compare.
+    """
+    from django.conf import settings
+    from django.db import close_old_connections
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from .views import StoreViewSet
+
+    view = StoreViewSet.as_view({'get': 'list'})
+    factory = APIRequestFactory()
+    user = User(email='bench-connections@example.com', is_active=True)
+
+    def run():
+        for _ in range(size):
+            close_old_connections()
+            request = factory.get('/api/stores/')
+            force_authenticate(request, user)
+            view(request).render()
+            close_old_connections()
+
+    mode = getattr(settings, 'DB_CONNECTION_MODE', 'persistent')
+    if mode == 'pool':
+        connection.close()
+        return [timed('pooled', size, run)]
+
+    results = []
+    max_age = connection.settings_dict['CONN_MAX_AGE']
+    try:
+        for label, age in (('new_connection', 0), (f'{mode}_connection', max_age or 600)):
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = age
+            results.append(timed(label, size, run))
+    finally:
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.close()
+    return results
+
+
+async def _asgi_get(app, path, query, token):
+    """Send one GET request to an ASGI application in-process and return its status."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    request_sent = False
+    status = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; Django cancels this wait once it has responded
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+@benchmark('async_reads')
+def async_reads(size=2000, threads=8, concurrency=(8, 64)):
+    """
+    Compare the requests one web worker serves at once under WSGI and ASGI.
+
+    A WSGI worker (wsgi.py, e.g. gunicorn --threads) serves one request per
+    thread: size requests are sent from threads threads through Django's
+    request handler to stock_api and logs_api. An ASGI worker (asgi.py under
+    uvicorn) serves every request on one event loop: the same requests are
+    sent to the async variants through Django's ASGI handler, with each
+    concurrency level in flight. The stock requests are cache hits, the log
+    pages run a query.
+
+    The fixture and a token user are committed so request threads can see
+    them, and deleted afterwards. Raises if a request fails.
+    """
+    from django.core.asgi import get_asgi_application
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    rng = random.Random(0)
+    stores, products = create_fixture(stores=1, products=200, seed=rng.randint(0, 10 ** 6))
+    store = stores[0]
+    user = User.objects.create(email='bench-async@example.com', first_name='Bench', last_name='Async')
+    token = Token.objects.create(user=user).key
+    AuditLog.objects.bulk_create([
+        AuditLog(action='stock_in', store=store, product=products[i % len(products)], details={'quantity': i})
+        for i in range(1000)
+    ])
+    scenarios = (
+        ('stock_cached', '/api/stock/', '/api/async/stock/', f'store={store.id}'),
+        ('logs_page', '/api/logs/', '/api/async/logs/', f'store={store.id}&page_size=50'),
+    )
+    app = get_asgi_application()
+
+    def run_wsgi(path):
+        def work(count):
+            client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token}')
+            try:
+                return [client.get(path).status_code for _ in range(count)]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            counts = [size // threads + (i < size % threads) for i in range(threads)]
+            statuses = [status for chunk in pool.map(work, counts) for status in chunk]
+        if set(statuses) != {200}:
+            raise RuntimeError(f"{path} answered {sorted(set(statuses))}")
+
+    def run_asgi(path, query, level):
+        async def run():
+            semaphore = asyncio.Semaphore(level)
+
+            async def one():
+                async with semaphore:
+                    return await _asgi_get(app, path, query, token)
+
+            return await asyncio.gather(*(one() for _ in range(size)))
+
+        statuses = asyncio.run(run())
+        if set(statuses) != {200}:
+            raise RuntimeError(f"{path} answered {sorted(set(statuses))}")
+
+    results = []
+    try:
+        for name, sync_path, async_path, query in scenarios:
+            # Fill the stock cache before timing
+            run_asgi(async_path, query, 1)
+            results.append(timed(f'wsgi_{threads}_{name}', size, lambda: run_wsgi(f'{sync_path}?{query}')))
+            for level in concurrency:
+                results.append(timed(f'asgi_{level}_{name}', size, lambda: run_asgi(async_path, query, level)))
+    finally:
+        AuditLog.objects.filter(store=store).delete()
+        store.delete()
+        Product.objects.filter(id__in=[product.id for product in products]).delete()
+        user.delete()
+    return results
+
+
+@benchmark('stream_ingest')
+def stream_ingest(size=2000):
+    """
+    Compare single-movement POSTs in the database and stream ingest modes,
+    and time storing the appended entries the way the stream consumer does.
+
+    The database mode includes queueing the drain, or processing the movement
+    inline when Celery is unavailable; the stream mode only appends to the
+    stream. Needs the Redis cache; the entries go to a separate stream that
+    is deleted afterwards.
+    """
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    from . import movement_stream
+
+    results = []
+    stream = f"{movement_stream.stream_name()}_bench"
+    with rolled_back(), override_settings(STOCK_MOVEMENT_STREAM=stream):
+        conn = movement_stream.get_connection()
+        stores, products = create_fixture(stores=20, products=100)
+        user = User.objects.create(email='bench-stream@example.com', first_name='Bench', last_name='Stream')
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+
+        rng = random.Random(0)
+        bodies = [
+            {
+                'product_id': rng.choice(products).id,
+                'store_id': rng.choice(stores).id,
+                'movement_type': rng.choice(('IN', 'OUT', 'REM')),
+                'quantity': rng.randint(1, 50),
+            }
+            for _ in range(size)
+        ]
+
+        try:
+            for mode, expected_status in (('database', 201), ('stream', 202)):
+                responses = []
+                with override_settings(STOCK_MOVEMENT_INGEST=mode):
+                    results.append(timed(f'post_{mode}', size, lambda: responses.extend(
+                        client.post('/api/stock-movements/', body, format='json') for body in bodies
+                    )))
+                failed = [response.status_code for response in responses if response.status_code != expected_status]
+                if failed:
+                    raise RuntimeError(f"{len(failed)} {mode} POSTs failed, e.g. with status {failed[0]}")
+
+            entries = conn.xrange(stream, '-', '+')
+            stored = []
+            results.append(timed('stream_store', len(entries), lambda: stored.append(
+                movement_stream.store_entries(entries)
+            )))
+            if stored[0] != (size, 0):
+                raise RuntimeError(f"Stored {stored[0][0]} of {size} stream entries")
+        finally:
+            conn.delete(stream)
+    return results
@@ -0,0 +1,138 @@
+"""
+Bulk loading and unloading with PostgreSQL COPY.
+
+copy_rows() and copy_into() stream rows into a table with ``COPY ... FROM
+STDIN`` in CSV format, which loads millions of rows several times faster
+than INSERTs. Model save(), signals and field defaults (including
+auto_now_add) are bypassed, so every column without a database default must
+be given. Other backends fall back to batched INSERTs with the same
+semantics.
+
+copy_out() streams the result of a query as CSV with ``COPY ... TO STDOUT``
+(PostgreSQL only).
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+COPY_BATCH_SIZE = 50000  # rows buffered per COPY statement
+COPY_OUT_CHUNK_SIZE = 64 * 1024  # bytes per chunk yielded by copy_out
+COPY_OUT_MEMORY_SIZE = 8 * 1024 * 1024  # bytes of a psycopg2 export kept in memory before spilling to disk
+NULL = '\\N'
+
+
+def _csv_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _insert_value(value):
+    if isinstance(value, datetime):
+        return connection.ops.adapt_datetimefield_value(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def copy_into(table, columns, rows, batch_size=COPY_BATCH_SIZE):
+    """
+    Load rows into a table by name, e.g. a temporary staging table.
+
+    Args:
+        table: Table name
+        columns: Column names in row order
+        rows: Iterable of tuples; consumed lazily, batch_size rows at a time
+
+    Returns the number of rows loaded.
+    """
+    rows = iter(rows)
+    loaded = 0
+    quote = connection.ops.quote_name
+    column_list = ', '.join(quote(column) for column in columns)
+
+    if connection.vendor != 'postgresql':
+        sql = f"INSERT INTO {quote(table)} ({column_list}) VALUES ({', '.join(['%s'] * len(columns))})"
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    return loaded
+                cursor.executemany(sql, [[_insert_value(value) for value in row] for row in batch])
+                loaded += len(batch)
+
+    sql = f"COPY {quote(table)} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return loaded
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([_csv_value(value) for value in row])
+            buffer.seek(0)
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, buffer)
+            else:
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            loaded += len(batch)
+
+
+def copy_rows(model, fields, rows, batch_size=COPY_BATCH_SIZE):
+    """
+    Load rows into the table of model.
+
+    Args:
+        model: The model whose table receives the rows
+        fields: Field names or attnames (e.g. 'store_id') in row order
+        rows: Iterable of tuples; consumed lazily, batch_size rows at a time
+
+    Returns the number of rows loaded.
+    """
+    model_fields = [model._meta.get_field(field) for field in fields]
+    if connection.vendor != 'postgresql':
+        rows = (
+            [field.get_db_prep_save(value, connection) for field, value in zip(model_fields, row)]
+            for row in rows
+        )
+    return copy_into(model._meta.db_table, [field.column for field in model_fields], rows, batch_size)
+
+
+def copy_out(sql, params=(), using=DEFAULT_DB_ALIAS):
+    """
+    Yield the rows of a query as CSV in byte chunks, after a header line
+    with the column names of the query.
+
+    psycopg 3 streams straight from the server; psycopg2 can only copy into a
+    file, so the export is spooled to a temporary file first (kept in memory
+    up to COPY_OUT_MEMORY_SIZE bytes).
+    """
+    with connections[using].cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            query = raw.mogrify(sql, params).decode()
+            with tempfile.SpooledTemporaryFile(max_size=COPY_OUT_MEMORY_SIZE) as spool:
+                raw.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", spool)
+                spool.seek(0)
+                while True:
+                    chunk = spool.read(COPY_OUT_CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+        else:
+            with raw.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", params) as copy:
+                for chunk in copy:
+                    yield bytes(chunk)
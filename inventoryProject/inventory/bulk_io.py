@@ -0,0 +1,482 @@
+"""
+Bulk CSV and NDJSON import and export of stock levels and movements.
+
+Imports read the file IMPORT_CHUNK_SIZE lines at a time. Each line is
+checked in Python (required fields and types) and the valid ones are loaded
+into a temporary staging table with COPY (see bulk_copy). Product SKUs,
+foreign keys and duplicate lines are then checked in SQL against the staging
+table, and the remaining rows are written with one INSERT ... SELECT:
+
+- Stock rows are upserted with ON CONFLICT (store_id, product_id) DO UPDATE:
+  existing rows get the imported quantity and missing ones are created. No
+  movement is recorded for the change; the stock cache and the store
+  summaries are refreshed.
+- Movements are appended. By default they are imported as already processed
+  history and the daily snapshots of their stores are rebuilt from them, so
+  import the current Stock levels first. With process=True they are left
+  pending for the movement processor instead.
+
+Errors are reported per line, with the line numbers of the file, in the same
+{field: [message]} shape as the bulk movement endpoint. Valid lines are
+imported even when others fail; dry_run rolls everything back and only
+reports.
+
+Exports stream CSV through COPY ... TO STDOUT on PostgreSQL, or NDJSON from
+a server-side cursor, with the columns the imports accept.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import connection, connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import partitions, stock_cache, stock_events, versions
+from .audit import audit_sink
+from .bulk_copy import copy_into, copy_out
+from .ingest import MAX_INTEGER, MOVEMENT_TYPES, integral, positive_int
+from .models import AuditLog, Product, Stock, StockMovement, Store, Supplier
+from .snapshots import parse_day, rebuild_snapshots
+from .summaries import rebuild_store_summaries
+from .tasks import process_pending_movements, schedule_movement_drain
+
+IMPORT_CHUNK_SIZE = 50000  # lines validated and staged at a time
+IMPORT_MAX_REPORTED_ERRORS = 1000
+EXPORT_CHUNK_SIZE = 2000  # rows per NDJSON chunk
+MAX_QUANTITY = MAX_INTEGER  # PositiveIntegerField
+
+STOCK_EXPORT_COLUMNS = ('store_id', 'product_id', 'sku', 'quantity')
+MOVEMENT_EXPORT_COLUMNS = ('id', 'store_id', 'product_id', 'supplier_id', 'movement_type', 'quantity',
+                           'timestamp', 'processed')
+
+STOCK_STAGING = 'stock_import_staging'
+STOCK_STAGING_COLUMNS = (('line', 'IntegerField'), ('store_id', 'BigIntegerField'),
+                         ('product_id', 'BigIntegerField'), ('sku', 'TextField'), ('quantity', 'BigIntegerField'))
+MOVEMENT_STAGING = 'movement_import_staging'
+MOVEMENT_STAGING_COLUMNS = (('line', 'IntegerField'), ('store_id', 'BigIntegerField'),
+                            ('product_id', 'BigIntegerField'), ('sku', 'TextField'),
+                            ('supplier_id', 'BigIntegerField'), ('movement_type', 'TextField'),
+                            ('quantity', 'BigIntegerField'), ('timestamp', 'DateTimeField'))
+
+
+def file_format(name):
+    """Return 'ndjson' for NDJSON/JSON Lines file names or content types, else 'csv'."""
+    name = (name or '').lower()
+    return 'ndjson' if 'ndjson' in name or 'jsonl' in name or name.endswith('json') else 'csv'
+
+
+def decode_lines(byte_lines):
+    """Decode an iterable of byte lines as UTF-8, dropping a leading byte order mark."""
+    for number, line in enumerate(byte_lines):
+        text = line.decode('utf-8', errors='replace')
+        yield text.lstrip('﻿') if number == 0 else text
+
+
+def read_records(lines, fmt):
+    """
+    Yield (line number, record) for the records of a CSV (with a header
+    line) or NDJSON file. record is None for an NDJSON line that is not a
+    JSON object.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for number, raw in enumerate(lines, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+class ImportErrors:
+    """Per-line errors, keeping the first IMPORT_MAX_REPORTED_ERRORS and a total count."""
+
+    def __init__(self, limit=IMPORT_MAX_REPORTED_ERRORS):
+        self.limit = limit
+        self.count = 0
+        self.lines = {}
+
+    def add(self, number, errors):
+        self.count += 1
+        if len(self.lines) < self.limit:
+            self.lines[number] = errors
+
+    def report(self):
+        return [{'line': number, 'errors': errors} for number, errors in sorted(self.lines.items())]
+
+
+def _field(record, name):
+    value = record.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value in (None, '') else value
+
+
+def _quantity(value, minimum):
+    value = integral(value)
+    return value if value is not None and minimum <= value <= MAX_QUANTITY else None
+
+
+def _clean_product(record, errors):
+    product_id, sku = _field(record, 'product_id'), _field(record, 'sku')
+    if product_id is not None:
+        product_id = positive_int(product_id)
+        if product_id is None:
+            errors['product_id'] = ['Must be a valid product id.']
+        return product_id, None
+    if sku is None:
+        errors['product_id'] = ['A product id or sku is required.']
+    return None, sku and str(sku)
+
+
+def clean_stock_record(record):
+    """Return ((store_id, product_id, sku, quantity), errors) for a stock record."""
+    errors = {}
+    store_id = positive_int(_field(record, 'store_id'))
+    if store_id is None:
+        errors['store_id'] = ['A valid store id is required.']
+    product_id, sku = _clean_product(record, errors)
+    quantity = _quantity(_field(record, 'quantity'), 0)
+    if quantity is None:
+        errors['quantity'] = ['A quantity of zero or more is required.']
+    return (store_id, product_id, sku, quantity), errors
+
+
+def clean_movement_record(record, default_timestamp):
+    """
+    Return ((store_id, product_id, sku, supplier_id, movement_type, quantity,
+    timestamp), errors) for a movement record. Records without a timestamp
+    get default_timestamp; naive timestamps are in the current time zone.
+    """
+    errors = {}
+    store_id = positive_int(_field(record, 'store_id'))
+    if store_id is None:
+        errors['store_id'] = ['A valid store id is required.']
+    product_id, sku = _clean_product(record, errors)
+    supplier_id = _field(record, 'supplier_id')
+    if supplier_id is not None:
+        supplier_id = positive_int(supplier_id)
+        if supplier_id is None:
+            errors['supplier_id'] = ['Must be a valid supplier id.']
+    movement_type = _field(record, 'movement_type')
+    if movement_type not in MOVEMENT_TYPES:
+        errors['movement_type'] = [f'Must be one of: {", ".join(sorted(MOVEMENT_TYPES))}.']
+    quantity = _quantity(_field(record, 'quantity'), 1)
+    if quantity is None:
+        errors['quantity'] = ['A positive quantity is required.']
+
+    timestamp = _field(record, 'timestamp')
+    if timestamp is None:
+        timestamp = default_timestamp
+    else:
+        try:
+            timestamp = parse_datetime(str(timestamp))
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            errors['timestamp'] = ['Must be an ISO 8601 date and time.']
+        elif timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+    return (store_id, product_id, sku, supplier_id, movement_type, quantity, timestamp), errors
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _stage(cursor, table, columns, records, clean, errors, progress):
+    """Create the staging table and load the valid records into it. Returns the number of lines read."""
+    cursor.execute(f'DROP TABLE IF EXISTS {_q(table)}')
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {_q(table)} "
+        f"({', '.join(f'{_q(name)} {connection.data_types[field_type]}' for name, field_type in columns)})"
+    )
+
+    lines = 0
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        rows = []
+        for number, record in chunk:
+            if record is None:
+                errors.add(number, {'non_field_errors': ['Expected a JSON object.']})
+                continue
+            values, line_errors = clean(record)
+            if line_errors:
+                errors.add(number, line_errors)
+            else:
+                rows.append((number, *values))
+        copy_into(table, [name for name, _ in columns], rows)
+        lines += len(chunk)
+        progress(f"Staged {lines} lines")
+
+    cursor.execute(f'CREATE INDEX ON {_q(table)} (store_id, product_id)' if connection.vendor == 'postgresql'
+                   else f'CREATE INDEX {_q(table + "_pair")} ON {_q(table)} (store_id, product_id)')
+    return lines
+
+
+def _reject(cursor, table, condition, message, errors, params=()):
+    """Report the staged lines matching condition with message(row) and drop them."""
+    cursor.execute(f'SELECT * FROM {_q(table)} WHERE {condition}', params)
+    columns = [column[0] for column in cursor.description]
+    for row in cursor.fetchall():
+        row = dict(zip(columns, row))
+        errors.add(row['line'], message(row))
+    cursor.execute(f'DELETE FROM {_q(table)} WHERE {condition}', params)
+
+
+def _check_references(cursor, table, errors, suppliers=False):
+    """Resolve SKUs and drop staged lines whose store, product or supplier does not exist."""
+    staging = _q(table)
+    cursor.execute(
+        f'UPDATE {staging} SET product_id = (SELECT id FROM {_q(Product._meta.db_table)} product '
+        f'WHERE product.sku = {staging}.sku) WHERE product_id IS NULL'
+    )
+    _reject(cursor, table, 'product_id IS NULL',
+            lambda row: {'sku': [f'Unknown sku "{row["sku"]}".']}, errors)
+
+    references = [('store_id', Store), ('product_id', Product)]
+    if suppliers:
+        references.append(('supplier_id', Supplier))
+    for column, model in references:
+        _reject(
+            cursor, table,
+            f'{_q(column)} IS NOT NULL AND NOT EXISTS '
+            f'(SELECT 1 FROM {_q(model._meta.db_table)} ref WHERE ref.id = {staging}.{_q(column)})',
+            lambda row, column=column: {column: [f'Invalid pk "{row[column]}" - object does not exist.']},
+            errors
+        )
+
+
+def _invalidate_stock_cache(pairs):
+    pairs = list(pairs)
+    for start in range(0, len(pairs), 10000):
+        stock_cache.invalidate_stock_entries(pairs[start:start + 10000])
+    stock_cache.invalidate_store_sheets({store_id for store_id, _ in pairs})
+
+
+def _result(lines, errors, dry_run, **counts):
+    return {
+        'lines': lines,
+        **counts,
+        'failed': errors.count,
+        'errors': errors.report(),
+        'errors_truncated': errors.count > len(errors.lines),
+        'dry_run': dry_run,
+    }
+
+
+def import_stock(lines, fmt='csv', dry_run=False, user=None, progress=lambda message: None):
+    """
+    Upsert Stock rows from a CSV or NDJSON file.
+
+    Records have store_id, product_id (or sku) and quantity.
+
+    Args:
+        lines: Iterable of text lines
+        fmt: 'csv' or 'ndjson'
+        dry_run: Validate and count, then roll back
+        user: The user recorded in the audit log
+        progress: Callable receiving progress messages
+
+    Returns a dict with the number of lines, created, updated and failed rows
+    and the per-line errors.
+    """
+    errors = ImportErrors()
+    staging = _q(STOCK_STAGING)
+    stock_table = _q(Stock._meta.db_table)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            lines_read = _stage(cursor, STOCK_STAGING, STOCK_STAGING_COLUMNS, read_records(lines, fmt),
+                                clean_stock_record, errors, progress)
+            _check_references(cursor, STOCK_STAGING, errors)
+            # The same pair twice: the last line wins
+            _reject(cursor, STOCK_STAGING,
+                    f'EXISTS (SELECT 1 FROM {staging} later WHERE later.store_id = {staging}.store_id '
+                    f'AND later.product_id = {staging}.product_id AND later.line > {staging}.line)',
+                    lambda row: {'non_field_errors': ['Superseded by a later line for the same store and product.']},
+                    errors)
+
+            cursor.execute(f'SELECT store_id, product_id FROM {staging}')
+            pairs = cursor.fetchall()
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {staging} WHERE EXISTS (SELECT 1 FROM {stock_table} stock '
+                f'WHERE stock.store_id = {staging}.store_id AND stock.product_id = {staging}.product_id)'
+            )
+            updated = cursor.fetchone()[0]
+            cursor.execute(
+                f'INSERT INTO {stock_table} (store_id, product_id, quantity) '
+                f'SELECT store_id, product_id, quantity FROM {staging} WHERE true '
+                f'ON CONFLICT (store_id, product_id) DO UPDATE SET quantity = excluded.quantity'
+            )
+            cursor.execute(f'DROP TABLE {staging}')
+        progress(f"Upserted {len(pairs)} stock rows")
+
+        result = _result(lines_read, errors, dry_run, created=len(pairs) - updated, updated=updated)
+        if dry_run:
+            transaction.set_rollback(True)
+            return result
+
+        store_ids = sorted({store_id for store_id, _ in pairs})
+        rebuild_store_summaries(store_ids)
+        audit_sink.record([AuditLog(
+            action='stock_import',
+            user_id=getattr(user, 'id', None),
+            details={key: result[key] for key in ('lines', 'created', 'updated', 'failed')},
+        )])
+        transaction.on_commit(lambda: _invalidate_stock_cache(pairs))
+        versions.bump_stores(store_ids)
+        stock_events.publish_resync_on_commit(store_ids)
+    return result
+
+
+def import_movements(lines, fmt='csv', process=False, dry_run=False, user=None, progress=lambda message: None):
+    """
+    Append StockMovements from a CSV or NDJSON file.
+
+    Records have store_id, product_id (or sku), movement_type, quantity and
+    optionally supplier_id and timestamp (default: the time of the import).
+
+    Args:
+        lines: Iterable of text lines
+        fmt: 'csv' or 'ndjson'
+        process: Leave the movements pending for the movement processor
+            instead of importing them as processed history
+        dry_run: Validate and count, then roll back
+        user: Recorded as the creator of the movements and in the audit log
+        progress: Callable receiving progress messages
+
+    Returns a dict with the number of lines, created and failed movements and
+    the per-line errors.
+    """
+    errors = ImportErrors()
+    staging = _q(MOVEMENT_STAGING)
+    now = timezone.now()
+    user_id = getattr(user, 'id', None)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            lines_read = _stage(cursor, MOVEMENT_STAGING, MOVEMENT_STAGING_COLUMNS, read_records(lines, fmt),
+                                lambda record: clean_movement_record(record, now), errors, progress)
+            _check_references(cursor, MOVEMENT_STAGING, errors, suppliers=True)
+
+            cursor.execute(f'SELECT MIN("timestamp"), MAX("timestamp"), COUNT(*) FROM {staging}')
+            first, last, count = cursor.fetchone()
+            if count:
+                # SQLite returns the bounds as text
+                partitions.ensure_partition_range(*(
+                    parse_datetime(value) if isinstance(value, str) else value for value in (first, last)
+                ))
+            cursor.execute(
+                f'INSERT INTO {_q(StockMovement._meta.db_table)} '
+                f'(store_id, product_id, supplier_id, created_by_id, movement_type, quantity, "timestamp", processed) '
+                f'SELECT store_id, product_id, supplier_id, %s, movement_type, quantity, "timestamp", %s '
+                f'FROM {staging} ORDER BY line',
+                [user_id, not process]
+            )
+            cursor.execute(f'SELECT DISTINCT store_id FROM {staging}')
+            store_ids = [store_id for (store_id,) in cursor.fetchall()]
+            cursor.execute(f'DROP TABLE {staging}')
+        progress(f"Inserted {count} movements")
+
+        result = _result(lines_read, errors, dry_run, created=count)
+        if dry_run:
+            transaction.set_rollback(True)
+            return result
+
+        audit_sink.record([AuditLog(
+            action='movement_import',
+            user_id=user_id,
+            details={**{key: result[key] for key in ('lines', 'created', 'failed')}, 'processed': not process},
+        )])
+        if count and process:
+            transaction.on_commit(_schedule_processing)
+
+    if count and not process:
+        progress(f"Rebuilding the daily snapshots of {len(store_ids)} stores")
+        rebuild_snapshots(store_ids)
+    return result
+
+
+def _schedule_processing():
+    try:
+        schedule_movement_drain()
+    except Exception as e:
+        print(f"Celery task failed: {str(e)}")
+        print("Processing stock movements directly...")
+        process_pending_movements()
+
+
+def _export(queryset, columns, fmt):
+    """Yield the rows of a values_list queryset as CSV or NDJSON byte chunks."""
+    db = router.db_for_read(queryset.model)
+    queryset = queryset.using(db)
+
+    if fmt == 'ndjson':
+        rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        while True:
+            chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+            if not chunk:
+                return
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in chunk).encode()
+
+    if connections[db].vendor == 'postgresql':
+        sql, params = queryset.query.get_compiler(db).as_sql()
+        yield from copy_out(sql, params, using=db)
+        return
+
+    yield (','.join(columns) + '\r\n').encode()
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        buffer = _Buffer()
+        csv.writer(buffer).writerows(chunk)
+        yield buffer.getvalue().encode()
+
+
+class _Buffer(list):
+    def write(self, text):
+        self.append(text)
+
+    def getvalue(self):
+        return ''.join(self)
+
+
+def export_stock(fmt='csv', store_ids=None):
+    """Yield the Stock rows, optionally of some stores, as CSV or NDJSON byte chunks."""
+    stocks = Stock.objects.order_by('store_id', 'product_id')
+    if store_ids:
+        stocks = stocks.filter(store_id__in=store_ids)
+    return _export(stocks.values_list('store_id', 'product_id', 'product__sku', 'quantity'),
+                   STOCK_EXPORT_COLUMNS, fmt)
+
+
+def export_movements(fmt='csv', store_ids=None, start_date=None, end_date=None):
+    """
+    Yield StockMovements as CSV or NDJSON byte chunks in id order.
+
+    Args:
+        store_ids: Optional list of store ids
+        start_date, end_date: Optional 'YYYY-MM-DD' bounds on the local day, both inclusive
+    """
+    movements = StockMovement.objects.order_by('id')
+    if store_ids:
+        movements = movements.filter(store_id__in=store_ids)
+    start, end = parse_day(start_date), parse_day(end_date)
+    if start:
+        movements = movements.filter(timestamp__date__gte=start)
+    if end:
+        movements = movements.filter(timestamp__date__lte=end)
+    return _export(movements.values_list(*MOVEMENT_EXPORT_COLUMNS), MOVEMENT_EXPORT_COLUMNS, fmt)
@@ -0,0 +1,207 @@
+"""
+Synthetic dataset generator for load tests.
+
+generate_dataset() builds a realistic dataset at any scale: stores of varying
+size, each carrying an assortment of products with a few best sellers and a
+long tail, and a history of processed movements whose Stock quantities,
+daily snapshots and audit logs agree with each other, as if every movement
+had gone through the movement processor. The same arguments always produce
+the same rows.
+
+Rows are loaded store by store with COPY on PostgreSQL (see bulk_copy), so
+memory use is bounded by the largest store rather than the whole dataset.
+Movement and audit log ids are assigned by the generator, so run it against
+a database nobody else is writing to.
+"""
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import partitions, versions
+from .bulk_copy import copy_rows
+from .models import AuditLog, DailyStockSnapshot, Product, Stock, StockMovement, Store, Supplier
+from .snapshots import daily_totals
+from .summaries import rebuild_store_summaries
+from .tasks import apply_movement
+
+CITIES = ('Karachi', 'Lahore', 'Islamabad', 'Rawalpindi', 'Faisalabad',
+          'Multan', 'Peshawar', 'Quetta', 'Sialkot', 'Hyderabad')
+CATEGORIES = ('Rice', 'Flour', 'Cooking Oil', 'Tea', 'Sugar', 'Lentils', 'Spices', 'Soap',
+              'Shampoo', 'Detergent', 'Biscuits', 'Juice', 'Milk', 'Snacks', 'Soft Drink')
+SIZES = ('250g', '500g', '1kg', '5kg', '250ml', '1L', 'Pack of 6', 'Family Pack')
+
+MOVEMENT_TYPES = ('OUT', 'IN', 'REM')
+MOVEMENT_WEIGHTS = (70, 22, 8)
+# Sales by hour of day: quiet nights, a midday and an evening peak
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 4, 6, 8, 10, 12, 14, 14, 12, 10, 10, 11, 13, 15, 15, 12, 8, 4, 2)
+SALE_SIZES = (1, 2, 3, 4, 5, 10)
+SALE_SIZE_WEIGHTS = (40, 25, 15, 8, 7, 5)
+POPULARITY_EXPONENT = 1.1  # Zipf exponent of product sales within a store
+
+MOVEMENT_FIELDS = ('id', 'product_id', 'store_id', 'supplier_id', 'created_by_id',
+                   'movement_type', 'quantity', 'timestamp', 'processed')
+AUDIT_LOG_FIELDS = ('id', 'action', 'timestamp', 'user_id', 'store_id', 'product_id', 'details')
+SNAPSHOT_FIELDS = ('store_id', 'product_id', 'day', 'opening_quantity', 'in_quantity', 'out_quantity',
+                   'rem_quantity', 'closing_quantity', 'movement_count')
+
+
+def sku_prefix(seed):
+    return f"GEN{seed}-"
+
+
+def movement_amount(rng, movement_type):
+    """Return a movement quantity; deliveries roughly balance sales over time."""
+    if movement_type == 'OUT':
+        return rng.choices(SALE_SIZES, SALE_SIZE_WEIGHTS)[0]
+    if movement_type == 'IN':
+        return rng.randint(4, 16)
+    return rng.randint(1, 6)
+
+
+def generate_dataset(stores=1000, products=50000, movements=10000000, suppliers=200,
+                     assortment=2000, days=365, pending=0, audit_logs=True, seed=0,
+                     end_date=None, log=print):
+    """
+    Generate and load a synthetic dataset.
+
+    Args:
+        stores: Number of stores; their sizes follow a log-normal distribution
+        products: Number of products in the catalogue
+        movements: Number of processed movements over all stores
+        suppliers: Number of suppliers; each product has one
+        assortment: Products carried by each store, half of them best sellers
+        days: Days of history ending with end_date
+        pending: Extra unprocessed movements at the end, for the movement pipeline
+        audit_logs: Also write the audit log entry of every processed movement
+        seed: Random seed; also part of the SKUs, so each seed loads once
+        end_date: Last day of history (default: today); pin it for identical timestamps
+        log: Callable receiving progress messages
+
+    Returns a dict with the number of rows written per table and the time taken.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    if Product.objects.filter(sku__startswith=sku_prefix(seed)).exists():
+        raise ValueError(f"A dataset with seed {seed} was already generated")
+
+    end_date = end_date or timezone.localdate()
+    first_day = end_date - timedelta(days=days - 1)
+    start = timezone.make_aware(datetime.combine(first_day, dt_time.min))
+    partitions.ensure_partition_range(first_day, end_date)
+
+    supplier_objs = Supplier.objects.bulk_create([
+        Supplier(name=f"Supplier {i + 1:04d}", contact_info=f"supplier{i + 1}@example.com")
+        for i in range(suppliers)
+    ], batch_size=5000)
+    store_objs = Store.objects.bulk_create([
+        Store(name=f"{rng.choice(CITIES)} Store {i + 1:04d}", location=f"{rng.choice(CITIES)}, Block {i % 50 + 1}",
+              low_stock_threshold=rng.choice((10, 20, 30)))
+        for i in range(stores)
+    ], batch_size=5000)
+    product_objs = Product.objects.bulk_create([
+        Product(name=f"{rng.choice(CATEGORIES)} {rng.choice(SIZES)} #{i + 1}", sku=f"{sku_prefix(seed)}{i:06d}")
+        for i in range(products)
+    ], batch_size=5000)
+    log(f"Created {stores} stores, {products} products and {suppliers} suppliers")
+
+    # Popularity does not follow SKU order
+    ranked = [product.id for product in product_objs]
+    rng.shuffle(ranked)
+    supplier_of = {product.id: rng.choice(supplier_objs).id if supplier_objs else None for product in product_objs}
+
+    sizes = [rng.lognormvariate(0, 0.5) for _ in store_objs]
+    total_size = sum(sizes)
+    counts = [int(movements * size / total_size) for size in sizes]
+    if counts:
+        counts[-1] += movements - sum(counts)
+
+    carried = min(assortment, products)
+    weights = [1 / (position + 1) ** POPULARITY_EXPONENT for position in range(carried)]
+    next_movement_id = (StockMovement.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    next_log_id = (AuditLog.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    written = {'stock': 0, 'movements': 0, 'snapshots': 0, 'audit_logs': 0}
+    assortments = {}
+
+    for index, (store, count) in enumerate(zip(store_objs, counts)):
+        core = carried // 2
+        store_products = ranked[:core] + rng.sample(ranked[core:], carried - core)
+        assortments[store.id] = store_products
+        quantities = {product_id: rng.randint(0, 200) for product_id in store_products}
+
+        timestamps = sorted(
+            start + timedelta(days=rng.randrange(days), hours=hour, seconds=rng.randrange(3600))
+            for hour in rng.choices(range(24), HOUR_WEIGHTS, k=count)
+        )
+        chosen = rng.choices(store_products, weights, k=count)
+        types = rng.choices(MOVEMENT_TYPES, MOVEMENT_WEIGHTS, k=count)
+
+        movement_rows, log_rows, changes = [], [], []
+        for timestamp, product_id, movement_type in zip(timestamps, chosen, types):
+            amount = movement_amount(rng, movement_type)
+            before = quantities[product_id]
+            after = quantities[product_id] = apply_movement(before, movement_type, amount)
+            supplier_id = supplier_of[product_id] if movement_type == 'IN' else None
+            movement_rows.append((next_movement_id, product_id, store.id, supplier_id, None,
+                                  movement_type, amount, timestamp, True))
+            changes.append((store.id, product_id, timestamp, movement_type, amount, before, after))
+            if audit_logs:
+                log_rows.append((next_log_id, f'stock_{movement_type.lower()}', timestamp, None, store.id, product_id,
+                                 {'movement_id': next_movement_id, 'quantity': amount,
+                                  'timestamp': timestamp.isoformat()}))
+                next_log_id += 1
+            next_movement_id += 1
+
+        with transaction.atomic():
+            written['stock'] += copy_rows(Stock, ('store_id', 'product_id', 'quantity'),
+                                          ((store.id, product_id, quantity) for product_id, quantity in quantities.items()))
+            written['movements'] += copy_rows(StockMovement, MOVEMENT_FIELDS, movement_rows)
+            written['audit_logs'] += copy_rows(AuditLog, AUDIT_LOG_FIELDS, log_rows)
+            written['snapshots'] += copy_rows(DailyStockSnapshot, SNAPSHOT_FIELDS, (
+                (store_id, product_id, day, totals['opening_quantity'], totals['in_quantity'],
+                 totals['out_quantity'], totals['rem_quantity'], totals['closing_quantity'], totals['movement_count'])
+                for (store_id, product_id, day), totals in daily_totals(changes).items()
+            ))
+
+        if (index + 1) % max(stores // 10, 1) == 0:
+            log(f"Loaded {index + 1}/{stores} stores, {written['movements']} movements")
+
+    pending_rows = []
+    end = timezone.make_aware(datetime.combine(end_date, dt_time.max))
+    for _ in range(pending if store_objs else 0):
+        store_id = rng.choice(store_objs).id
+        product_id = rng.choices(assortments[store_id], weights)[0]
+        movement_type = rng.choices(MOVEMENT_TYPES, MOVEMENT_WEIGHTS)[0]
+        pending_rows.append((next_movement_id, product_id, store_id,
+                             supplier_of[product_id] if movement_type == 'IN' else None, None,
+                             movement_type, movement_amount(rng, movement_type),
+                             end - timedelta(seconds=rng.randrange(3600)), False))
+        next_movement_id += 1
+    with transaction.atomic():
+        written['pending'] = copy_rows(StockMovement, MOVEMENT_FIELDS, pending_rows)
+
+    with connection.cursor() as cursor:
+        # Ids were assigned here, so move the sequences past them
+        for sql in connection.ops.sequence_reset_sql(no_style(), [StockMovement, AuditLog]):
+            cursor.execute(sql)
+        if connection.vendor == 'postgresql':
+            for model in (Stock, StockMovement, AuditLog, DailyStockSnapshot):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    rebuild_store_summaries([store.id for store in store_objs])
+    versions.bump_stores([store.id for store in store_objs])
+    versions.bump_catalog()
+
+    return {
+        'seed': seed,
+        'end_date': end_date.isoformat(),
+        'stores': len(store_objs),
+        'products': len(product_objs),
+        'suppliers': len(supplier_objs),
+        **written,
+        'seconds': round(time.perf_counter() - started, 1),
+    }
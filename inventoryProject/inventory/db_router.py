@@ -0,0 +1,117 @@
+"""
+Read replica routing.
+
+Reads go to a replica only inside ``replica_reads()``, which
+ReplicaRoutingMiddleware enters for GET/HEAD/OPTIONS requests; everything
+else (writes, Celery tasks, management commands) uses ``default``. After a
+client sends a write, its reads stay on the primary for
+REPLICA_STICKY_SECONDS so it sees its own changes despite replication lag.
+Clients are told apart by session user or Authorization header.
+
+Configure replicas as extra DATABASES aliases listed in DATABASE_REPLICAS.
+Locally, a second PostgreSQL database or a copy of a SQLite file works.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import async_cache
+
+DATABASE_REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+# Apps whose rows must be visible right after they are written, e.g. a token
+# used by the very next request after login
+PRIMARY_ONLY_APPS = {'authtoken', 'sessions'}
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads inside the block to a replica (or to the primary if not enabled)."""
+    previous = _use_replica.get()
+    _use_replica.set(enabled and bool(DATABASE_REPLICAS))
+    try:
+        yield
+    finally:
+        _use_replica.set(previous)
+
+
+def primary_reads():
+    """Route reads inside the block to the primary."""
+    return replica_reads(False)
+
+
+def _sticky_key(client):
+    return f"primary_sticky_{client}"
+
+
+def client_key(request):
+    """Identify the client of a request for the sticky-primary window, or None."""
+    # The header comes first: token users are only authenticated inside the view
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return f"auth:{hashlib.sha256(authorization.encode()).hexdigest()}"
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return None
+
+
+def stick_to_primary(client):
+    """Keep a client's reads on the primary for REPLICA_STICKY_SECONDS."""
+    if not client or not DATABASE_REPLICAS:
+        return
+    try:
+        cache.set(_sticky_key(client), True, timeout=REPLICA_STICKY_SECONDS)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+
+def is_sticky(client):
+    """Return whether a client recently wrote and should read from the primary."""
+    if not client or not DATABASE_REPLICAS:
+        return False
+    try:
+        return cache.get(_sticky_key(client)) is not None
+    except Exception as cache_error:
+        # Without the marker we cannot rule out a recent write
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return True
+
+
+async def ais_sticky(client):
+    """Async is_sticky()."""
+    if not client or not DATABASE_REPLICAS:
+        return False
+    try:
+        return await async_cache.aget(_sticky_key(client)) is not None
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return True
+
+
+class ReplicaRouter:
+    """Send reads to a replica inside replica_reads() and everything else to default."""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return random.choice(DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,160 @@
+"""
+Bulk stock movement ingestion.
+
+Parses a JSON array or NDJSON body of movement lines and validates them
+without running a DRF serializer per line: field checks happen in Python and
+the product, store and supplier ids of the whole body are checked against the
+reference cache, with one IN query per model for the ids it does not hold.
+"""
+import json
+import re
+
+from django.conf import settings
+
+from . import reference_cache
+from .models import Product, StockMovement, Store, Supplier
+
+BULK_MOVEMENT_MAX_LINES = getattr(settings, 'BULK_MOVEMENT_MAX_LINES', 50000)
+MOVEMENT_TYPES = {code for code, _ in StockMovement.MOVEMENT_TYPES}
+MAX_INTEGER = 2147483647  # Largest PositiveIntegerField and id value
+TRAILING_ZEROS = re.compile(r'\.0*\s*$')
+
+
+class IngestError(Exception):
+    """Raised when a bulk body cannot be parsed at all."""
+
+
+def parse_movement_lines(body, content_type=''):
+    """
+    Parse a request body into a list of movement lines.
+
+    NDJSON bodies (application/x-ndjson) hold one JSON object per line; any
+    other body must be a JSON array. A line that is not valid JSON is kept as
+    the raw string so it can be reported with its line number.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+
+    if 'ndjson' in content_type:
+        lines = []
+        for raw in body.splitlines():
+            if not raw.strip():
+                continue
+            try:
+                lines.append(json.loads(raw))
+            except json.JSONDecodeError:
+                lines.append(raw)
+    else:
+        try:
+            lines = json.loads(body)
+        except json.JSONDecodeError:
+            raise IngestError('Invalid JSON format')
+        if not isinstance(lines, list):
+            raise IngestError('Expected a JSON array of movements')
+
+    if not lines:
+        raise IngestError('No movements provided')
+    if len(lines) > BULK_MOVEMENT_MAX_LINES:
+        raise IngestError(f'At most {BULK_MOVEMENT_MAX_LINES} movements can be sent per request')
+    return lines
+
+
+def integral(value):
+    """
+    Return value as an int if it is a whole number, or None.
+
+    Accepts what DRF's IntegerField accepts: ints, and floats and strings
+    without a fractional part ("2", "2.0"); 2.9 is rejected, not truncated.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        try:
+            return int(TRAILING_ZEROS.sub('', value))
+        except ValueError:
+            return None
+    return None
+
+
+def positive_int(value, maximum=MAX_INTEGER):
+    value = integral(value)
+    return value if value is not None and 0 < value <= maximum else None
+
+
+def validate_movement_lines(lines):
+    """
+    Validate parsed movement lines.
+
+    Returns (movements, errors): movements is a list of (line number,
+    StockMovement) for the valid lines, errors maps line numbers to DRF-style
+    {field: [message]} dicts. Line numbers start at 1.
+    """
+    errors = {}
+    cleaned = []
+    product_ids, store_ids, supplier_ids = set(), set(), set()
+
+    for number, line in enumerate(lines, start=1):
+        if not isinstance(line, dict):
+            errors[number] = {'non_field_errors': ['Expected a JSON object.']}
+            continue
+
+        line_errors = {}
+        product_id = positive_int(line.get('product_id'))
+        if product_id is None:
+            line_errors['product_id'] = ['A valid product id is required.']
+        store_id = positive_int(line.get('store_id'))
+        if store_id is None:
+            line_errors['store_id'] = ['A valid store id is required.']
+        supplier_id = None
+        if line.get('supplier_id') is not None:
+            supplier_id = positive_int(line.get('supplier_id'))
+            if supplier_id is None:
+                line_errors['supplier_id'] = ['Must be a valid supplier id.']
+        movement_type = line.get('movement_type')
+        if movement_type not in MOVEMENT_TYPES:
+            line_errors['movement_type'] = [f'Must be one of: {", ".join(sorted(MOVEMENT_TYPES))}.']
+        quantity = positive_int(line.get('quantity'))
+        if quantity is None:
+            line_errors['quantity'] = ['A positive quantity is required.']
+
+        if line_errors:
+            errors[number] = line_errors
+            continue
+
+        product_ids.add(product_id)
+        store_ids.add(store_id)
+        if supplier_id is not None:
+            supplier_ids.add(supplier_id)
+        cleaned.append((number, product_id, store_id, supplier_id, movement_type, quantity))
+
+    # Ids missing from the reference cache are checked with one IN query per model
+    known_products = reference_cache.get_many(Product, product_ids)
+    known_stores = reference_cache.get_many(Store, store_ids)
+    known_suppliers = reference_cache.get_many(Supplier, supplier_ids)
+
+    movements = []
+    for number, product_id, store_id, supplier_id, movement_type, quantity in cleaned:
+        line_errors = {}
+        if product_id not in known_products:
+            line_errors['product_id'] = [f'Invalid pk "{product_id}" - object does not exist.']
+        if store_id not in known_stores:
+            line_errors['store_id'] = [f'Invalid pk "{store_id}" - object does not exist.']
+        if supplier_id is not None and supplier_id not in known_suppliers:
+            line_errors['supplier_id'] = [f'Invalid pk "{supplier_id}" - object does not exist.']
+        if line_errors:
+            errors[number] = line_errors
+            continue
+
+        movements.append((number, StockMovement(
+            product_id=product_id,
+            store_id=store_id,
+            supplier_id=supplier_id,
+            movement_type=movement_type,
+            quantity=quantity,
+        )))
+
+    return movements, errors
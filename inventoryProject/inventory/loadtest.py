@@ -0,0 +1,457 @@
+"""
+Load test harness for the main endpoints and the movement pipeline.
+
+Endpoint scenarios send GET requests with parameters drawn from the stores
+and products in the database, from several threads at once, either through
+the full Django stack in-process (the default) or over HTTP to a running
+server. The pipeline scenarios create pending movements inside a transaction
+that is rolled back and time their processing. The event scenario holds
+thousands of stock event streams open and times the fan-out of stock events
+to them. Every scenario reports its latency percentiles and throughput;
+run_load_test() returns them as one JSON-serializable dict.
+
+Run it against a dataset from ``manage.py generate_dataset`` with
+``manage.py load_test``; the generator's defaults (50,000 products carried by
+1,000 stores) are the reference size, e.g. for the search scenarios.
+Parameters are drawn from a seeded generator, so two runs against the same
+dataset send the same requests.
+"""
+import asyncio
+import json
+import math
+import platform
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import stock_cache, stock_events
+from .benchmarks import create_movements, rolled_back
+from .models import Product, Stock, Store, User
+from .tasks import apply_stock_movement, process_movement_batch
+
+LOAD_TEST_USER_EMAIL = 'loadtest@example.com'
+
+# name -> function(rng, sample) returning the path of one request
+ENDPOINT_SCENARIOS = {
+    'stock_page': lambda rng, s: '/api/stock/?page_size=50',
+    'stock_store': lambda rng, s: f"/api/stock/?store={rng.choice(s['stores'])}",
+    'stock_store_low': lambda rng, s: f"/api/stock/?store={rng.choice(s['stores'])}&status=low_stock&page_size=50",
+    'stock_date_range': lambda rng, s: (
+        f"/api/stock/?store={rng.choice(s['stores'])}&start_date={rng.choice(s['days'])}"
+        f"&end_date={s['today']}&page_size=50"
+    ),
+    'stock_as_of': lambda rng, s: f"/api/stock/?store={rng.choice(s['stores'])}&as_of={rng.choice(s['days'])}&page_size=50",
+    'stock_search': lambda rng, s: f"/api/stock/?search={rng.choice(s['search_terms'])}&page_size=50",
+    'stock_search_ranked': lambda rng, s: f"/api/stock/?search={rng.choice(s['search_terms'])}&store={rng.choice(s['stores'])}",
+    'stock_sku_prefix': lambda rng, s: f"/api/stock/?sku={rng.choice(s['sku_prefixes'])}&page_size=50",
+    'stock_summary': lambda rng, s: '/api/stock/summary/',
+    'logs_page': lambda rng, s: '/api/logs/?page_size=50',
+    'logs_store': lambda rng, s: f"/api/logs/?store={rng.choice(s['stores'])}&page_size=50",
+    'movements_store_removals': lambda rng, s: f"/stock-movements/?store={rng.choice(s['stores'])}&movement_type=REM",
+    'stores': lambda rng, s: '/stores/',
+    # The async variants; compare them with the scenarios above against an ASGI server
+    'async_stock_store': lambda rng, s: f"/api/async/stock/?store={rng.choice(s['stores'])}",
+    'async_stock_page': lambda rng, s: '/api/async/stock/?page_size=50',
+    'async_logs_store': lambda rng, s: f"/api/async/logs/?store={rng.choice(s['stores'])}&page_size=50",
+}
+
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(name, latencies, elapsed, errors=0, unit_count=None):
+    """
+    Build a scenario result from per-operation latencies in seconds.
+
+    unit_count is the number of items processed when an operation handles
+    several (e.g. a batch of movements); throughput is per item then.
+    """
+    values = sorted(latencies)
+    count = unit_count if unit_count is not None else len(values)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'name': name,
+        'operations': len(values),
+        'errors': errors,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'max_ms': ms(values[-1]) if values else None,
+        'seconds': round(elapsed, 3),
+        'throughput_per_s': round(count / elapsed, 1) if elapsed else None,
+    }
+
+
+def load_sample(rng, stores=200, products=500):
+    """Draw the store, product and day parameters the scenarios pick from."""
+    store_ids = list(Store.objects.order_by('id').values_list('id', flat=True))
+    if not store_ids:
+        raise ValueError("The database has no stores; run generate_dataset first")
+    store_ids = rng.sample(store_ids, min(stores, len(store_ids)))
+    product_ids = list(
+        Stock.objects.filter(store_id__in=store_ids).order_by('id').values_list('product_id', flat=True)[:products * 20]
+    )
+    today = timezone.localdate()
+    product_ids = rng.sample(product_ids, min(products, len(product_ids))) or [0]
+    # Search terms as users type them: a word or a name fragment, and the start of a scanned SKU
+    names_and_skus = list(Product.objects.filter(id__in=product_ids[:100]).values_list('name', 'sku')) or [('none', 'none')]
+    return {
+        'stores': store_ids,
+        'products': product_ids,
+        'search_terms': [quote(rng.choice((name.split()[0], name[-5:]))) for name, _ in names_and_skus],
+        'sku_prefixes': [quote(sku[:-2] or sku) for _, sku in names_and_skus],
+        'days': [(today - timedelta(days=offset)).isoformat() for offset in (1, 7, 30, 90, 180)],
+        'today': today.isoformat(),
+    }
+
+
+def load_test_token():
+    """Return the API token of the load test user, creating both if needed."""
+    user, created = User.objects.get_or_create(
+        email=LOAD_TEST_USER_EMAIL,
+        defaults={'first_name': 'Load', 'last_name': 'Test', 'is_active': True}
+    )
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    token, _ = Token.objects.get_or_create(user=user)
+    return token.key
+
+
+def _in_process_sender(token):
+    def send(path):
+        response = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token}').get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+    return send
+
+
+def _http_sender(base_url, token):
+    def send(path):
+        request = urllib.request.Request(base_url.rstrip('/') + path, headers={'Authorization': f'Token {token}'})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return send
+
+
+def run_endpoint(name, paths, send, concurrency):
+    """Send the given paths from concurrency threads and summarize the latencies."""
+    chunks = [paths[i::concurrency] for i in range(concurrency)]
+
+    def worker(chunk):
+        latencies, errors = [], 0
+        try:
+            for path in chunk:
+                start = time.perf_counter()
+                status = send(path)
+                latencies.append(time.perf_counter() - start)
+                if status >= 400:
+                    errors += 1
+        finally:
+            close_old_connections()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, chunks))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for chunk_latencies, _ in results for latency in chunk_latencies]
+    return summarize(name, latencies, elapsed, errors=sum(errors for _, errors in results))
+
+
+def run_pipeline(rng, sample, movements, batch_size):
+    """
+    Time the movement pipeline on pending movements that are rolled back
+    afterwards: the batched drain and the per-movement processing path.
+
+    Processing writes the new quantities into the stock cache; those entries
+    are dropped again once the rows are rolled back.
+    """
+    stores = list(Store.objects.filter(id__in=sample['stores'][:20]))
+    products = list(Product.objects.filter(id__in=sample['products'][:200]))
+    results = []
+
+    pairs = set()
+
+    with rolled_back():
+        created = create_movements(stores, products, movements, seed=rng.randrange(10 ** 6))
+        pairs.update((movement.store_id, movement.product_id) for movement in created)
+        latencies, processed = [], 0
+        start = time.perf_counter()
+        while True:
+            batch_start = time.perf_counter()
+            count = process_movement_batch(batch_size)
+            if not count:
+                break
+            latencies.append(time.perf_counter() - batch_start)
+            processed += count
+        results.append(summarize(f'movement_batch_drain_{batch_size}', latencies,
+                                 time.perf_counter() - start, unit_count=processed))
+
+    with rolled_back():
+        created = create_movements(stores, products, min(movements, 2000), seed=rng.randrange(10 ** 6))
+        pairs.update((movement.store_id, movement.product_id) for movement in created)
+        latencies = []
+        start = time.perf_counter()
+        for movement in created:
+            movement_start = time.perf_counter()
+            apply_stock_movement(movement.id)
+            latencies.append(time.perf_counter() - movement_start)
+        results.append(summarize('movement_per_row', latencies, time.perf_counter() - start))
+
+    stock_cache.invalidate_stock_entries(pairs)
+    stock_cache.invalidate_store_sheets({store_id for store_id, _ in pairs})
+    return results
+
+
+class _EventCollector:
+    """Parses a subscriber's Server-Sent Events and records load test deliveries."""
+
+    def __init__(self, results):
+        self.results = results
+        self.buffer = b''
+        self.connected = asyncio.Event()
+
+    def feed(self, data):
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        for line in lines:
+            if not line.startswith(b'data: '):
+                continue
+            message = json.loads(line[len(b'data: '):])
+            if message['event'] == 'resync':
+                self.connected.set()
+            elif message.get('load_test'):
+                self.results['latencies'].append(time.time() - message['ts'])
+
+
+async def _asgi_subscriber(app, path, query, token, collector, stop):
+    """Hold one event stream open on the ASGI application in-process."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await stop.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start' and message['status'] != 200:
+            collector.results['errors'] += 1
+            collector.connected.set()
+        elif message['type'] == 'http.response.body':
+            collector.feed(message.get('body', b''))
+
+    await app(scope, receive, send)
+
+
+async def _http_subscriber(base_url, path, query, token, collector, stop):
+    """Hold one event stream open on a running server."""
+    url = urlsplit(base_url)
+    reader, writer = await asyncio.open_connection(
+        url.hostname, url.port or (443 if url.scheme == 'https' else 80), ssl=url.scheme == 'https'
+    )
+    try:
+        writer.write((
+            f"GET {url.path.rstrip('/')}{path}?{query} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+            f"Authorization: Token {token}\r\nAccept: text/event-stream\r\n\r\n"
+        ).encode())
+        await writer.drain()
+        status = await reader.readline()
+        if b' 200 ' not in status:
+            collector.results['errors'] += 1
+            collector.connected.set()
+            return
+        while (await reader.readline()).strip():
+            pass
+        # Streamed bodies are chunked; each chunk holds whole events, so the
+        # chunk size lines are simply not data lines
+        reading = asyncio.ensure_future(stop.wait())
+        while not stop.is_set():
+            line = asyncio.ensure_future(reader.readline())
+            await asyncio.wait([line, reading], return_when=asyncio.FIRST_COMPLETED)
+            if not line.done():
+                line.cancel()
+                break
+            if not line.result():
+                break
+            collector.feed(line.result())
+        reading.cancel()
+    finally:
+        writer.close()
+
+
+async def _run_subscribers(sample, subscribers, events, stores_per_subscriber, base_url, token, rng, timeout):
+    from django.core.asgi import get_asgi_application
+
+    app = None if base_url else get_asgi_application()
+    path = '/api/stock/events/'
+    results = {'latencies': [], 'errors': 0}
+    stop = asyncio.Event()
+    followers = {}
+    collectors, tasks = [], []
+
+    start = time.perf_counter()
+    connect_latencies = []
+    for _ in range(subscribers):
+        store_ids = rng.sample(sample['stores'], min(stores_per_subscriber, len(sample['stores'])))
+        for store_id in store_ids:
+            followers[store_id] = followers.get(store_id, 0) + 1
+        collector = _EventCollector(results)
+        query = f"store={','.join(str(store_id) for store_id in store_ids)}"
+        subscriber = (_http_subscriber(base_url, path, query, token, collector, stop) if base_url
+                      else _asgi_subscriber(app, path, query, token, collector, stop))
+        collectors.append(collector)
+        tasks.append(asyncio.ensure_future(subscriber))
+
+        async def connected(collector=collector, opened=time.perf_counter()):
+            await collector.connected.wait()
+            connect_latencies.append(time.perf_counter() - opened)
+        tasks.append(asyncio.ensure_future(connected()))
+    await asyncio.wait_for(asyncio.gather(*(collector.connected.wait() for collector in collectors)), timeout)
+    connect_elapsed = time.perf_counter() - start
+
+    # Synthetic changes on followed stores, published the way the movement processors publish
+    followed = sorted(followers)
+    messages = []
+    for _ in range(events):
+        message = stock_events.stock_message(rng.choice(followed), [(rng.choice(sample['products']), 0, 1)])
+        message['load_test'] = True
+        messages.append(message)
+    expected = sum(followers[message['store_id']] for message in messages)
+
+    start = time.perf_counter()
+    for message in messages:
+        message['ts'] = time.time()
+        await asyncio.to_thread(stock_events.publish, [message])
+    deadline = time.monotonic() + timeout
+    while len(results['latencies']) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    delivery_elapsed = time.perf_counter() - start
+
+    stop.set()
+    await asyncio.wait(tasks, timeout=timeout)
+    for task in tasks:
+        task.cancel()
+
+    connect = summarize('event_stream_connect', connect_latencies, connect_elapsed, errors=results['errors'])
+    delivery = summarize('event_delivery', results['latencies'], delivery_elapsed,
+                         errors=expected - len(results['latencies']))
+    delivery.update({'subscribers': subscribers, 'events': events, 'expected_deliveries': expected})
+    return [connect, delivery]
+
+
+def run_subscribers(rng, sample, token, subscribers, events=200, stores_per_subscriber=1, base_url=None, timeout=60):
+    """
+    Hold many event streams (/api/stock/events/) open at once and time the
+    fan-out of published stock events to them.
+
+    Subscribers connect to the ASGI application in-process, or to a running
+    ASGI server at base_url. Events are published through Redis like the
+    movement processors publish them; deliveries not received within
+    timeout seconds count as errors.
+    """
+    return asyncio.run(_run_subscribers(sample, subscribers, events, stores_per_subscriber, base_url, token, rng,
+                                        timeout))
+
+
+def run_load_test(scenarios=None, requests=200, concurrency=4, warmup=10, base_url=None,
+                  pipeline_movements=5000, batch_size=500, subscribers=0, subscriber_events=200,
+                  stores_per_subscriber=1, seed=0):
+    """
+    Run the endpoint and pipeline scenarios and return the report.
+
+    Args:
+        scenarios: Endpoint scenario names (default: all)
+        requests: Measured requests per endpoint scenario
+        concurrency: Threads sending requests at once
+        warmup: Unmeasured requests per scenario sent first
+        base_url: Send requests to a running server instead of in-process
+        pipeline_movements: Movements processed by the pipeline scenarios; 0 skips them
+        batch_size: Movements per batch in the drain scenario
+        subscribers: Concurrent event stream subscribers; 0 skips the scenario
+        subscriber_events: Stock events published to the subscribers
+        stores_per_subscriber: Stores each subscriber follows
+        seed: Seed of the request parameters
+    """
+    rng = random.Random(seed)
+    sample = load_sample(rng)
+    token = load_test_token()
+    send = _http_sender(base_url, token) if base_url else _in_process_sender(token)
+    names = scenarios or list(ENDPOINT_SCENARIOS)
+
+    results = []
+    for name in names:
+        if name not in ENDPOINT_SCENARIOS:
+            raise ValueError(f"Unknown scenario {name}; choose from {', '.join(ENDPOINT_SCENARIOS)}")
+        build = ENDPOINT_SCENARIOS[name]
+        for _ in range(warmup):
+            send(build(rng, sample))
+        paths = [build(rng, sample) for _ in range(requests)]
+        results.append(run_endpoint(name, paths, send, concurrency))
+
+    pipeline = run_pipeline(rng, sample, pipeline_movements, batch_size) if pipeline_movements else []
+    events = run_subscribers(rng, sample, token, subscribers, subscriber_events, stores_per_subscriber,
+                             base_url) if subscribers else []
+
+    return {
+        'config': {
+            'requests': requests,
+            'concurrency': concurrency,
+            'warmup': warmup,
+            'target': base_url or 'in-process',
+            'seed': seed,
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'python': platform.python_version(),
+            'started_at': timezone.now().isoformat(),
+        },
+        'dataset': {
+            'stores': Store.objects.count(),
+            'products': Product.objects.count(),
+            'stock_rows': Stock.objects.count(),
+        },
+        'endpoints': results,
+        'pipeline': pipeline,
+        'events': events,
+    }
+
+
+def dump_report(report, path=None):
+    """Write the report as JSON to path, or return it as a string."""
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    return text
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run one of the registered inventory benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS), help='Benchmark to run')
+        parser.add_argument('--size', type=int, help='Number of rows to benchmark with')
+
+    def handle(self, *args, **options):
+        func = BENCHMARKS[options['name']]
+        kwargs = {'size': options['size']} if options['size'] else {}
+        try:
+            results = func(**kwargs)
+        except Exception as e:
+            raise CommandError(f"Benchmark failed: {str(e)}")
+
+        for row in results:
+            self.stdout.write(
+                f"{row['label']:<24} {row['count']:>8} rows  {row['seconds']:>9.4f}s  "
+                f"{row['per_second'] or 0:>10.1f} rows/s"
+            )
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from inventory.benchmarks import create_fixture, create_movements, rolled_back
+from inventory.models import AuditLog, User
+from inventory.views import StockMovementViewSet, logs_api, stock_api
+
+
+def endpoints():
+    """
+    Return (description, view, path, query budget) for the listings to check.
+
+    Budgets count the queries of one request on a warm process; the reference
+    cache is warmed by a first request that is not counted.
+    """
+    return [
+        ('audit log list', logs_api, '/api/logs/', 1),
+        ('audit log page', logs_api, '/api/logs/?page_size=50', 1),
+        ('audit log page of a store', logs_api, '/api/logs/?page_size=50&store={store}', 1),
+        ('stock list', stock_api, '/api/stock/?page_size=50&sort=quantity', 1),
+        # django-filter looks up the store to validate the filter value
+        ('stock movement list of a store', StockMovementViewSet.as_view({'get': 'list'}),
+         '/stock-movements/?store={store}', 2),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Count the queries of the listing endpoints and fail if they exceed their budget or grow with the data'
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        user = User(email='query-counts@example.com', is_active=True)
+        counts = {}
+
+        with rolled_back():
+            for size in (20, 200):
+                stores, products = create_fixture(stores=2, products=10, seed=size)
+                create_movements(stores, products, size, seed=size)
+                AuditLog.objects.bulk_create([
+                    AuditLog(action='query_count', store=stores[i % 2], product=products[i % 10],
+                             details={'sequence': i})
+                    for i in range(size)
+                ])
+
+                for description, view, path, budget in endpoints():
+                    path = path.format(store=stores[0].id)
+                    for attempt in range(2):
+                        request = factory.get(path)
+                        force_authenticate(request, user)
+                        with CaptureQueriesContext(connection) as queries:
+                            response = view(request)
+                            response.render()
+                        if response.status_code != 200:
+                            raise CommandError(f"{description} returned {response.status_code}")
+                    counts.setdefault(description, []).append(len(queries))
+
+        failures = []
+        for description, view, path, budget in endpoints():
+            small, large = counts[description]
+            if large > budget or large != small:
+                failures.append(description)
+                self.stdout.write(f"FAIL  {description}: {small} queries for 20 rows, {large} for 200 (budget {budget})")
+            else:
+                self.stdout.write(f"ok    {description}: {large} queries (budget {budget})")
+
+        if failures:
+            raise CommandError(f"{len(failures)} endpoints exceed their query budget: {', '.join(failures)}")
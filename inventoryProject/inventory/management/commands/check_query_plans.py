@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from inventory import search
+from inventory.models import AuditLog, Product, Stock, StockMovement, Store
+from inventory.tasks import pending_movements
+from inventory.snapshots import snapshot_date_filter
+
+
+def query_plans():
+    """
+    Return (description, queryset, expected index) for the hot queries.
+
+    The expected index may be a tuple of names that all count.
+
+    The querysets are built the way views.py and tasks.py build them.
+    """
+    plans = [
+        ('batch drain of unprocessed movements',
+         pending_movements(5000),
+         'movement_unprocessed_idx'),
+        ('stock date-range EXISTS filter',
+         Stock.objects.filter(snapshot_date_filter('2025-01-01', '2025-01-31')),
+         # SQLite backs unique constraints with an automatic index
+         ('snapshot_store_prod_day_uniq', 'sqlite_autoindex_inventory_dailystocksnapshot_1')),
+        ('stock supplier filter',
+         StockMovement.objects.filter(supplier_id=1).values_list('product_id', flat=True).distinct(),
+         'movement_supplier_prod_idx'),
+        ('latest audit logs',
+         AuditLog.objects.order_by('-timestamp', '-id')[:100],
+         'auditlog_ts_id_idx'),
+        ('next page of audit logs',
+         AuditLog.objects.filter(
+             Q(timestamp__lt='2025-01-31T00:00:00Z') | Q(timestamp='2025-01-31T00:00:00Z', id__lt=1000)
+         ).order_by('-timestamp', '-id')[:100],
+         'auditlog_ts_id_idx'),
+        ('latest audit logs of a user',
+         AuditLog.objects.filter(user_id=1).order_by('-timestamp', '-id')[:100],
+         'auditlog_user_ts_id_idx'),
+    ]
+    if search.is_supported():
+        # The trigram and pattern indexes only exist on PostgreSQL
+        plans += [
+            ('product search',
+             search.matching_products('rice'),
+             ('product_name_trgm_idx', 'product_sku_trgm_idx')),
+            ('store search',
+             Store.objects.filter(name__icontains='lahore').values('id'),
+             'store_name_trgm_idx'),
+            ('SKU prefix lookup',
+             Product.objects.filter(sku__istartswith='GEN0-0001').values('id'),
+             'product_sku_prefix_idx'),
+        ]
+    return plans
+
+
+def index_names(index):
+    """
+    Return the names that count as using index in a plan.
+
+    On partitioned tables the plan names each partition's copy of the index.
+    """
+    names = set(index) if isinstance(index, tuple) else {index}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = ANY(%s)
+                """,
+                [list(names)]
+            )
+            names.update(name for (name,) in cursor.fetchall())
+    return names
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot inventory queries and fail if they do not use their indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small development tables would otherwise be sequentially scanned
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for description, queryset, index in query_plans():
+                plan = queryset.explain()
+                used = any(name in plan for name in index_names(index))
+                index = index[0] if isinstance(index, tuple) else index
+                if used:
+                    self.stdout.write(f"ok    {description} uses {index}")
+                else:
+                    failures.append(description)
+                    self.stdout.write(f"FAIL  {description} does not use {index}")
+                if options['verbose_plans'] or not used:
+                    self.stdout.write(plan)
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries do not use their indexes: {', '.join(failures)}")
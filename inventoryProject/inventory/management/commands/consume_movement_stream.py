@@ -0,0 +1,63 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from inventory import movement_stream
+
+TRIM_INTERVAL = 60  # seconds between trims of stored entries
+
+
+class Command(BaseCommand):
+    help = 'Store stock movements from the ingest stream in batches (stream ingest mode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=f"{socket.gethostname()}-{os.getpid()}",
+                            help='Consumer name in the group; reuse it after a restart to resume its batch')
+        parser.add_argument('--batch-size', type=int, default=movement_stream.BATCH_SIZE,
+                            help='Entries to store per transaction')
+        parser.add_argument('--block', type=int, default=1000,
+                            help='Milliseconds to wait for new entries per read')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no entries are waiting instead of waiting for more')
+
+    def handle(self, *args, **options):
+        try:
+            conn = movement_stream.get_connection()
+            movement_stream.ensure_group(conn)
+        except Exception as e:
+            raise CommandError(f"The ingest stream needs the Redis cache: {str(e)}")
+
+        consumer, batch_size = options['consumer'], options['batch_size']
+        block = None if options['once'] else options['block']
+        backlog = True
+        last_trim = 0
+        try:
+            while True:
+                close_old_connections()
+                if backlog:
+                    # Entries this consumer read before a restart come first
+                    entries = movement_stream.read_batch(conn, consumer, batch_size, backlog=True)
+                    backlog = bool(entries)
+                    if not backlog:
+                        continue
+                else:
+                    entries = (movement_stream.claim_stalled(conn, consumer, batch_size)
+                               or movement_stream.read_batch(conn, consumer, batch_size, block_ms=block))
+
+                if entries:
+                    stored, dropped = movement_stream.consume(conn, entries)
+                    self.stdout.write(f"Stored {stored} of {len(entries)} entries"
+                                      + (f", dropped {dropped}" if dropped else ""))
+                elif options['once']:
+                    break
+
+                if time.monotonic() - last_trim > TRIM_INTERVAL:
+                    movement_stream.trim(conn)
+                    last_trim = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('Movement stream consumer stopped'))
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.bulk_io import export_movements, export_stock, file_format
+from inventory.snapshots import parse_day
+
+
+class Command(BaseCommand):
+    help = 'Export stock levels or movements as CSV or NDJSON, in the format import_inventory reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['stock', 'movements'])
+        parser.add_argument('--output', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format (default: from the output file extension, else csv)')
+        parser.add_argument('--store', type=int, action='append', help='Only this store; may be repeated')
+        parser.add_argument('--start-date', help='Movements from this day, YYYY-MM-DD')
+        parser.add_argument('--end-date', help='Movements up to this day, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or file_format(options['output'])
+        for option in ('start_date', 'end_date'):
+            if options[option] and parse_day(options[option]) is None:
+                raise CommandError(f"--{option.replace('_', '-')} must be YYYY-MM-DD")
+
+        if options['kind'] == 'stock':
+            chunks = export_stock(fmt, options['store'])
+        else:
+            chunks = export_movements(fmt, options['store'], options['start_date'], options['end_date'])
+
+        written = 0
+        target = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                target.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                target.close()
+            else:
+                target.flush()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
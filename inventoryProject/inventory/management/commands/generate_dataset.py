@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.datasets import generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic dataset for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=1000, help='Number of stores (default: 1000)')
+        parser.add_argument('--products', type=int, default=50000, help='Number of products (default: 50000)')
+        parser.add_argument('--movements', type=int, default=10000000,
+                            help='Number of processed movements (default: 10000000)')
+        parser.add_argument('--suppliers', type=int, default=200, help='Number of suppliers (default: 200)')
+        parser.add_argument('--assortment', type=int, default=2000,
+                            help='Products carried by each store (default: 2000)')
+        parser.add_argument('--days', type=int, default=365, help='Days of movement history (default: 365)')
+        parser.add_argument('--pending', type=int, default=0,
+                            help='Unprocessed movements to leave for the movement pipeline (default: 0)')
+        parser.add_argument('--no-audit-logs', action='store_true',
+                            help='Skip the audit log entries of the processed movements')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--end-date', help='Last day of history as YYYY-MM-DD (default: today)')
+
+    def handle(self, *args, **options):
+        end_date = None
+        if options['end_date']:
+            try:
+                end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--end-date must be YYYY-MM-DD")
+
+        try:
+            result = generate_dataset(
+                stores=options['stores'],
+                products=options['products'],
+                movements=options['movements'],
+                suppliers=options['suppliers'],
+                assortment=options['assortment'],
+                days=options['days'],
+                pending=options['pending'],
+                audit_logs=not options['no_audit_logs'],
+                seed=options['seed'],
+                end_date=end_date,
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {result['movements']} movements, {result['stock']} stock rows, "
+            f"{result['snapshots']} snapshots and {result['audit_logs']} audit logs in {result['seconds']}s"
+        ))
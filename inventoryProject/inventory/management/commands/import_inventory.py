@@ -0,0 +1,48 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.bulk_io import decode_lines, file_format, import_movements, import_stock
+
+
+class Command(BaseCommand):
+    help = 'Import stock levels or a movement history from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['stock', 'movements'])
+        parser.add_argument('file', help="CSV or NDJSON file, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format (default: from the file extension, else csv)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without importing')
+        parser.add_argument('--process', action='store_true',
+                            help='Apply imported movements to the stock levels instead of storing them as history')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or file_format(options['file'])
+        if options['process'] and options['kind'] != 'movements':
+            raise CommandError("--process only applies to movements")
+
+        try:
+            source = sys.stdin.buffer if options['file'] == '-' else open(options['file'], 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with source:
+            lines = decode_lines(source)
+            if options['kind'] == 'stock':
+                result = import_stock(lines, fmt, dry_run=options['dry_run'], progress=self.stdout.write)
+            else:
+                result = import_movements(lines, fmt, process=options['process'], dry_run=options['dry_run'],
+                                          progress=self.stdout.write)
+
+        for line in result['errors']:
+            self.stderr.write(f"Line {line['line']}: {json.dumps(line['errors'])}")
+        if result['errors_truncated']:
+            self.stderr.write(f"... {result['failed'] - len(result['errors'])} more failed lines")
+
+        counts = f"{result['created']} created"
+        if 'updated' in result:
+            counts += f", {result['updated']} updated"
+        message = f"{'Checked' if result['dry_run'] else 'Imported'} {result['lines']} lines: {counts}, {result['failed']} failed"
+        self.stdout.write(self.style.SUCCESS(message) if not result['failed'] else self.style.WARNING(message))
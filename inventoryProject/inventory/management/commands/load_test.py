@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.loadtest import ENDPOINT_SCENARIOS, dump_report, run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Load test the main endpoints and the movement pipeline and report latency percentiles as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(ENDPOINT_SCENARIOS),
+                            help='Endpoint scenario to run; may be repeated (default: all)')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client threads (default: 4)')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario (default: 10)')
+        parser.add_argument('--base-url', help='Load test a running server, e.g. http://localhost:8000 '
+                                               '(default: in-process)')
+        parser.add_argument('--pipeline-movements', type=int, default=5000,
+                            help='Movements for the pipeline scenarios, 0 to skip them (default: 5000)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Batch size of the drain scenario (default: 500)')
+        parser.add_argument('--subscribers', type=int, default=0,
+                            help='Concurrent stock event stream subscribers, 0 to skip (default: 0); '
+                                 'with --base-url the server must be an ASGI server')
+        parser.add_argument('--subscriber-events', type=int, default=200,
+                            help='Stock events published to the subscribers (default: 200)')
+        parser.add_argument('--stores-per-subscriber', type=int, default=1,
+                            help='Stores each subscriber follows (default: 1)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the request parameters (default: 0)')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_load_test(
+                scenarios=options['scenarios'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                warmup=options['warmup'],
+                base_url=options['base_url'],
+                pipeline_movements=options['pipeline_movements'],
+                batch_size=options['batch_size'],
+                subscribers=options['subscribers'],
+                subscriber_events=options['subscriber_events'],
+                stores_per_subscriber=options['stores_per_subscriber'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        text = dump_report(report, options['output'])
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote the load test report to {options['output']}"))
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions and optionally drop expired ones (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=partitions.PARTITION_MONTHS_AHEAD,
+                            help='Months after the current one to create partitions for')
+        parser.add_argument('--retention', action='store_true',
+                            help='Roll up and drop partitions older than the configured retention')
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported():
+            raise CommandError('Table partitioning needs PostgreSQL')
+
+        for name in partitions.ensure_partitions(options['months_ahead']):
+            self.stdout.write(f"Created {name}")
+
+        if options['retention']:
+            for table, months in partitions.retention_months().items():
+                for name in partitions.apply_retention(table, months):
+                    self.stdout.write(f"Dropped {name}")
+
+        self.stdout.write(self.style.SUCCESS('Partitions are up to date'))
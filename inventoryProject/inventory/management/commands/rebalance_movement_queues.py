@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import movement_queues
+from inventory.tasks import schedule_movement_drain
+
+
+class Command(BaseCommand):
+    help = 'Change the number of partitioned stock movement queues without overlapping drains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('partitions', type=int, help='Number of partitions to drain movements in')
+        parser.add_argument('--timeout', type=int, default=movement_queues.PARTITION_LOCK_TIMEOUT,
+                            help='Seconds to wait for running drains to finish their batch')
+
+    def handle(self, *args, **options):
+        if not movement_queues.partition_count():
+            raise CommandError('Partitioned queues are off; set STOCK_MOVEMENT_PARTITIONS first')
+
+        try:
+            previous = movement_queues.rebalance(options['partitions'], options['timeout'])
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Switched from {previous} to {options['partitions']} partitions")
+        try:
+            schedule_movement_drain()
+        except Exception as e:
+            raise CommandError(f"Could not queue the partition drains: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS('Partition drains queued'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from inventory.snapshots import rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Backfill daily stock snapshots from the stored stock movements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, action='append', dest='stores',
+                            help='Store id to rebuild; may be repeated (default: all stores)')
+
+    def handle(self, *args, **options):
+        count = rebuild_snapshots(options['stores'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} daily stock snapshots"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from inventory.summaries import rebuild_store_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-store stock summaries from the Stock table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, action='append', dest='stores',
+                            help='Store id to rebuild; may be repeated (default: all stores)')
+
+    def handle(self, *args, **options):
+        count = rebuild_store_summaries(options['stores'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stock summaries for {count} stores"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from inventory import movement_stream
+
+
+def stream_position(value):
+    """Parse a stream entry id or an ISO 8601 date and time."""
+    if value in ('-', '+') or value.replace('-', '').isdigit():
+        return value
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f"Expected a stream entry id or an ISO 8601 date and time: {value}")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class Command(BaseCommand):
+    help = 'Store the ingest stream entries in a range that are missing from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', default='-', help='First entry id or date and time (default: oldest kept)')
+        parser.add_argument('--end', default='+', help='Last entry id or date and time (default: newest)')
+        parser.add_argument('--batch-size', type=int, default=movement_stream.BATCH_SIZE,
+                            help='Entries to store per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the missing entries')
+
+    def handle(self, *args, **options):
+        start, end = stream_position(options['start']), stream_position(options['end'])
+        try:
+            read, stored, dropped = movement_stream.replay(start, end, options['batch_size'], options['dry_run'])
+        except Exception as e:
+            raise CommandError(f"Replay failed: {str(e)}")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{stored} of {read} entries are missing from the database"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {stored} of {read} entries" + (f", dropped {dropped}" if dropped else "")
+        ))
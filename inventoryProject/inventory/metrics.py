@@ -0,0 +1,316 @@
+"""
+Per-endpoint query, database time, cache and latency metrics.
+
+MetricsMiddleware measures every request under its view name (``stock_api``,
+``logs_api``, ``StockMovementViewSet.list`` ...) and the Celery task hooks
+below measure every task under its name (``process_stock_movement`` ...).
+A measurement counts the SQL queries run on any database alias and their
+time, stock and reference cache hits and misses, and the total latency.
+
+Totals are accumulated per process and added to shared counters in the
+Django cache every METRICS_FLUSH_INTERVAL seconds, so ``/api/metrics/``
+reports every web and worker process when the cache is Redis. With the local
+memory cache it only reports the process serving it.
+
+PERFORMANCE_BUDGETS limits the queries, database time and latency of a name,
+e.g. ``{'stock_api': {'queries': 5, 'duration_ms': 300}}``. A measurement
+over budget is logged as a warning on the ``inventory.metrics`` logger, or
+raises BudgetExceeded when PERFORMANCE_BUDGET_ACTION is 'raise', which is
+meant for tests and CI. Task hooks cannot fail a task, so over-budget tasks
+are always only logged.
+"""
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+PERFORMANCE_BUDGETS = getattr(settings, 'PERFORMANCE_BUDGETS', {})
+PERFORMANCE_BUDGET_ACTION = getattr(settings, 'PERFORMANCE_BUDGET_ACTION', 'log')
+SERVER_TIMING_HEADER = getattr(settings, 'SERVER_TIMING_HEADER', False)
+
+NAMES_KEY = 'metrics_names'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+KIND_LABELS = {'request': 'view', 'task': 'task'}
+
+logger = logging.getLogger(__name__)
+
+_active = ContextVar('active_measurements', default=())
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Measurement:
+    """Counters of one request or task."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+
+    def budget_values(self):
+        return {
+            'queries': self.queries,
+            'db_ms': self.db_time * 1000,
+            'duration_ms': self.duration * 1000,
+        }
+
+    def server_timing(self):
+        """Return the measurement as a Server-Timing header value."""
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f'cache;desc="{self.cache_hits} hits {self.cache_misses} misses", '
+            f'total;dur={self.duration * 1000:.1f}'
+        )
+
+
+@contextmanager
+def measuring(measurement):
+    """Count the queries and cache lookups inside the block into measurement."""
+    previous = _active.get()
+    _active.set(previous + (measurement,))
+    try:
+        yield measurement
+    finally:
+        _active.set(previous)
+
+
+def record_cache(hits=0, misses=0):
+    """Add cache lookups to the measurements in progress."""
+    for measurement in _active.get():
+        measurement.cache_hits += hits
+        measurement.cache_misses += misses
+
+
+def _record_query(execute, sql, params, many, context):
+    active = _active.get()
+    if not active:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        for measurement in active:
+            measurement.queries += 1
+            measurement.db_time += elapsed
+
+
+@receiver(connection_created, dispatch_uid='inventory_metrics_instrument_connection')
+def instrument_connection(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last wrapper on exit
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def budget_violations(name, measurement):
+    """Return a description of each PERFORMANCE_BUDGETS limit the measurement exceeds."""
+    budget = PERFORMANCE_BUDGETS.get(name, {})
+    values = measurement.budget_values()
+    return [
+        f"{field} {values[field]:g} > {limit:g}"
+        for field, limit in budget.items()
+        if field in values and values[field] > limit
+    ]
+
+
+class MetricsRegistry:
+    """
+    Accumulates measurements per (kind, name) and adds them to shared
+    counters in the cache once they are due.
+    """
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, kind, name, measurement, over_budget=False):
+        bucket = next((i for i, bound in enumerate(DURATION_BUCKETS) if measurement.duration <= bound),
+                      len(DURATION_BUCKETS))
+        with self._lock:
+            totals = self._pending.setdefault((kind, name), {})
+            for field, value in (
+                ('count', 1),
+                ('queries', measurement.queries),
+                ('db_us', round(measurement.db_time * 1e6)),
+                ('cache_hits', measurement.cache_hits),
+                ('cache_misses', measurement.cache_misses),
+                ('duration_us', round(measurement.duration * 1e6)),
+                (f'bucket_{bucket}', 1),
+                ('over_budget', int(over_budget)),
+            ):
+                totals[field] = totals.get(field, 0) + value
+
+    def is_due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            # Re-registering on every flush repairs a name lost to a concurrent update
+            names = cache.get(NAMES_KEY) or []
+            missing = [list(key) for key in pending if list(key) not in names]
+            if missing:
+                cache.set(NAMES_KEY, names + missing, timeout=None)
+            for (kind, name), totals in pending.items():
+                for field, delta in totals.items():
+                    if delta:
+                        _add(_key(kind, name, field), delta)
+        except Exception as cache_error:
+            print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+    def totals(self):
+        """Return {(kind, name): {field: total}} from the shared counters."""
+        self.flush()
+        names = [tuple(key) for key in cache.get(NAMES_KEY) or []]
+        fields = ['count', 'queries', 'db_us', 'cache_hits', 'cache_misses', 'duration_us', 'over_budget']
+        fields += [f'bucket_{i}' for i in range(len(DURATION_BUCKETS) + 1)]
+        values = cache.get_many([_key(kind, name, field) for kind, name in names for field in fields])
+        return {
+            (kind, name): {field: values.get(_key(kind, name, field), 0) for field in fields}
+            for kind, name in names
+        }
+
+
+def _key(kind, name, field):
+    return f"metrics_{kind}_{name}_{field}"
+
+
+def _add(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+metrics_registry = MetricsRegistry(METRICS_FLUSH_INTERVAL)
+
+
+def finish(kind, name, measurement, enforce=True, flush=True):
+    """
+    Record a finished measurement and check it against its budget.
+
+    Raises BudgetExceeded when the budget action is 'raise' and enforce is set.
+    Pass flush=False on an event loop and flush the registry in a thread.
+    """
+    measurement.stop()
+    violations = budget_violations(name, measurement)
+    metrics_registry.add(kind, name, measurement, over_budget=bool(violations))
+    if flush:
+        metrics_registry.flush_if_due()
+
+    if violations:
+        message = f"Performance budget exceeded by {name}: {', '.join(violations)}"
+        if enforce and PERFORMANCE_BUDGET_ACTION == 'raise':
+            raise BudgetExceeded(message)
+        logger.warning(message)
+
+
+def view_name(request):
+    """
+    Return the metrics name of the view that served a request: the function
+    name of plain and @api_view views, ``<ViewSet>.<action>`` for viewsets.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = match.func
+    view_class = getattr(func, 'cls', None)
+    if view_class is None:
+        return getattr(func, '__name__', match.view_name)
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f"{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
+    return view_class.__name__
+
+
+def render_prometheus(totals):
+    """Render registry totals in the Prometheus text exposition format."""
+    lines = []
+    for kind, label in KIND_LABELS.items():
+        rows = sorted((name, values) for (row_kind, name), values in totals.items() if row_kind == kind)
+        prefix = f"inventory_{kind}"
+
+        def metric(suffix, metric_type, help_text, value):
+            lines.append(f"# HELP {prefix}_{suffix} {help_text}")
+            lines.append(f"# TYPE {prefix}_{suffix} {metric_type}")
+            for name, values in rows:
+                lines.append(f'{prefix}_{suffix}{{{label}="{_escape(name)}"}} {value(values)}')
+
+        metric('total', 'counter', f"Measured {kind}s", lambda v: v['count'])
+        metric('queries_total', 'counter', "SQL queries run", lambda v: v['queries'])
+        metric('db_seconds_total', 'counter', "Time spent in SQL queries", lambda v: v['db_us'] / 1e6)
+        metric('cache_hits_total', 'counter', "Stock and reference cache hits", lambda v: v['cache_hits'])
+        metric('cache_misses_total', 'counter', "Stock and reference cache misses", lambda v: v['cache_misses'])
+        metric('over_budget_total', 'counter', "Measurements over their performance budget",
+               lambda v: v['over_budget'])
+
+        lines.append(f"# HELP {prefix}_duration_seconds Total latency")
+        lines.append(f"# TYPE {prefix}_duration_seconds histogram")
+        for name, values in rows:
+            labels = f'{label}="{_escape(name)}"'
+            cumulative = 0
+            for i, bound in enumerate(DURATION_BUCKETS):
+                cumulative += values[f'bucket_{i}']
+                lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="+Inf"}} {values["count"]}')
+            lines.append(f'{prefix}_duration_seconds_sum{{{labels}}} {values["duration_us"] / 1e6}')
+            lines.append(f'{prefix}_duration_seconds_count{{{labels}}} {values["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Celery tasks: prerun and postrun run in the worker thread executing the task
+_running_tasks = {}
+
+
+@task_prerun.connect(weak=False)
+def start_task_measurement(task_id=None, **kwargs):
+    measurement = Measurement()
+    previous = _active.get()
+    _active.set(previous + (measurement,))
+    _running_tasks[task_id] = (measurement, previous)
+
+
+@task_postrun.connect(weak=False)
+def finish_task_measurement(task_id=None, task=None, **kwargs):
+    running = _running_tasks.pop(task_id, None)
+    if running is None:
+        return
+    measurement, previous = running
+    _active.set(previous)
+    finish('task', task.name.rsplit('.', 1)[-1], measurement, enforce=False)
+
+
+atexit.register(metrics_registry.flush)
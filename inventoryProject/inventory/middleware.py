@@ -0,0 +1,157 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .audit import audit_sink
+from .db_router import ais_sticky, client_key, is_sticky, replica_reads, stick_to_primary
+from .metrics import SERVER_TIMING_HEADER, Measurement, finish, measuring, metrics_registry, view_name
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs on the event loop under ASGI: __call__
+    serves sync requests, __acall__ async ones. Without it, Django would run
+    the middleware, and with it every async view, in a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Measure queries, database time, cache lookups and latency per view, and
+    optionally report them in a Server-Timing header.
+    """
+
+    def handle(self, request):
+        measurement = Measurement()
+        with measuring(measurement):
+            response = self.get_response(request)
+        return self._finish(request, response, measurement)
+
+    async def __acall__(self, request):
+        measurement = Measurement()
+        with measuring(measurement):
+            response = await self.get_response(request)
+        response = self._finish(request, response, measurement, flush=False)
+        if metrics_registry.is_due():
+            await sync_to_async(metrics_registry.flush)()
+        return response
+
+    def _finish(self, request, response, measurement, flush=True):
+        if response.streaming and response.is_async and response.get('Content-Type') == 'text/event-stream':
+            # Event streams stay open indefinitely; measure them up to the first byte
+            finish('request', view_name(request), measurement, flush=flush)
+            return response
+
+        if response.streaming:
+            # The body, and its queries, are produced after this method returns
+            measure = self._ameasure_stream if response.is_async else self._measure_stream
+            response.streaming_content = measure(response.streaming_content, view_name(request), measurement)
+            return response
+
+        finish('request', view_name(request), measurement, flush=flush)
+        if SERVER_TIMING_HEADER:
+            response['Server-Timing'] = measurement.server_timing()
+        return response
+
+    @staticmethod
+    def _measure_stream(content, name, measurement):
+        try:
+            with measuring(measurement):
+                yield from content
+        finally:
+            finish('request', name, measurement)
+
+    @staticmethod
+    async def _ameasure_stream(content, name, measurement):
+        try:
+            with measuring(measurement):
+                async for chunk in content:
+                    yield chunk
+        finally:
+            finish('request', name, measurement, flush=False)
+
+
+class AuditLogFlushMiddleware(AsyncCapableMiddleware):
+    """
+    Flush buffered audit logs at the end of a request once they are due.
+    """
+
+    def handle(self, request):
+        response = self.get_response(request)
+        audit_sink.flush_if_due()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if audit_sink.is_due():
+            await sync_to_async(audit_sink.flush)()
+        return response
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """
+    Route the reads of safe requests to a replica unless the client wrote
+    within the sticky-primary window; mark clients that send writes.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def handle(self, request):
+        client = client_key(request)
+        use_replica = request.method in self.SAFE_METHODS and not is_sticky(client)
+
+        with replica_reads(use_replica):
+            response = self.get_response(request)
+
+        if request.method not in self.SAFE_METHODS:
+            # A session login only identifies the client once the view has run
+            stick_to_primary(client or client_key(request))
+        elif use_replica and response.streaming:
+            response.streaming_content = self._stream_from_replica(response)
+        return response
+
+    async def __acall__(self, request):
+        client = client_key(request)
+        use_replica = request.method in self.SAFE_METHODS and not await ais_sticky(client)
+
+        with replica_reads(use_replica):
+            response = await self.get_response(request)
+
+        if request.method not in self.SAFE_METHODS:
+            await sync_to_async(stick_to_primary)(client or client_key(request))
+        elif use_replica and response.streaming:
+            response.streaming_content = self._stream_from_replica(response)
+        return response
+
+    def _stream_from_replica(self, response):
+        # Streamed querysets are evaluated after the middleware returns
+        if response.is_async:
+            return self._aread_from_replica(response.streaming_content)
+        return self._read_from_replica(response.streaming_content)
+
+    @staticmethod
+    def _read_from_replica(content):
+        with replica_reads():
+            yield from content
+
+    @staticmethod
+    async def _aread_from_replica(content):
+        with replica_reads():
+            async for chunk in content:
+                yield chunk
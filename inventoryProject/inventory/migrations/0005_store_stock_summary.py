@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def build_summaries(apps, schema_editor):
+    Stock = apps.get_model('inventory', 'Stock')
+    StoreStockSummary = apps.get_model('inventory', 'StoreStockSummary')
+    Store = apps.get_model('inventory', 'Store')
+
+    counts = {
+        row['store_id']: row
+        for row in Stock.objects.values('store_id').annotate(
+            out_of_stock=Count('id', filter=Q(quantity=0)),
+            low_stock=Count('id', filter=Q(quantity__gt=0, quantity__lt=F('store__low_stock_threshold'))),
+            in_stock=Count('id', filter=Q(quantity__gte=F('store__low_stock_threshold'))),
+            total_units=Sum('quantity'),
+        ).order_by()
+    }
+    StoreStockSummary.objects.bulk_create([
+        StoreStockSummary(
+            store_id=store_id,
+            out_of_stock=counts.get(store_id, {}).get('out_of_stock', 0),
+            low_stock=counts.get(store_id, {}).get('low_stock', 0),
+            in_stock=counts.get(store_id, {}).get('in_stock', 0),
+            total_units=counts.get(store_id, {}).get('total_units') or 0,
+        )
+        for store_id in Store.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_movement_and_auditlog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreStockSummary',
+            fields=[
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_summary', serialize=False, to='inventory.store')),
+                ('out_of_stock', models.PositiveIntegerField(default=0)),
+                ('low_stock', models.PositiveIntegerField(default=0)),
+                ('in_stock', models.PositiveIntegerField(default=0)),
+                ('total_units', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(default=20),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
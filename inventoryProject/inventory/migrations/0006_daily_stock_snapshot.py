@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_store_stock_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('in_quantity', models.PositiveBigIntegerField(default=0)),
+                ('out_quantity', models.PositiveBigIntegerField(default=0)),
+                ('rem_quantity', models.PositiveBigIntegerField(default=0)),
+                ('movement_count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('store', 'product', 'day'), name='snapshot_store_prod_day_uniq')],
+            },
+        ),
+    ]
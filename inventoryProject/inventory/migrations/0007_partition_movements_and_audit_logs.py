@@ -0,0 +1,121 @@
+"""
+Rebuild StockMovement and AuditLog as tables partitioned by month of
+``timestamp`` on PostgreSQL; other backends keep plain tables.
+
+The DDL is copied from inventory.partitions as it stood when this migration
+was written, so later changes there do not change what the migration does.
+Each table gets a default partition and one partition per month from its
+oldest row to PARTITION_MONTHS_AHEAD months ahead; partitions after that are
+created by the maintain_partitions task.
+
+Reversing is a no-op: the partitioned tables have the same columns, so the
+earlier schema works on them unchanged, and copying every row back into a
+plain table would need the same maintenance window as the forward step.
+Applying the migration again skips tables that are already partitioned.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations
+
+PARTITIONED_TABLES = ('inventory_stockmovement', 'inventory_auditlog')
+PARTITION_MONTHS_AHEAD = 3
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)', [table])
+    return cursor.fetchone()[0]
+
+
+def convert_to_partitioned(schema_editor, table):
+    """
+    Copy table into a new partitioned table of the same name, keeping its
+    id sequence, indexes and foreign keys.
+    """
+    q = schema_editor.quote_name
+    old = f"{table}_unpartitioned"
+    sequence = f"{table}_id_seq"
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            return
+        cursor.execute(
+            """
+            SELECT indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s
+            """,
+            [table, f"{table}_pkey"]
+        )
+        indexes = [definition for (definition,) in cursor.fetchall()]
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT min("timestamp"), max(id) FROM {q(table)}')
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {q(table)} RENAME TO {q(old)}')
+        cursor.execute(
+            f'CREATE TABLE {q(table)} (LIKE {q(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ("timestamp")'
+        )
+        # PostgreSQL requires the partition key in every unique constraint
+        cursor.execute(f'ALTER TABLE {q(table)} ADD PRIMARY KEY (id, "timestamp")')
+        cursor.execute(f'CREATE TABLE {q(table + "_default")} PARTITION OF {q(table)} DEFAULT')
+
+        current = month_start(datetime.now(dt_timezone.utc))
+        month = month_start(oldest) if oldest else current
+        while month <= add_months(current, PARTITION_MONTHS_AHEAD):
+            cursor.execute(
+                f'CREATE TABLE {q(f"{table}_p{month:%Y%m}")} PARTITION OF {q(table)} FOR VALUES FROM (%s) TO (%s)',
+                [bound(month), bound(add_months(month, 1))]
+            )
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {q(table)} SELECT * FROM {q(old)}')
+        # Dropping the old table also drops its identity sequence, which has
+        # the name the new sequence takes over
+        cursor.execute(f'DROP TABLE {q(old)}')
+        cursor.execute(f'CREATE SEQUENCE {q(sequence)} OWNED BY {q(table)}.id')
+        cursor.execute(f"ALTER TABLE {q(table)} ALTER COLUMN id SET DEFAULT nextval(%s)", [sequence])
+        if max_id:
+            cursor.execute('SELECT setval(%s, %s)', [sequence, max_id])
+
+        # Definitions were read before the rename, so they name the new table
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {q(table)} ADD CONSTRAINT {q(name)} {definition}')
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in PARTITIONED_TABLES:
+        convert_to_partitioned(schema_editor, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_daily_stock_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
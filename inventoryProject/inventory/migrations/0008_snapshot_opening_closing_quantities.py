@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_partition_movements_and_audit_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystocksnapshot',
+            name='opening_quantity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailystocksnapshot',
+            name='closing_quantity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
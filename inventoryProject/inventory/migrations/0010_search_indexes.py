@@ -0,0 +1,49 @@
+"""
+Add pg_trgm and expression indexes for product and store search on
+PostgreSQL (see inventory/search.py); other backends have no equivalent and
+are skipped.
+
+The trigram GIN indexes cover UPPER(name) and UPPER(sku), the expressions
+Django's icontains compares; the text_pattern_ops index on UPPER(sku) serves
+SKU prefix lookups. The statements are kept here so later changes to the
+search module do not change what the migration does.
+"""
+from django.db import migrations
+
+# (index name, table, indexed expression)
+TRIGRAM_INDEXES = (
+    ('product_name_trgm_idx', 'inventory_product', 'UPPER(name::text) gin_trgm_ops'),
+    ('product_sku_trgm_idx', 'inventory_product', 'UPPER(sku::text) gin_trgm_ops'),
+    ('store_name_trgm_idx', 'inventory_store', 'UPPER(name::text) gin_trgm_ops'),
+)
+PATTERN_INDEXES = (
+    ('product_sku_prefix_idx', 'inventory_product', 'UPPER(sku::text) text_pattern_ops'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, expression in TRIGRAM_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({expression})')
+    for name, table, expression in PATTERN_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES + PATTERN_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_auditlog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='ingest_id',
+            field=models.CharField(blank=True, editable=False, max_length=41, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='stockmovement',
+            constraint=models.UniqueConstraint(fields=('ingest_id', 'timestamp'), name='movement_ingest_uniq'),
+        ),
+    ]
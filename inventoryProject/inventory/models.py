@@ -45,6 +45,7 @@ class Supplier(models.Model):
 class Store(models.Model):
     name = models.CharField(max_length=100)
     location = models.CharField(max_length=200)
+    low_stock_threshold = models.PositiveIntegerField(default=20)  # Quantities below this count as low stock
 
     def __str__(self):
         return self.name
@@ -67,9 +68,28 @@ class Stock(models.Model):
             models.Index(fields=['store', 'product']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The quantity a direct save or delete replaces, for the store summaries (see signals.py)
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+
     def __str__(self):
         return f"{self.product} at {self.store}: {self.quantity}"
 
+class StoreStockSummary(models.Model):
+    """Per-store stock status counts, maintained as movements are processed."""
+    store = models.OneToOneField(Store, on_delete=models.CASCADE, primary_key=True, related_name='stock_summary')
+    out_of_stock = models.PositiveIntegerField(default=0)
+    low_stock = models.PositiveIntegerField(default=0)
+    in_stock = models.PositiveIntegerField(default=0)
+    total_units = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.store}: {self.out_of_stock} out, {self.low_stock} low, {self.in_stock} in stock"
+
 class StockMovement(models.Model):
     MOVEMENT_TYPES = (
         ('IN', 'Stock In'),
@@ -79,14 +99,61 @@ class StockMovement(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=True)
     store = models.ForeignKey(Store, on_delete=models.CASCADE, db_index=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='stock_movements')  # Carried into the audit log by batch processing
     movement_type = models.CharField(max_length=3, choices=MOVEMENT_TYPES)
     quantity = models.PositiveIntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)  # Flag to indicate if this movement has been processed
+    ingest_id = models.CharField(max_length=41, null=True, blank=True, editable=False)  # Ingest stream entry id
+
+    class Meta:
+        constraints = [
+            # Stream entries delivered more than once are stored once; the
+            # partition key is part of every unique constraint on PostgreSQL
+            models.UniqueConstraint(fields=['ingest_id', 'timestamp'], name='movement_ingest_uniq'),
+        ]
+        indexes = [
+            # Batch drain: WHERE processed = false ORDER BY id
+            models.Index(fields=['id'], condition=models.Q(processed=False), name='movement_unprocessed_idx'),
+            # Movement history of a (store, product) pair by time
+            models.Index(fields=['store', 'product', 'timestamp'], name='movement_store_prod_ts_idx'),
+            # Supplier filter: products moved by a supplier
+            models.Index(fields=['supplier', 'product'], name='movement_supplier_prod_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product} - {self.movement_type} - {self.quantity}"
 
+class DailyStockSnapshot(models.Model):
+    """
+    Stock level and movement totals of a product at a store on one day.
+
+    Rows exist for days with processed movements. The opening and closing
+    quantities are the Stock quantity before the day's first and after its
+    last movement, in timestamp order (see snapshots); they are null for
+    days rolled up from dropped
+    movement partitions before snapshots were maintained.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    day = models.DateField()
+    opening_quantity = models.PositiveIntegerField(null=True, blank=True)
+    in_quantity = models.PositiveBigIntegerField(default=0)
+    out_quantity = models.PositiveBigIntegerField(default=0)
+    rem_quantity = models.PositiveBigIntegerField(default=0)
+    closing_quantity = models.PositiveIntegerField(null=True, blank=True)
+    movement_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also serves the date-range EXISTS filter and as-of lookups
+            models.UniqueConstraint(fields=['store', 'product', 'day'], name='snapshot_store_prod_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} at {self.store} on {self.day}"
+
 class AuditLog(models.Model):
     action = models.CharField(max_length=100)
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -95,5 +162,12 @@ class AuditLog(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
     details = models.JSONField()
 
+    class Meta:
+        indexes = [
+            # Logs listing: ORDER BY timestamp DESC, id DESC, optionally per user
+            models.Index(fields=['-timestamp', '-id'], name='auditlog_ts_id_idx'),
+            models.Index(fields=['user', '-timestamp', '-id'], name='auditlog_user_ts_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.action} at {self.timestamp}"
\ No newline at end of file
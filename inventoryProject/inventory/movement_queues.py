@@ -0,0 +1,132 @@
+"""
+Partitioned queues for stock movement processing.
+
+With STOCK_MOVEMENT_PARTITIONS set to N > 0, pending movements are split
+into N partitions by a hash of (store_id, product_id), and each partition is
+drained by process_partition_movements tasks on its own Celery queue,
+``stock_movements_<k>``. Run one worker with a single process per queue,
+e.g. ``celery -A inventoryProject worker -Q stock_movements_3 -c 1``; the
+workers may run on different nodes. Every Stock row then belongs to one
+partition whose movements one process applies in id order, so the drains
+never wait on each other's row locks and each row sees its movements in
+order. The row locks of process_movement_batch stay as a safety net for
+drains that run outside the partitions, e.g. inline when the broker is down.
+
+A partition is held by one drain at a time through a lock in the cache,
+taken for each batch, so a second consumer of a queue or a stray task
+returns instead of draining the same rows concurrently.
+
+The partition count in use (the layout) is kept in the cache and starts
+out as the setting. ``manage.py rebalance_movement_queues <count>`` changes
+it without two drains ever owning the same row: it pauses the drains, waits
+for the running batches to finish, switches the layout and then queues
+every partition. Start the workers of any new queues first, and update the
+setting too, so a flushed cache comes back to the same layout.
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Mod
+
+STOCK_MOVEMENT_PARTITIONS = getattr(settings, 'STOCK_MOVEMENT_PARTITIONS', 0)
+QUEUE_PREFIX = 'stock_movements_'
+LAYOUT_KEY = 'stock_movement_partition_layout'
+PARTITION_LOCK_TIMEOUT = 300  # seconds one batch may hold a partition at most
+HASH_MULTIPLIER = 1000003  # spreads the stores of one product over the partitions
+
+
+def queue_name(partition):
+    return f"{QUEUE_PREFIX}{partition}"
+
+
+def lock_key(partition):
+    return f"stock_movement_partition_lock_{partition}"
+
+
+def partition_of(store_id, product_id, count):
+    """Return the partition of a Stock row; matches partition_expression()."""
+    return (store_id * HASH_MULTIPLIER + product_id) % count
+
+
+def partition_expression(count):
+    """Return the partition of a row with store_id and product_id columns as a database expression."""
+    # bigint arithmetic: store_id * HASH_MULTIPLIER overflows a 32-bit integer
+    return Mod(Cast(F('store_id'), BigIntegerField()) * HASH_MULTIPLIER + F('product_id'), count)
+
+
+def get_layout():
+    """Return the layout in use: {'count': partitions, 'paused': bool}."""
+    try:
+        layout = cache.get(LAYOUT_KEY)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        layout = None
+    return layout or {'count': STOCK_MOVEMENT_PARTITIONS, 'paused': False}
+
+
+def partition_count():
+    """Return the number of partitions in use, 0 when movements share one drain."""
+    return get_layout()['count']
+
+
+def _set_layout(count, paused):
+    cache.set(LAYOUT_KEY, {'count': count, 'paused': paused}, timeout=None)
+
+
+@contextmanager
+def owning(partition):
+    """
+    Hold a partition for one batch.
+
+    Yields the partition count to drain the partition under, or None if it
+    cannot be drained now: another drain holds it, the drains are paused
+    for a rebalance, or the layout has fewer partitions.
+    """
+    try:
+        acquired = cache.add(lock_key(partition), True, timeout=PARTITION_LOCK_TIMEOUT)
+    except Exception as cache_error:
+        # Without the cache we cannot hold the partition; the row locks still apply
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        yield STOCK_MOVEMENT_PARTITIONS if partition < STOCK_MOVEMENT_PARTITIONS else None
+        return
+
+    if not acquired:
+        yield None
+        return
+    try:
+        # Read after taking the lock, so a rebalance that paused first waits for this batch
+        layout = get_layout()
+        yield None if layout['paused'] or partition >= layout['count'] else layout['count']
+    finally:
+        try:
+            cache.delete(lock_key(partition))
+        except Exception as cache_error:
+            print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+
+def rebalance(count, timeout=PARTITION_LOCK_TIMEOUT):
+    """
+    Switch the layout to count partitions once no batch is running.
+
+    Returns the previous count. Raises RuntimeError, leaving the layout
+    unchanged, if batches still hold partitions after timeout seconds.
+    Callers should queue every partition afterwards.
+    """
+    if count < 1:
+        raise ValueError("The partition count must be at least 1")
+    previous = get_layout()['count']
+    _set_layout(previous, paused=True)
+
+    partitions = [lock_key(partition) for partition in range(max(previous, count))]
+    deadline = time.monotonic() + timeout
+    while cache.get_many(partitions):
+        if time.monotonic() > deadline:
+            _set_layout(previous, paused=False)
+            raise RuntimeError(f"Movement drains still running after {timeout} seconds; layout unchanged")
+        time.sleep(0.1)
+
+    _set_layout(count, paused=False)
+    return previous
@@ -0,0 +1,344 @@
+"""
+Redis Stream ingestion of stock movements.
+
+With STOCK_MOVEMENT_INGEST = 'stream', the movement create and bulk
+endpoints validate movements as usual but, instead of inserting them,
+append them to a Redis Stream on the cache server and answer 202 Accepted.
+``manage.py consume_movement_stream`` reads the stream in a consumer group,
+stores each batch of entries as unprocessed StockMovements with one INSERT
+per chunk and queues the usual drain, which applies them to the stock.
+
+Delivery is at least once: entries are acknowledged after the transaction
+storing them commits, and entries a stalled consumer read but never
+acknowledged are taken over by another consumer. Each movement keeps its
+stream entry id as ingest_id and the time of the entry as its timestamp,
+so an entry delivered, or replayed, twice is stored once.
+
+Movements are applied in the order they are stored; run a single consumer
+to keep the order of the stream across batches. Stored entries stay in the
+stream for STOCK_MOVEMENT_STREAM_RETENTION_HOURS, so
+``manage.py replay_movement_stream`` can store again any that went missing,
+e.g. after restoring the database. stream_stats() reports the consumer lag.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import reference_cache
+from .models import Product, StockMovement, Store, Supplier, User
+from .tasks import process_pending_movements, schedule_movement_drain
+
+GROUP = 'movement_writers'
+BATCH_SIZE = getattr(settings, 'STOCK_MOVEMENT_STREAM_BATCH_SIZE', 5000)
+CLAIM_IDLE = getattr(settings, 'STOCK_MOVEMENT_STREAM_CLAIM_IDLE', 60)
+RETENTION_HOURS = getattr(settings, 'STOCK_MOVEMENT_STREAM_RETENTION_HOURS', 24)
+COLUMNS = ('store_id', 'product_id', 'supplier_id', 'created_by_id', 'movement_type', 'quantity',
+           'timestamp', 'processed', 'ingest_id')
+
+
+def is_enabled():
+    return getattr(settings, 'STOCK_MOVEMENT_INGEST', 'database') == 'stream'
+
+
+def stream_name():
+    return getattr(settings, 'STOCK_MOVEMENT_STREAM', 'stock_movement_ingest')
+
+
+def get_connection():
+    """Return the Redis connection of the cache; raises if the cache is not django_redis."""
+    from django_redis import get_redis_connection
+
+    return get_redis_connection('default')
+
+
+def append(movements):
+    """
+    Append unsaved movements to the ingest stream in one round trip.
+
+    Returns the stream entry ids, in the order of the movements. Raises if
+    Redis is unavailable so callers can store the movements directly.
+    """
+    pipe = get_connection().pipeline(transaction=False)
+    for movement in movements:
+        pipe.xadd(stream_name(), {
+            'store_id': movement.store_id,
+            'product_id': movement.product_id,
+            'supplier_id': movement.supplier_id or '',
+            'created_by_id': movement.created_by_id or '',
+            'movement_type': movement.movement_type,
+            'quantity': movement.quantity,
+        })
+    return [entry_id.decode() for entry_id in pipe.execute()]
+
+
+def _id_key(entry_id):
+    milliseconds, _, sequence = entry_id.partition('-')
+    return int(milliseconds), int(sequence or 0)
+
+
+def entry_time(entry_id):
+    """Return the time a stream entry was appended, from its id."""
+    return datetime.fromtimestamp(_id_key(entry_id)[0] / 1000, tz=dt_timezone.utc)
+
+
+def entry_id_at(value):
+    """Return the first entry id at a stream entry id or an aware datetime."""
+    if isinstance(value, datetime):
+        return f"{int(value.timestamp() * 1000)}-0"
+    return value
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _optional_int(value):
+    value = _text(value)
+    return int(value) if value else None
+
+
+def _decode(entries):
+    decoded = []
+    for entry_id, fields in entries:
+        entry_id = _text(entry_id)
+        if not fields:
+            # Trimmed before it was stored
+            print(f"Movement stream entry {entry_id} no longer exists")
+            continue
+        fields = {_text(key): value for key, value in fields.items()}
+        decoded.append((entry_id, (
+            int(fields['store_id']), int(fields['product_id']), _optional_int(fields.get('supplier_id')),
+            _optional_int(fields.get('created_by_id')), _text(fields['movement_type']), int(fields['quantity']),
+        )))
+    return decoded
+
+
+def store_entries(entries):
+    """
+    Store stream entries as unprocessed movements and queue their processing.
+
+    Entries already stored are skipped. Entries whose store, product or
+    supplier no longer exists are dropped; a missing user is cleared.
+
+    Args:
+        entries: (entry id, fields) pairs, as XRANGE and XREADGROUP return them
+
+    Returns (stored, dropped).
+    """
+    decoded = _decode(entries)
+    if not decoded:
+        return 0, 0
+
+    known_stores = reference_cache.get_many(Store, {row[0] for _, row in decoded})
+    known_products = reference_cache.get_many(Product, {row[1] for _, row in decoded})
+    known_suppliers = reference_cache.get_many(Supplier, {row[2] for _, row in decoded if row[2]})
+    user_ids = {row[3] for _, row in decoded if row[3]}
+    known_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) if user_ids else set()
+
+    rows, pairs, dropped = [], set(), 0
+    for entry_id, (store_id, product_id, supplier_id, user_id, movement_type, quantity) in decoded:
+        if store_id not in known_stores or product_id not in known_products or (
+                supplier_id and supplier_id not in known_suppliers):
+            print(f"Movement stream entry {entry_id} dropped: unknown store, product or supplier")
+            dropped += 1
+            continue
+        rows.append((
+            store_id, product_id, supplier_id, user_id if user_id in known_users else None, movement_type,
+            quantity, connection.ops.adapt_datetimefield_value(entry_time(entry_id)), False, entry_id,
+        ))
+        pairs.add((store_id, product_id))
+
+    stored = 0
+    if rows:
+        table = connection.ops.quote_name(StockMovement._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(column) for column in COLUMNS)
+        placeholder = f"({', '.join(['%s'] * len(COLUMNS))})"
+        fields = [field for field in StockMovement._meta.concrete_fields if field.column in COLUMNS]
+        chunk_size = connection.ops.bulk_batch_size(fields, rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                # The ORM would replace the timestamps: timestamp is auto_now_add
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholder] * len(chunk))} "
+                    f"ON CONFLICT DO NOTHING",
+                    [value for row in chunk for value in row]
+                )
+                stored += cursor.rowcount
+            if stored:
+                transaction.on_commit(lambda: _schedule_processing(pairs))
+    return stored, dropped
+
+
+def _schedule_processing(pairs):
+    try:
+        schedule_movement_drain(pairs)
+    except Exception as e:
+        print(f"Celery task failed: {str(e)}")
+        print("Processing stock movements directly...")
+        process_pending_movements()
+
+
+def ensure_group(conn):
+    """Create the consumer group, and the stream, unless they exist."""
+    from redis.exceptions import ResponseError
+
+    try:
+        conn.xgroup_create(stream_name(), GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def read_batch(conn, consumer, batch_size=BATCH_SIZE, block_ms=None, backlog=False):
+    """
+    Read up to batch_size entries for a consumer of the group.
+
+    With backlog, returns the entries the consumer read before without
+    acknowledging them, e.g. before a restart; otherwise new entries,
+    waiting up to block_ms milliseconds for them.
+    """
+    response = conn.xreadgroup(
+        GROUP, consumer, {stream_name(): '0' if backlog else '>'},
+        count=batch_size, block=None if backlog else block_ms
+    )
+    return response[0][1] if response else []
+
+
+def claim_stalled(conn, consumer, batch_size=BATCH_SIZE):
+    """Take over entries other consumers have not acknowledged for CLAIM_IDLE seconds."""
+    response = conn.xautoclaim(stream_name(), GROUP, consumer, min_idle_time=CLAIM_IDLE * 1000,
+                               start_id='0-0', count=batch_size)
+    return response[1]
+
+
+def consume(conn, entries):
+    """
+    Store entries read from the group, then acknowledge them.
+
+    Returns (stored, dropped).
+    """
+    if not entries:
+        return 0, 0
+    stored, dropped = store_entries(entries)
+    conn.xack(stream_name(), GROUP, *[entry_id for entry_id, _ in entries])
+    return stored, dropped
+
+
+def _group(conn):
+    from redis.exceptions import ResponseError
+
+    try:
+        groups = conn.xinfo_groups(stream_name())
+    except ResponseError:
+        # No stream yet
+        return None
+    return next((group for group in groups if _text(group['name']) == GROUP), None)
+
+
+def trim(conn):
+    """Drop entries older than the retention that the group has stored. Returns the number dropped."""
+    group = _group(conn)
+    if group is None:
+        return 0
+    min_id = f"{int((time.time() - RETENTION_HOURS * 3600) * 1000)}-0"
+    # Keep what the group has not read or acknowledged yet
+    keep = [_text(group['last-delivered-id'])]
+    pending = conn.xpending(stream_name(), GROUP)
+    if pending['pending']:
+        keep.append(_text(pending['min']))
+    min_id = min([min_id, *keep], key=_id_key)
+    return conn.xtrim(stream_name(), minid=min_id, approximate=False)
+
+
+def stream_stats():
+    """
+    Return the size of the ingest stream and the lag of its consumer group.
+
+    length counts the entries kept in the stream, unread those the group has
+    not read yet, pending those read but not yet stored and acknowledged;
+    lag_seconds is the age of the oldest entry not yet stored.
+    """
+    conn = get_connection()
+    stream = stream_name()
+    length = conn.xlen(stream)
+    group = _group(conn)
+    if group is None:
+        unread_from, pending, consumers = '-', {'pending': 0}, 0
+    else:
+        unread_from = f"({_text(group['last-delivered-id'])}"
+        pending = conn.xpending(stream, GROUP)
+        consumers = group['consumers']
+
+    first_unread = conn.xrange(stream, unread_from, '+', count=1)
+    oldest = [_text(first_unread[0][0])] if first_unread else []
+    if pending['pending']:
+        oldest.append(_text(pending['min']))
+
+    lag = group.get('lag') if group is not None else length
+    if lag is None and not first_unread:
+        lag = 0
+    return {
+        'length': length,
+        'unread': lag,  # None if Redis cannot tell (before 7.0 after trimming)
+        'pending': pending['pending'],
+        'consumers': consumers,
+        'lag_seconds': round(max(time.time() - entry_time(min(oldest, key=_id_key)).timestamp(), 0), 3)
+        if oldest else 0,
+    }
+
+
+def render_prometheus(stats):
+    """Render stream_stats() as Prometheus gauges."""
+    lines = []
+    for name, help_text in (('length', "Entries kept in the movement ingest stream"),
+                            ('unread', "Ingest stream entries not read by the consumer group"),
+                            ('pending', "Ingest stream entries read but not yet stored"),
+                            ('consumers', "Consumers of the ingest stream"),
+                            ('lag_seconds', "Age of the oldest ingest stream entry not yet stored")):
+        if stats[name] is None:
+            continue
+        lines.append(f"# HELP inventory_movement_stream_{name} {help_text}")
+        lines.append(f"# TYPE inventory_movement_stream_{name} gauge")
+        lines.append(f"inventory_movement_stream_{name} {stats[name]}")
+    return '\n'.join(lines) + '\n'
+
+
+def replay(start='-', end='+', batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Store the entries of the stream between start and end that are not stored.
+
+    Args:
+        start: First entry id or aware datetime, '-' for the oldest entry
+        end: Last entry id or aware datetime, '+' for the newest entry
+        batch_size: Entries to read and store per transaction
+        dry_run: Only count the entries that are missing from the database
+
+    Returns (read, stored, dropped); with dry_run, stored counts the
+    entries that would be stored.
+    """
+    conn = get_connection()
+    start, end = entry_id_at(start), entry_id_at(end)
+    read = stored = dropped = 0
+    while True:
+        entries = conn.xrange(stream_name(), start, end, count=batch_size)
+        if not entries:
+            break
+        read += len(entries)
+        if dry_run:
+            entry_ids = [_text(entry_id) for entry_id, _ in entries]
+            stored += len(entry_ids) - StockMovement.objects.filter(
+                ingest_id__in=entry_ids,
+                timestamp__gte=entry_time(entry_ids[0]),
+                timestamp__lte=entry_time(entry_ids[-1]),
+            ).count()
+        else:
+            batch_stored, batch_dropped = store_entries(entries)
+            stored += batch_stored
+            dropped += batch_dropped
+        if len(entries) < batch_size:
+            break
+        start = f"({_text(entries[-1][0])}"
+    return read, stored, dropped
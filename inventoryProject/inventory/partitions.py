@@ -0,0 +1,203 @@
+"""
+Monthly range partitioning for the append-only StockMovement and AuditLog tables.
+
+On PostgreSQL both tables are partitioned by ``timestamp`` into one partition
+per month (``<table>_pYYYYMM``) plus a default partition that catches rows
+outside the prepared months. The primary key becomes (id, timestamp), as
+PostgreSQL requires the partition key in every unique constraint; ids still
+come from one sequence, so Django keeps treating ``id`` as the primary key.
+
+Queries with a timestamp range only scan the partitions of that range.
+Retention drops whole partitions once they are older than the configured
+number of months, first rolling up into DailyStockSnapshot any days the
+movement processor has not already recorded there.
+
+Every function is a no-op on other database backends.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+PARTITIONED_TABLES = ('inventory_stockmovement', 'inventory_auditlog')
+MOVEMENT_TABLE = 'inventory_stockmovement'
+PARTITION_MONTHS_AHEAD = getattr(settings, 'PARTITION_MONTHS_AHEAD', 3)
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor == 'postgresql'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def list_partitions(cursor, table):
+    """Return {month: partition name} for the monthly partitions of table."""
+    cursor.execute(
+        """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+        """,
+        [table]
+    )
+    partitions = {}
+    prefix = f"{table}_p"
+    for (name,) in cursor.fetchall():
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            partitions[date(int(suffix[:4]), int(suffix[4:]), 1)] = name
+    return partitions
+
+
+def create_month_partition(cursor, table, month):
+    """
+    Create the partition of table for month.
+
+    Rows of that month already sitting in the default partition are moved
+    into the new partition, which PostgreSQL requires before the partition
+    can exist.
+    """
+    name = partition_name(table, month)
+    default = f"{table}_default"
+    start, end = _bound(month), _bound(add_months(month, 1))
+
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {_q(default)} WHERE "timestamp" >= %s AND "timestamp" < %s)',
+        [start, end]
+    )
+    (has_rows,) = cursor.fetchone()
+    if has_rows:
+        cursor.execute(f'ALTER TABLE {_q(table)} DETACH PARTITION {_q(default)}')
+
+    cursor.execute(
+        f'CREATE TABLE {_q(name)} PARTITION OF {_q(table)} FOR VALUES FROM (%s) TO (%s)',
+        [start, end]
+    )
+
+    if has_rows:
+        cursor.execute(
+            f'INSERT INTO {_q(table)} SELECT * FROM {_q(default)} WHERE "timestamp" >= %s AND "timestamp" < %s',
+            [start, end]
+        )
+        cursor.execute(
+            f'DELETE FROM {_q(default)} WHERE "timestamp" >= %s AND "timestamp" < %s',
+            [start, end]
+        )
+        cursor.execute(f'ALTER TABLE {_q(table)} ATTACH PARTITION {_q(default)} DEFAULT')
+    return name
+
+
+def ensure_partitions(months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """
+    Create the partitions for the current month and months_ahead months after it.
+
+    Returns the names of the partitions created.
+    """
+    current = month_start(today or datetime.now(dt_timezone.utc))
+    return ensure_partition_range(current, add_months(current, months_ahead))
+
+
+def ensure_partition_range(first, last):
+    """
+    Create the missing partitions for every month from first to last.
+
+    Returns the names of the partitions created.
+    """
+    if not is_supported():
+        return []
+
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            existing = list_partitions(cursor, table)
+            month = month_start(first)
+            while month <= month_start(last):
+                if month not in existing:
+                    created.append(create_month_partition(cursor, table, month))
+                month = add_months(month, 1)
+    return created
+
+
+ROLLUP_SQL = """
+    INSERT INTO inventory_dailystocksnapshot
+        (store_id, product_id, day, in_quantity, out_quantity, rem_quantity, movement_count)
+    SELECT store_id, product_id, ("timestamp" AT TIME ZONE %s)::date,
+           COALESCE(SUM(quantity) FILTER (WHERE movement_type = 'IN'), 0),
+           COALESCE(SUM(quantity) FILTER (WHERE movement_type = 'OUT'), 0),
+           COALESCE(SUM(quantity) FILTER (WHERE movement_type = 'REM'), 0),
+           COUNT(*)
+    FROM {source}
+    WHERE "timestamp" < %s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (store_id, product_id, day) DO NOTHING
+"""
+
+
+def apply_retention(table, keep_months, today=None):
+    """
+    Drop the partitions of table older than keep_months full months.
+
+    For StockMovement, days missing from DailyStockSnapshot are first rolled
+    up into it from the detail rows, in the same transaction as the drop. Partitions that still hold unprocessed movements are kept.
+    Old rows in the default partition are rolled up and deleted the same way.
+
+    Returns the names of the partitions dropped.
+    """
+    if not is_supported():
+        return []
+
+    cutoff = add_months(month_start(today or datetime.now(dt_timezone.utc)), -keep_months)
+    dropped = []
+    with connection.cursor() as cursor:
+        partitions = list_partitions(cursor, table)
+        for month in sorted(m for m in partitions if add_months(m, 1) <= cutoff):
+            name = partitions[month]
+            with transaction.atomic():
+                if table == MOVEMENT_TABLE:
+                    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {_q(name)} WHERE NOT processed)')
+                    if cursor.fetchone()[0]:
+                        print(f"Keeping {name}: it still has unprocessed movements")
+                        continue
+                    cursor.execute(ROLLUP_SQL.format(source=_q(name)), [settings.TIME_ZONE, _bound(cutoff)])
+                cursor.execute(f'DROP TABLE {_q(name)}')
+            dropped.append(name)
+
+        default = f"{table}_default"
+        with transaction.atomic():
+            condition = '"timestamp" < %s'
+            if table == MOVEMENT_TABLE:
+                condition += ' AND processed'
+                cursor.execute(
+                    ROLLUP_SQL.format(source=f'(SELECT * FROM {_q(default)} WHERE processed) AS old_rows'),
+                    [settings.TIME_ZONE, _bound(cutoff)]
+                )
+            cursor.execute(f'DELETE FROM {_q(default)} WHERE {condition}', [_bound(cutoff)])
+    return dropped
+
+
+def retention_months():
+    return {
+        'inventory_stockmovement': getattr(settings, 'STOCK_MOVEMENT_RETENTION_MONTHS', 13),
+        'inventory_auditlog': getattr(settings, 'AUDIT_LOG_RETENTION_MONTHS', 24),
+    }
@@ -0,0 +1,213 @@
+"""
+Per-process cache of Product, Store and Supplier rows.
+
+Reference data changes rarely but is read on every movement POST (foreign
+key validation), every movement listing (nested product/store/supplier) and
+every audit log name lookup. Each process keeps a bounded LRU per model with
+a time to live, so a warm process answers those reads without a query.
+
+A save or delete of a cached model invalidates the entry locally and, once
+the transaction commits, is broadcast on a Redis pub/sub channel that every
+process listens to. Updates that bypass model signals (queryset.update(),
+bulk_create) are only picked up when entries expire after
+REFERENCE_CACHE_TTL seconds. Without Redis, invalidation is local to the
+process that made the change and other processes rely on the TTL.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics
+from .models import Product, Store, Supplier
+
+REFERENCE_CACHE_SIZE = getattr(settings, 'REFERENCE_CACHE_SIZE', 10000)
+REFERENCE_CACHE_TTL = getattr(settings, 'REFERENCE_CACHE_TTL', 60)
+INVALIDATION_CHANNEL = 'inventory_reference_invalidations'
+REFERENCE_MODELS = {model._meta.label_lower: model for model in (Product, Store, Supplier)}
+
+
+class LRUCache:
+    """A thread-safe LRU mapping whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'size': size,
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+        }
+
+
+_caches = {label: LRUCache(REFERENCE_CACHE_SIZE, REFERENCE_CACHE_TTL) for label in REFERENCE_MODELS}
+_listener = {'pid': None, 'thread': None, 'invalidations': 0}
+_listener_lock = threading.Lock()
+
+
+def get_many(model, ids):
+    """
+    Return {id: instance} for the given ids that exist.
+
+    Misses are loaded with one query. Instances are built with from_db(), so
+    they behave like rows loaded from the database; callers must not modify
+    them.
+    """
+    _ensure_listener()
+    cache = _caches[model._meta.label_lower]
+    found, missing = {}, set()
+    for pk in ids:
+        if pk is None:
+            continue
+        instance = cache.get(pk)
+        if instance is None:
+            missing.add(pk)
+        else:
+            found[pk] = instance
+    metrics.record_cache(hits=len(found), misses=len(missing))
+
+    if missing:
+        for instance in model.objects.filter(pk__in=missing):
+            cache.set(instance.pk, instance)
+            found[instance.pk] = instance
+    return found
+
+
+def get(model, pk):
+    """Return the instance with the given primary key, or None if it does not exist."""
+    return get_many(model, [pk]).get(pk)
+
+
+def invalidate(model, pk):
+    """Drop an entry in this process only."""
+    cache = _caches.get(model._meta.label_lower)
+    if cache is not None:
+        cache.delete(pk)
+
+
+def broadcast_invalidation(model, pk):
+    """
+    Drop an entry here and in every other process listening on Redis.
+    """
+    invalidate(model, pk)
+    try:
+        from django_redis import get_redis_connection
+
+        message = json.dumps({'model': model._meta.label_lower, 'pk': pk})
+        get_redis_connection('default').publish(INVALIDATION_CHANNEL, message)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+
+def invalidate_on_commit(model, pk):
+    """Invalidate now and broadcast once the current transaction commits."""
+    invalidate(model, pk)
+    transaction.on_commit(lambda: broadcast_invalidation(model, pk))
+
+
+def _ensure_listener():
+    """Start the invalidation listener once per process, again after a fork."""
+    pid = os.getpid()
+    if _listener['pid'] == pid:
+        return
+    with _listener_lock:
+        if _listener['pid'] == pid:
+            return
+        if _listener['pid'] is not None:
+            # Entries inherited from the parent may have missed invalidations
+            for cache in _caches.values():
+                cache.clear()
+        _listener['pid'] = pid
+        _listener['thread'] = threading.Thread(target=_listen, name='reference-cache-invalidations', daemon=True)
+        _listener['thread'].start()
+
+
+def _listen():
+    try:
+        from django_redis import get_redis_connection
+
+        client = get_redis_connection('default')
+    except Exception as cache_error:
+        # Not a Redis cache backend: entries only expire by TTL
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return
+
+    failing = False
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations published while we were not subscribed are lost
+            for cache in _caches.values():
+                cache.clear()
+            failing = False
+            for message in pubsub.listen():
+                data = json.loads(message['data'])
+                cache = _caches.get(data['model'])
+                if cache is not None:
+                    cache.delete(data['pk'])
+                    _listener['invalidations'] += 1
+        except Exception as cache_error:
+            if not failing:
+                print(f"Cache operation failed (non-critical): {str(cache_error)}")
+            failing = True
+            time.sleep(5)
+
+
+def reference_cache_stats():
+    """Return the counters of this process's reference caches."""
+    thread = _listener['thread']
+    return {
+        'pid': os.getpid(),
+        'models': {label: cache.stats() for label, cache in _caches.items()},
+        'invalidations_received': _listener['invalidations'],
+        'listening': bool(thread is not None and thread.is_alive()),
+    }
@@ -0,0 +1,80 @@
+"""
+Product and store search for the stock endpoints.
+
+A search term matches stock rows whose product name, product SKU or store
+name contains it, case-insensitively. Instead of ORing the three predicates
+across the stock join, which scans every stock row, the matching stores and
+products are looked up first, each through its own index, and stock rows are
+found by their store and product indexes.
+
+On PostgreSQL, migration 0010 adds pg_trgm GIN indexes on UPPER(name) and
+UPPER(sku), the expressions Django's icontains compares, so substring
+searches are index scans. A text_pattern_ops index on UPPER(sku) serves SKU
+prefix lookups (the ``sku`` parameter), e.g. from barcode scanners. Other
+backends run the same queries without those indexes.
+
+Results are ranked: exact SKU, then SKU prefix, then name prefix matches
+first, and on PostgreSQL by trigram word similarity within each group.
+"""
+from django.db import connection
+from django.db.models import Case, FloatField, Func, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Product, Store
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor == 'postgresql'
+
+
+class WordSimilarity(Func):
+    """pg_trgm word_similarity(term, text): how well term matches a part of text, 0 to 1."""
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+def matching_products(search):
+    return Product.objects.filter(Q(name__icontains=search) | Q(sku__icontains=search)).values('id')
+
+
+def search_filter(search):
+    """
+    Return a Q matching stock rows whose product name or SKU, or store name,
+    contains search.
+
+    The matching stores are fetched here; there are few stores, and leaving
+    out the store condition when none match lets the database drive the
+    query from the product matches alone.
+    """
+    store_ids = list(Store.objects.filter(name__icontains=search).values_list('id', flat=True))
+    condition = Q(product_id__in=matching_products(search))
+    if store_ids:
+        condition |= Q(store_id__in=store_ids)
+    return condition
+
+
+def sku_prefix_filter(prefix):
+    """Return a Q matching stock rows whose product SKU starts with prefix."""
+    return Q(product_id__in=Product.objects.filter(sku__istartswith=prefix).values('id'))
+
+
+def rank_search(queryset, search):
+    """
+    Order a stock queryset by how well each row matches search, best first.
+
+    Ties keep a stable order by product name and id.
+    """
+    queryset = queryset.annotate(search_rank=Case(
+        When(product__sku__iexact=search, then=Value(3)),
+        When(product__sku__istartswith=search, then=Value(2)),
+        When(Q(product__name__istartswith=search) | Q(store__name__istartswith=search), then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+    if not is_supported(connection):
+        return queryset.order_by('-search_rank', 'product__name', 'id')
+    queryset = queryset.annotate(search_similarity=Greatest(
+        WordSimilarity(Value(search), 'product__name'),
+        WordSimilarity(Value(search), 'store__name'),
+    ))
+    return queryset.order_by('-search_rank', '-search_similarity', 'product__name', 'id')
@@ -1,6 +1,76 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
+from . import reference_cache
 from .models import Product, StockMovement, Store, Supplier, Stock, User, AuditLog
 
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that validates ids against the reference cache."""
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            instance = reference_cache.get(self.get_queryset().model, int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class CachedNestedField(serializers.Field):
+    """
+    Read-only nested representation of a reference row.
+
+    The row is looked up in the reference cache by the parent's <field>_id
+    attribute instead of being lazy-loaded through the relation.
+    """
+
+    def __init__(self, serializer_class, **kwargs):
+        self.serializer_class = serializer_class
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        pk = getattr(obj, f'{self.field_name}_id')
+        prefetched = getattr(self.parent, '_prefetched_references', {}).get(self.field_name)
+        if prefetched is not None and pk in prefetched:
+            instance = prefetched[pk]
+        else:
+            instance = reference_cache.get(self.serializer_class.Meta.model, pk)
+        return self.serializer_class(instance).data if instance is not None else None
+
+
+class CachedReferenceListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer that loads the reference rows of every CachedNestedField
+    for the whole list at once, so a cold cache costs one query per model
+    instead of one per distinct id, and hands them to the fields.
+    """
+
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        # Kept for the whole list, so entries expiring meanwhile are not reloaded row by row
+        self.child._prefetched_references = {
+            field.field_name: reference_cache.get_many(
+                field.serializer_class.Meta.model,
+                {getattr(row, f'{field.field_name}_id') for row in rows}
+            )
+            for field in self.child.fields.values()
+            if isinstance(field, CachedNestedField)
+        }
+        try:
+            return super().to_representation(rows)
+        finally:
+            del self.child._prefetched_references
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -17,6 +87,10 @@ class StoreSerializer(serializers.ModelSerializer):
         model = Store
         fields = ['id', 'name', 'location']
 
+class StoreDetailSerializer(StoreSerializer):
+    class Meta(StoreSerializer.Meta):
+        fields = StoreSerializer.Meta.fields + ['low_stock_threshold']
+
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -35,16 +109,16 @@ class StockSerializer(serializers.ModelSerializer):
         return obj.store.location if obj.store and obj.store.location else 'N/A'
 
 class StockMovementSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
-    product_id = serializers.PrimaryKeyRelatedField(
+    product = CachedNestedField(ProductSerializer)
+    product_id = CachedPrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
     )
-    store = StoreSerializer(read_only=True)
-    store_id = serializers.PrimaryKeyRelatedField(
+    store = CachedNestedField(StoreSerializer)
+    store_id = CachedPrimaryKeyRelatedField(
         queryset=Store.objects.all(), source='store', write_only=True
     )
-    supplier = SupplierSerializer(read_only=True)
-    supplier_id = serializers.PrimaryKeyRelatedField(
+    supplier = CachedNestedField(SupplierSerializer)
+    supplier_id = CachedPrimaryKeyRelatedField(
         queryset=Supplier.objects.all(), source='supplier', write_only=True, required=False
     )
 
@@ -52,6 +126,7 @@ class StockMovementSerializer(serializers.ModelSerializer):
         model = StockMovement
         fields = ['id', 'product', 'product_id', 'store', 'store_id', 
                  'supplier', 'supplier_id', 'movement_type', 'quantity', 'timestamp']
+        list_serializer_class = CachedReferenceListSerializer
 
 class AuditLogSerializer(serializers.ModelSerializer):
     user_email = serializers.SerializerMethodField()
@@ -66,7 +141,80 @@ class AuditLogSerializer(serializers.ModelSerializer):
         return obj.user.email if obj.user else 'System'
     
     def get_store_name(self, obj):
-        return obj.store.name if obj.store else None
+        store = reference_cache.get(Store, obj.store_id)
+        return store.name if store else None
     
     def get_product_name(self, obj):
-        return obj.product.name if obj.product else None
\ No newline at end of file
+        product = reference_cache.get(Product, obj.product_id)
+        return product.name if product else None
+
+class FlatSerializer:
+    """
+    Read-only serializer that builds rows straight from values_list() tuples.
+
+    Subclasses declare the queryset columns to fetch once and turn each tuple
+    into an output row, keeping the JSON shape of the ModelSerializer they
+    mirror without running DRF field machinery per row.
+    """
+    columns = ()
+
+    def to_row(self, values):
+        raise NotImplementedError
+
+    def serialize(self, queryset):
+        return list(map(self.to_row, queryset.values_list(*self.columns)))
+
+    def iter_rows(self, queryset, chunk_size=2000):
+        rows = queryset.values_list(*self.columns).iterator(chunk_size=chunk_size)
+        return map(self.to_row, rows)
+
+    async def aserialize(self, queryset):
+        return [self.to_row(values) async for values in queryset.values_list(*self.columns)]
+
+    async def aiter_rows(self, queryset, chunk_size=2000):
+        # values_list().aiterator() starts its query on the event loop, which
+        # Django refuses, so chunks of iter_rows() are fetched in a thread
+        rows = self.iter_rows(queryset, chunk_size)
+        fetch = sync_to_async(lambda: list(islice(rows, chunk_size)))
+        while chunk := await fetch():
+            for row in chunk:
+                yield row
+
+
+class StockFlatSerializer(FlatSerializer):
+    """Flat counterpart of StockSerializer."""
+    columns = ('id', 'store_id', 'store__name', 'store__location',
+               'product_id', 'product__name', 'product__sku', 'quantity')
+
+    def to_row(self, values):
+        stock_id, store_id, store_name, location, product_id, product_name, sku, quantity = values
+        return {
+            'id': stock_id,
+            'store': {'id': store_id, 'name': store_name, 'location': location},
+            'product': {'id': product_id, 'name': product_name, 'sku': sku},
+            'quantity': quantity,
+            'location': location or 'N/A',
+        }
+
+
+class StockAsOfFlatSerializer(StockFlatSerializer):
+    """StockFlatSerializer reporting a quantity_as_of annotation as the quantity."""
+    columns = StockFlatSerializer.columns[:-1] + ('quantity_as_of',)
+
+
+class AuditLogFlatSerializer(FlatSerializer):
+    """Flat counterpart of AuditLogSerializer."""
+    columns = ('id', 'action', 'timestamp', 'user__email', 'store__name', 'product__name', 'details')
+    timestamp_field = serializers.DateTimeField()
+
+    def to_row(self, values):
+        log_id, action, timestamp, user_email, store_name, product_name, details = values
+        return {
+            'id': log_id,
+            'action': action,
+            'timestamp': self.timestamp_field.to_representation(timestamp),
+            'user_email': user_email if user_email is not None else 'System',
+            'store_name': store_name,
+            'product_name': product_name,
+            'details': details,
+        }
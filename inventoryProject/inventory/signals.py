@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import reference_cache, stock_cache, stock_events, versions
+from .models import Product, Stock, Store, Supplier
+from .summaries import apply_summary_deltas, rebuild_store_summaries, summary_deltas
+
+
+@receiver(post_save, sender=Store)
+def store_saved(sender, instance, **kwargs):
+    """
+    Refresh cached thresholds and the stock summary after a store changes.
+
+    Changing low_stock_threshold moves SKUs between the low and in stock
+    buckets, so the store's summary is rebuilt once the save commits. The
+    cached stock rows copy the store's name and location and are dropped.
+    """
+    transaction.on_commit(lambda: stock_cache.invalidate_store_thresholds([instance.id]))
+    transaction.on_commit(lambda: stock_cache.invalidate_catalog_rows(store_ids=[instance.id]))
+    reference_cache.invalidate_on_commit(Store, instance.id)
+    versions.bump_catalog()
+    versions.bump_stores([instance.id])
+    transaction.on_commit(lambda: rebuild_store_summaries([instance.id]))
+
+
+@receiver(post_delete, sender=Store)
+def store_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: stock_cache.invalidate_store_thresholds([instance.id]))
+    transaction.on_commit(lambda: stock_cache.invalidate_store_sheets([instance.id]))
+    reference_cache.invalidate_on_commit(Store, instance.id)
+    versions.bump_catalog()
+    versions.bump_stores([instance.id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def reference_changed(sender, instance, **kwargs):
+    """
+    Drop a changed product or supplier from every process's reference cache,
+    and the cached stock rows that copy a saved product's name and SKU.
+    """
+    reference_cache.invalidate_on_commit(sender, instance.pk)
+    versions.bump_catalog()
+    if sender is Product and kwargs['signal'] is post_save:
+        transaction.on_commit(lambda: stock_cache.invalidate_catalog_rows(product_ids=[instance.pk]))
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def stock_changed(sender, instance, **kwargs):
+    """
+    Keep the store's summary, cached stock and version current after a Stock
+    row is saved or deleted directly, e.g. in the admin, and have its event
+    subscribers reload it.
+
+    The movement processors update quantities without saving and do all of
+    this themselves; the rows apply_stock_movement creates with save() are
+    counted here at quantity 0.
+    """
+    created = kwargs.get('created', False)
+    deleted = kwargs['signal'] is post_delete
+    old = None if created else getattr(instance, '_loaded_quantity', None)
+    if old is None and not created:
+        # Saved without being loaded first: the replaced quantity is unknown
+        transaction.on_commit(lambda: rebuild_store_summaries([instance.store_id]))
+    else:
+        threshold = stock_cache.get_low_stock_threshold(instance.store_id)
+        if threshold is not None:
+            apply_summary_deltas(instance.store_id, summary_deltas(
+                [(old, None if deleted else instance.quantity)], threshold
+            ), rebuild_missing=not deleted)
+    instance._loaded_quantity = None if deleted else instance.quantity
+
+    pair = (instance.store_id, instance.product_id)
+    transaction.on_commit(lambda: stock_cache.invalidate_stock_entries([pair]))
+    if created or deleted:
+        transaction.on_commit(lambda: stock_cache.invalidate_store_sheets([instance.store_id]))
+    versions.bump_stores([instance.store_id])
+    if not created:
+        stock_events.publish_resync_on_commit([instance.store_id])
@@ -0,0 +1,335 @@
+"""
+Daily stock snapshots.
+
+DailyStockSnapshot holds, per (store, product, day), the opening quantity,
+the IN/OUT/REM totals and the closing quantity. Movement processing records
+each applied movement here, so date-range filters and "stock on day D"
+lookups read one indexed row per product instead of scanning StockMovement.
+Days are in the project's TIME_ZONE.
+
+A movement is recorded on the day of its timestamp, but applied to the
+quantity when it is processed. When it is dated before days that already
+have snapshots, e.g. a stream entry replayed late, the opening and closing
+quantities of those later days are shifted by the change it made, as if it
+had been processed in timestamp order. The shift is exact unless a sale
+clamped to zero would have clamped differently in that order; the shifted
+quantities are then approximate and never negative.
+"""
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Exists, F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import versions
+from .models import DailyStockSnapshot, Stock, StockMovement, Store
+
+MOVEMENT_TOTAL_FIELDS = {'IN': 'in_quantity', 'OUT': 'out_quantity', 'REM': 'rem_quantity'}
+SNAPSHOT_FIELDS = ('opening_quantity', 'in_quantity', 'out_quantity', 'rem_quantity',
+                   'closing_quantity', 'movement_count')
+
+
+def snapshot_day(timestamp):
+    """Return the snapshot day of a movement timestamp."""
+    return timezone.localdate(timestamp)
+
+
+def day_start(day):
+    """Return the first moment of a snapshot day."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_day(value):
+    """Parse a 'YYYY-MM-DD' string, returning None when missing or invalid."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+
+
+def daily_totals(changes):
+    """
+    Fold applied movements into per-(store, product, day) snapshot values.
+
+    Args:
+        changes: Iterable of (store_id, product_id, timestamp, movement_type,
+            amount, quantity_before, quantity_after), in the order the
+            movements were applied
+    """
+    days = {}
+    for store_id, product_id, timestamp, movement_type, amount, before, after in changes:
+        key = (store_id, product_id, snapshot_day(timestamp))
+        totals = days.get(key)
+        if totals is None:
+            totals = days[key] = {'opening_quantity': before, 'in_quantity': 0, 'out_quantity': 0,
+                                  'rem_quantity': 0, 'movement_count': 0}
+        totals[MOVEMENT_TOTAL_FIELDS[movement_type]] += amount
+        totals['movement_count'] += 1
+        totals['closing_quantity'] = after
+    return days
+
+
+def record_snapshots(changes):
+    """
+    Record applied movements in the daily snapshots.
+
+    Must run in the transaction that holds the affected Stock row locks, which
+    serializes snapshot writes per (store, product).
+
+    Args:
+        changes: As for daily_totals
+    """
+    changes = list(changes)
+    days = daily_totals(changes)
+    if not days:
+        return
+
+    first_days = {}
+    for store_id, product_id, day in days:
+        first_days[store_id, product_id] = min(day, first_days.get((store_id, product_id), day))
+    existing = {
+        (snapshot.store_id, snapshot.product_id, snapshot.day): snapshot
+        for snapshot in DailyStockSnapshot.objects.filter(
+            store_id__in={store_id for store_id, _ in first_days},
+            product_id__in={product_id for _, product_id in first_days},
+            day__gte=min(first_days.values()),
+        )
+        if (snapshot.store_id, snapshot.product_id) in first_days
+        and first_days[snapshot.store_id, snapshot.product_id] <= snapshot.day
+    }
+
+    # Pairs with snapshots after the first day they moved on got back-dated movements
+    backdated = {
+        (store_id, product_id) for store_id, product_id, day in existing
+        if day > first_days[store_id, product_id]
+    }
+    updated, created = [], []
+    if backdated:
+        shifted_updated, shifted_created = shift_backdated(
+            [change for change in changes if (change[0], change[1]) in backdated],
+            {key: snapshot for key, snapshot in existing.items() if key[:2] in backdated},
+        )
+        updated.extend(shifted_updated)
+        created.extend(shifted_created)
+
+    for (store_id, product_id, day), totals in days.items():
+        if (store_id, product_id) in backdated:
+            continue
+        snapshot = existing.get((store_id, product_id, day))
+        if snapshot is None:
+            created.append(DailyStockSnapshot(store_id=store_id, product_id=product_id, day=day, **totals))
+            continue
+        for field in ('in_quantity', 'out_quantity', 'rem_quantity', 'movement_count'):
+            setattr(snapshot, field, getattr(snapshot, field) + totals[field])
+        if snapshot.opening_quantity is None:
+            snapshot.opening_quantity = totals['opening_quantity']
+        snapshot.closing_quantity = totals['closing_quantity']
+        updated.append(snapshot)
+
+    if updated:
+        DailyStockSnapshot.objects.bulk_update(updated, SNAPSHOT_FIELDS, batch_size=1000)
+    if created:
+        DailyStockSnapshot.objects.bulk_create(created, batch_size=1000)
+
+
+def shift_backdated(changes, existing):
+    """
+    Record movements dated before existing snapshots of their Stock rows.
+
+    Every snapshot from the first movement's day on gets the opening and
+    closing quantities it would have had if the movements had been
+    processed in timestamp order: the quantity before them, from the
+    existing snapshots, plus the changes they made on earlier days.
+
+    Args:
+        changes: As for daily_totals
+        existing: {(store_id, product_id, day): DailyStockSnapshot} of the
+            Stock rows, from the day of their first movement on
+
+    Returns (updated snapshots, new snapshots).
+    """
+    deltas, live_before = {}, {}
+    for store_id, product_id, timestamp, movement_type, amount, before, after in changes:
+        key = (store_id, product_id, snapshot_day(timestamp))
+        deltas[key] = deltas.get(key, 0) + after - before
+        live_before.setdefault((store_id, product_id), before)
+    days = daily_totals(changes)
+
+    updated, created = [], []
+    for pair, quantity in live_before.items():
+        old = {
+            day: (snapshot.opening_quantity, snapshot.closing_quantity)
+            for (store_id, product_id, day), snapshot in existing.items() if (store_id, product_id) == pair
+        }
+        old_days = sorted(old)
+
+        def old_end(day):
+            """The quantity at the end of day before these movements."""
+            for old_day in reversed(old_days):
+                if old_day <= day and old[old_day][1] is not None:
+                    return old[old_day][1]
+            for old_day in old_days:
+                if old_day > day and old[old_day][0] is not None:
+                    return old[old_day][0]
+            return quantity
+
+        shift = 0
+        for day in sorted(set(old_days) | {key[2] for key in deltas if key[:2] == pair}):
+            key = pair + (day,)
+            opening = old[day][0] if day in old and old[day][0] is not None else old_end(day - timedelta(days=1))
+            opening = max(opening + shift, 0)
+            shift += deltas.get(key, 0)
+            closing = max(old_end(day) + shift, 0)
+
+            snapshot = existing.get(key)
+            totals = days.get(key)
+            if snapshot is None:
+                created.append(DailyStockSnapshot(
+                    store_id=pair[0], product_id=pair[1], day=day,
+                    **{**totals, 'opening_quantity': opening, 'closing_quantity': closing},
+                ))
+                continue
+            if totals is not None:
+                for field in ('in_quantity', 'out_quantity', 'rem_quantity', 'movement_count'):
+                    setattr(snapshot, field, getattr(snapshot, field) + totals[field])
+            snapshot.opening_quantity = opening
+            snapshot.closing_quantity = closing
+            updated.append(snapshot)
+    return updated, created
+
+
+def snapshot_date_filter(start_date, end_date):
+    """
+    Build a Stock filter matching rows with movements between two days.
+
+    Dates are 'YYYY-MM-DD' strings and either may be missing or invalid, in
+    which case that bound is ignored. Both bounds are inclusive. Processed
+    movements are found through their snapshots; movements still waiting to
+    be processed have none yet and are matched on StockMovement, whose
+    pending rows are few.
+    """
+    snapshots = DailyStockSnapshot.objects.filter(
+        store_id=OuterRef('store_id'),
+        product_id=OuterRef('product_id'),
+    )
+    pending = StockMovement.objects.filter(
+        store_id=OuterRef('store_id'),
+        product_id=OuterRef('product_id'),
+        processed=False,
+    )
+    start, end = parse_day(start_date), parse_day(end_date)
+    if start:
+        snapshots = snapshots.filter(day__gte=start)
+        pending = pending.filter(timestamp__gte=day_start(start))
+    if end:
+        snapshots = snapshots.filter(day__lte=end)
+        pending = pending.filter(timestamp__lt=day_start(end + timedelta(days=1)))
+    return Exists(snapshots) | Exists(pending)
+
+
+def quantity_as_of(day):
+    """
+    Build a Stock annotation with the quantity at the end of day.
+
+    That is the closing quantity of the last snapshot up to day, else the
+    opening quantity of the first snapshot after it, else the current
+    quantity when nothing has moved since.
+    """
+    snapshots = DailyStockSnapshot.objects.filter(store_id=OuterRef('store_id'), product_id=OuterRef('product_id'))
+    return Coalesce(
+        Subquery(snapshots.filter(day__lte=day, closing_quantity__isnull=False)
+                 .order_by('-day').values('closing_quantity')[:1]),
+        Subquery(snapshots.filter(day__gt=day, opening_quantity__isnull=False)
+                 .order_by('day').values('opening_quantity')[:1]),
+        F('quantity'),
+    )
+
+
+def starting_quantity(movements, closing):
+    """
+    Return the quantity before a sequence of movements that leaves closing.
+
+    Every movement maps a quantity x to max(x + c, d): stock in adds, sales
+    and removals subtract and clamp at zero. The whole sequence therefore
+    does too, which can be solved for the starting quantity. When the last
+    clamp to zero hides it, the largest starting quantity that still ends at
+    closing is returned.
+
+    Args:
+        movements: (movement_type, amount) pairs in the order they were applied
+        closing: The quantity after the last movement
+    """
+    offset, floor = 0, None
+    for movement_type, amount in movements:
+        if movement_type == 'IN':
+            offset += amount
+            floor = None if floor is None else floor + amount
+        elif movement_type in ('OUT', 'REM'):
+            offset -= amount
+            floor = 0 if floor is None else max(floor - amount, 0)
+    if floor is None or closing > floor:
+        return max(closing - offset, 0)
+    return max(floor - offset, 0)
+
+
+def rebuild_snapshots(store_ids=None):
+    """
+    Recompute snapshots from the processed movements still stored.
+
+    Days from the oldest stored movement onwards are replaced; older rows,
+    rolled up from dropped partitions, are kept. Each product's movements are
+    replayed forward from the starting quantity that leads to its current
+    Stock quantity; levels before a sale clamped to zero cannot be recovered
+    exactly (see starting_quantity).
+
+    Args:
+        store_ids: Optional list of store ids; all stores when omitted
+
+    Returns the number of snapshot rows written.
+    """
+    from .tasks import apply_movement
+
+    first = StockMovement.objects.filter(processed=True).aggregate(first=Min('timestamp'))['first']
+    if first is None:
+        return 0
+    first_day = snapshot_day(first)
+
+    stores = Store.objects.all()
+    if store_ids is not None:
+        stores = stores.filter(id__in=store_ids)
+
+    written = 0
+    for store_id in stores.values_list('id', flat=True):
+        with transaction.atomic():
+            # Holding the Stock locks keeps movement processing out of this store meanwhile
+            current = dict(
+                Stock.objects.select_for_update().filter(store_id=store_id).values_list('product_id', 'quantity')
+            )
+            movements = (
+                StockMovement.objects.filter(store_id=store_id, processed=True)
+                .order_by('product_id', 'id')
+                .values_list('product_id', 'movement_type', 'quantity', 'timestamp')
+            )
+
+            snapshots = []
+            for product_id, rows in groupby(movements.iterator(chunk_size=2000), key=itemgetter(0)):
+                rows = list(rows)
+                quantity = starting_quantity([(row[1], row[2]) for row in rows], current.get(product_id, 0))
+                changes = []
+                for _, movement_type, amount, timestamp in rows:
+                    after = apply_movement(quantity, movement_type, amount)
+                    changes.append((store_id, product_id, timestamp, movement_type, amount, quantity, after))
+                    quantity = after
+                snapshots.extend(
+                    DailyStockSnapshot(store_id=store_id, product_id=product_id, day=day, **totals)
+                    for (_, _, day), totals in daily_totals(changes).items()
+                )
+
+            DailyStockSnapshot.objects.filter(store_id=store_id, day__gte=first_day).delete()
+            DailyStockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+            versions.bump_stores([store_id])
+            written += len(snapshots)
+    return written
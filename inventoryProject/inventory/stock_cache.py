@@ -0,0 +1,393 @@
+"""
+Read-through cache for stock levels.
+
+Single Stock rows are cached under ``stock_{store_id}_{product_id}`` in the
+same shape StockSerializer produces (built by StockFlatSerializer). A
+per-store sheet under ``stock_sheet_{store_id}`` holds the ordered product ids
+of that store, so a store's stock list is one sheet lookup plus one get_many
+of its rows.
+
+Entries are populated on read and reloaded once a transaction that moved
+their quantity commits. Rows copy the names of their store and product, so
+they are dropped, with the sheets listing them, when a store or product
+changes. All keys carry STOCK_CACHE_VERSION, so bumping the
+setting retires every entry at once. Cache failures never break a request;
+callers fall back to the database. The async variants (aget_stock() ...)
+serve hits to the async views without leaving the event loop.
+
+Every entry is stored as (stamp, value) next to a ``{key}_stamp`` key.
+Invalidating an entry writes a fresh stamp, and a reader stores what it
+loaded under the stamp it saw before querying the database. An entry only
+counts as cached while its stamp is current, so a reader that loaded a
+quantity before a movement committed cannot leave it in the cache after the
+movement's invalidation.
+"""
+import random
+import time
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import async_cache, metrics
+from .db_router import primary_reads
+from .models import Stock, Store
+from .serializers import StockFlatSerializer
+
+STOCK_CACHE_VERSION = getattr(settings, 'STOCK_CACHE_VERSION', 1)
+STOCK_CACHE_TIMEOUT = getattr(settings, 'STOCK_CACHE_TIMEOUT', 300)
+STOCK_CACHE_LOCK_TIMEOUT = 5  # seconds a rebuild lock is held at most
+STOCK_CACHE_LOCK_WAIT = 0.5  # seconds a reader waits for another rebuild
+
+HITS_KEY = 'stock_cache_hits'
+MISSES_KEY = 'stock_cache_misses'
+
+
+def stock_key(store_id, product_id):
+    return f"stock_{store_id}_{product_id}"
+
+
+def sheet_key(store_id):
+    return f"stock_sheet_{store_id}"
+
+
+def threshold_key(store_id):
+    return f"store_threshold_{store_id}"
+
+
+def _timeout():
+    # Spread expiries so entries written together do not all expire together
+    return int(STOCK_CACHE_TIMEOUT * random.uniform(0.9, 1.1))
+
+
+def _count(key, delta):
+    if not delta:
+        return
+    try:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, timeout=None)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+
+def stamp_key(key):
+    return f"{key}_stamp"
+
+
+def _new_stamps(keys):
+    """Give keys a fresh stamp, which makes their stored entries stale."""
+    stamp = uuid4().hex
+    cache.set_many({stamp_key(key): stamp for key in keys}, timeout=STOCK_CACHE_TIMEOUT * 2,
+                   version=STOCK_CACHE_VERSION)
+    return {key: stamp for key in keys}
+
+
+def _current(keys, fetched):
+    """
+    Return {key: value} of the entries in fetched whose stamp is current.
+
+    Args:
+        keys: The entry keys
+        fetched: A get_many() result for the keys and their stamp keys
+    """
+    values = {}
+    for key in keys:
+        entry = fetched.get(key)
+        stamp = fetched.get(stamp_key(key))
+        if stamp is not None and isinstance(entry, tuple) and len(entry) == 2 and entry[0] == stamp:
+            values[key] = entry[1]
+    return values
+
+
+def _lookup(keys):
+    """
+    Return ({key: value} of the current entries, {key: stamp}) for keys.
+
+    The stamps are read before the caller queries the database and are passed
+    back to _store(). Keys without a stamp, e.g. after it expired, get one.
+    """
+    keys = list(keys)
+    fetched = cache.get_many(keys + [stamp_key(key) for key in keys], version=STOCK_CACHE_VERSION)
+    stamps = {key: fetched[stamp_key(key)] for key in keys if stamp_key(key) in fetched}
+    unstamped = [key for key in keys if key not in stamps]
+    if unstamped:
+        stamps.update(_new_stamps(unstamped))
+    return _current(keys, fetched), stamps
+
+
+def _store(values, stamps):
+    """Store loaded values under the stamps _lookup() returned before loading them."""
+    if values:
+        cache.set_many(
+            {key: (stamps[key], value) for key, value in values.items()},
+            timeout=_timeout(), version=STOCK_CACHE_VERSION
+        )
+
+
+def _invalidate(keys):
+    """Make the entries of keys stale and drop them. Returns the new stamps."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    try:
+        stamps = _new_stamps(keys)
+        cache.delete_many(keys, version=STOCK_CACHE_VERSION)
+        return stamps
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return {}
+
+
+def _read_through(key, compute):
+    """
+    Return (value, hit) for key, computing and storing it on a miss.
+
+    Only one caller rebuilds a missing key at a time; the others wait briefly
+    for it to appear and only query the database themselves if it does not.
+    """
+    values, stamps = _lookup([key])
+    if key in values:
+        return values[key], True
+
+    lock_key = f"{key}_lock"
+    if cache.add(lock_key, True, timeout=STOCK_CACHE_LOCK_TIMEOUT, version=STOCK_CACHE_VERSION):
+        try:
+            # A lagging replica could put an already superseded value in the cache
+            with primary_reads():
+                value = compute()
+            if value is not None:
+                _store({key: value}, stamps)
+        finally:
+            cache.delete(lock_key, version=STOCK_CACHE_VERSION)
+        return value, False
+
+    deadline = time.monotonic() + STOCK_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        values = _current([key], cache.get_many([key, stamp_key(key)], version=STOCK_CACHE_VERSION))
+        if key in values:
+            return values[key], False
+    return compute(), False
+
+
+def serialize_stocks(queryset):
+    """Serialize Stock rows into the cached row shape."""
+    return StockFlatSerializer().serialize(queryset)
+
+
+def get_stock(store_id, product_id):
+    """
+    Return the serialized Stock row for a store and product, or None.
+    """
+    def load():
+        rows = serialize_stocks(Stock.objects.filter(store_id=store_id, product_id=product_id))
+        return rows[0] if rows else None
+
+    try:
+        row, hit = _read_through(stock_key(store_id, product_id), load)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return load()
+
+    _count(HITS_KEY if hit else MISSES_KEY, 1)
+    metrics.record_cache(hits=int(hit), misses=int(not hit))
+    return row
+
+
+def get_store_stock(store_id):
+    """
+    Return the serialized Stock rows of a store ordered by product name.
+    """
+    def load_rows(product_ids=None):
+        queryset = Stock.objects.filter(store_id=store_id).order_by('product__name', 'id')
+        if product_ids is not None:
+            queryset = queryset.filter(product_id__in=product_ids)
+        return serialize_stocks(queryset)
+
+    def load_sheet():
+        return list(
+            Stock.objects.filter(store_id=store_id).order_by('product__name', 'id')
+            .values_list('product_id', flat=True)
+        )
+
+    try:
+        product_ids, _ = _read_through(sheet_key(store_id), load_sheet)
+        keys = [stock_key(store_id, product_id) for product_id in product_ids]
+        cached, stamps = _lookup(keys)
+
+        missing = [product_id for product_id, key in zip(product_ids, keys) if key not in cached]
+        if missing:
+            with primary_reads():
+                loaded = {stock_key(store_id, row['product']['id']): row for row in load_rows(missing)}
+            _store(loaded, stamps)
+            cached.update(loaded)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return load_rows()
+
+    _count(HITS_KEY, len(keys) - len(missing))
+    _count(MISSES_KEY, len(missing))
+    metrics.record_cache(hits=len(keys) - len(missing), misses=len(missing))
+    return [cached[key] for key in keys if key in cached]
+
+
+def get_low_stock_threshold(store_id):
+    """
+    Return a store's low stock threshold.
+    """
+    def load():
+        return Store.objects.filter(id=store_id).values_list('low_stock_threshold', flat=True).first()
+
+    try:
+        threshold, hit = _read_through(threshold_key(store_id), load)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return load()
+    metrics.record_cache(hits=int(hit), misses=int(not hit))
+    return threshold
+
+
+async def _acurrent(keys):
+    keys = list(keys)
+    fetched = await async_cache.aget_many(keys + [stamp_key(key) for key in keys], version=STOCK_CACHE_VERSION)
+    return _current(keys, fetched)
+
+
+async def aget_stock(store_id, product_id):
+    """
+    Async get_stock(): a cached row is served on the event loop, a miss by
+    get_stock() in a thread.
+    """
+    key = stock_key(store_id, product_id)
+    try:
+        cached = await _acurrent([key])
+        if key in cached:
+            await async_cache.aincr_counters({HITS_KEY: 1})
+            metrics.record_cache(hits=1)
+            return cached[key]
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+    return await sync_to_async(get_stock)(store_id, product_id)
+
+
+async def aget_store_stock(store_id):
+    """
+    Async get_store_stock(): served on the event loop when the store's sheet
+    and all of its rows are cached, else by get_store_stock() in a thread.
+    """
+    try:
+        sheet = await _acurrent([sheet_key(store_id)])
+        if sheet:
+            keys = [stock_key(store_id, product_id) for product_id in sheet[sheet_key(store_id)]]
+            cached = await _acurrent(keys)
+            if len(cached) == len(keys):
+                await async_cache.aincr_counters({HITS_KEY: len(keys)})
+                metrics.record_cache(hits=len(keys))
+                return [cached[key] for key in keys]
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+    return await sync_to_async(get_store_stock)(store_id)
+
+
+async def aget_low_stock_threshold(store_id):
+    """Async get_low_stock_threshold()."""
+    key = threshold_key(store_id)
+    try:
+        cached = await _acurrent([key])
+        if key in cached:
+            metrics.record_cache(hits=1)
+            return cached[key]
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+    return await sync_to_async(get_low_stock_threshold)(store_id)
+
+
+def refresh_stock_entries(pairs):
+    """
+    Reload cached Stock rows after their quantities changed.
+
+    Must run after the change committed, e.g. from transaction.on_commit(), so
+    the reload cannot read the quantity it replaces. The rows are invalidated
+    first, which also discards what concurrent readers loaded before the
+    commit; rows that were not cached are left to the next read.
+
+    Args:
+        pairs: The (store_id, product_id) pairs whose quantities changed
+    """
+    # Imported here: tasks imports this module
+    from .tasks import pair_filter
+
+    pairs = list(pairs)
+    if not pairs:
+        return
+    keys = [stock_key(*pair) for pair in pairs]
+    try:
+        cached = cache.get_many(keys, version=STOCK_CACHE_VERSION)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        cached = {}
+    stamps = _invalidate(keys)
+    reload = [pair for pair, key in zip(pairs, keys) if key in cached]
+    if not reload or not stamps:
+        return
+    try:
+        with primary_reads():
+            rows = serialize_stocks(Stock.objects.filter(pair_filter(reload)))
+        _store({stock_key(row['store']['id'], row['product']['id']): row for row in rows}, stamps)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+
+def invalidate_stock_entries(pairs):
+    """Drop cached Stock rows for the given (store_id, product_id) pairs."""
+    _invalidate(stock_key(*pair) for pair in pairs)
+
+
+def invalidate_store_sheets(store_ids):
+    """Drop cached store sheets, e.g. after Stock rows were added to a store."""
+    _invalidate(sheet_key(store_id) for store_id in store_ids)
+
+
+def invalidate_catalog_rows(store_ids=(), product_ids=()):
+    """
+    Drop the cached rows of the given stores and products, and the sheets
+    listing them, after their names or other copied fields changed.
+    """
+    try:
+        with primary_reads():
+            pairs = list(Stock.objects.filter(
+                Q(store_id__in=store_ids) | Q(product_id__in=product_ids)
+            ).values_list('store_id', 'product_id'))
+    except Exception as db_error:
+        print(f"Stock cache invalidation failed: {str(db_error)}")
+        return
+    invalidate_stock_entries(pairs)
+    # Sheets are ordered by product name
+    invalidate_store_sheets({store_id for store_id, _ in pairs} | set(store_ids))
+
+
+def invalidate_store_thresholds(store_ids):
+    """Drop cached low stock thresholds after stores change."""
+    _invalidate(threshold_key(store_id) for store_id in store_ids)
+
+
+def stock_cache_stats():
+    """Return the shared hit/miss counters of the stock cache."""
+    try:
+        counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        counters = {}
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        'version': STOCK_CACHE_VERSION,
+        'timeout': STOCK_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,322 @@
+"""
+Real-time stock change events.
+
+The movement processors publish the stock changes of each committed
+transaction on the STOCK_EVENTS_CHANNEL pub/sub channel of the Redis server
+at STOCK_EVENTS_REDIS_URL, one message per store. Every ASGI web worker
+holds a single subscription to that channel (the StockEventHub) and fans
+messages out to the clients of
+``/api/stock/events/`` that follow the store, so any number of workers can
+serve subscribers and a connected client causes no database queries after
+it has been authenticated.
+
+Messages are JSON objects with an event type:
+
+- ``stock``: ``{"store_id", "changes": [{"product_id", "quantity",
+  "change"}], "ts"}`` with the new quantity and the signed change of each
+  Stock row a transaction touched.
+- ``resync``: ``{"store_id", "ts"}`` after bulk changes (imports, generated
+  data) that are not worth sending row by row; clients reload the store.
+
+Delivery is at most once: a client that connects, reconnects or falls
+behind by more than STOCK_EVENTS_QUEUE_SIZE events gets a ``resync`` and
+reloads with a conditional GET (see versions). Clients should subscribe
+first and load the stock list second, so no change falls in between.
+
+EventSource cannot send headers, so clients authenticate the stream with
+their session, or with a ticket from ``POST /api/stock/events/ticket/``
+passed as the ticket parameter. Tickets are signed and expire after
+STOCK_EVENTS_TICKET_MAX_AGE seconds, which keeps the API token out of URLs
+and so out of access logs and browser history.
+
+Without Redis, events only reach subscribers in the process that published
+them, e.g. a development server processing movements without Celery.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+
+STOCK_EVENTS_CHANNEL = 'inventory_stock_events'
+STOCK_EVENTS_REDIS_URL = getattr(settings, 'STOCK_EVENTS_REDIS_URL', 'redis://localhost:6379/1')
+STOCK_EVENTS_QUEUE_SIZE = getattr(settings, 'STOCK_EVENTS_QUEUE_SIZE', 1000)
+STOCK_EVENTS_KEEPALIVE = getattr(settings, 'STOCK_EVENTS_KEEPALIVE', 15)  # seconds between keep-alive comments
+STOCK_EVENTS_TICKET_MAX_AGE = getattr(settings, 'STOCK_EVENTS_TICKET_MAX_AGE', 60)  # seconds a stream ticket is valid
+STOCK_EVENTS_TICKET_SALT = 'inventory.stock_events.ticket'
+STOCK_EVENTS_RETRY_DELAY = 1  # seconds before the hub resubscribes after a Redis error
+STOCK_EVENTS_SUBSCRIBE_TIMEOUT = 5  # seconds a new stream waits for the hub's subscription
+
+
+def issue_ticket(user):
+    """Return a signed ticket that opens event streams as user for STOCK_EVENTS_TICKET_MAX_AGE seconds."""
+    return signing.dumps(user.pk, salt=STOCK_EVENTS_TICKET_SALT)
+
+
+def ticket_user_id(ticket):
+    """Return the id of the user a ticket was issued to, or None if it is forged or expired."""
+    try:
+        return signing.loads(ticket, salt=STOCK_EVENTS_TICKET_SALT, max_age=STOCK_EVENTS_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def stock_message(store_id, changes):
+    """
+    Build the stock event of a store.
+
+    Args:
+        changes: Iterable of (product_id, quantity_before, quantity_after);
+            quantity_before is None for a new Stock row
+    """
+    return {
+        'event': 'stock',
+        'store_id': store_id,
+        'changes': [
+            {'product_id': product_id, 'quantity': after, 'change': after - (before or 0)}
+            for product_id, before, after in changes
+        ],
+        'ts': time.time(),
+    }
+
+
+def resync_message(store_id):
+    return {'event': 'resync', 'store_id': store_id, 'ts': time.time()}
+
+
+_publisher = {'instance': None}
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """Return the Redis client events are published on: the server the hubs subscribe to."""
+    import redis
+
+    with _publisher_lock:
+        if _publisher['instance'] is None:
+            _publisher['instance'] = redis.Redis.from_url(STOCK_EVENTS_REDIS_URL)
+        return _publisher['instance']
+
+
+def publish(messages):
+    """Publish messages to every web worker, or to this process's hub without Redis."""
+    if not messages:
+        return
+    payloads = [json.dumps(message) for message in messages]
+    try:
+        client = get_publisher()
+        with client.pipeline(transaction=False) as pipe:
+            for payload in payloads:
+                pipe.publish(STOCK_EVENTS_CHANNEL, payload)
+            pipe.execute()
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        hub = _hub['instance']
+        if hub is not None and not hub.loop.is_closed():
+            hub.deliver_threadsafe(payloads)
+
+
+def publish_changes_on_commit(changes):
+    """
+    Publish stock events once the current transaction commits.
+
+    Args:
+        changes: Iterable of (store_id, product_id, quantity_before, quantity_after)
+    """
+    by_store = {}
+    for store_id, product_id, before, after in changes:
+        by_store.setdefault(store_id, []).append((product_id, before, after))
+    if by_store:
+        transaction.on_commit(lambda: publish([stock_message(store_id, rows) for store_id, rows in sorted(by_store.items())]))
+
+
+def publish_resync_on_commit(store_ids):
+    """Tell the subscribers of the given stores to reload them once the current transaction commits."""
+    store_ids = sorted(set(store_ids))
+    if store_ids:
+        transaction.on_commit(lambda: publish([resync_message(store_id) for store_id in store_ids]))
+
+
+class Subscription:
+    """The queue of events for one client, and whether it overflowed."""
+
+    def __init__(self, store_ids, queue_size):
+        self.store_ids = frozenset(store_ids)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event, payload):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((event, payload))
+        except asyncio.QueueFull:
+            # Queued events are dropped and replaced by a resync
+            self.overflowed = True
+
+
+class StockEventHub:
+    """
+    Fans stock events out from one Redis subscription to the subscribers of
+    this process. Bound to the event loop it was created on.
+    """
+
+    def __init__(self, loop, redis_url=STOCK_EVENTS_REDIS_URL, queue_size=STOCK_EVENTS_QUEUE_SIZE):
+        self.loop = loop
+        self.redis_url = redis_url
+        self.queue_size = queue_size
+        self._subscribers = {}  # store_id -> set of Subscriptions
+        self._listener = None
+        self._ready = asyncio.Event()  # set once subscribed, or while Redis is unavailable
+        self._failing = False  # events may have been missed; resync everyone once subscribed
+        self.delivered = 0
+
+    def subscribe(self, store_ids):
+        subscription = Subscription(store_ids, self.queue_size)
+        for store_id in subscription.store_ids:
+            self._subscribers.setdefault(store_id, set()).add(subscription)
+        if self._listener is None or self._listener.done():
+            self._listener = self.loop.create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for store_id in subscription.store_ids:
+            subscribers = self._subscribers.get(store_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[store_id]
+
+    def subscriber_count(self):
+        return len({subscription for subscribers in self._subscribers.values() for subscription in subscribers})
+
+    def deliver(self, payload):
+        """Queue a published message for the subscribers of its store."""
+        try:
+            message = json.loads(payload)
+            event, store_id = message['event'], message['store_id']
+        except (ValueError, KeyError, TypeError):
+            return
+        for subscription in self._subscribers.get(store_id, ()):
+            subscription.offer(event, payload)
+            self.delivered += 1
+
+    def deliver_threadsafe(self, payloads):
+        def deliver_all():
+            for payload in payloads:
+                self.deliver(payload)
+        self.loop.call_soon_threadsafe(deliver_all)
+
+    async def wait_ready(self, timeout=STOCK_EVENTS_SUBSCRIBE_TIMEOUT):
+        """
+        Wait until Redis has confirmed the hub's subscription.
+
+        Returns False if it has not within timeout seconds; everyone is
+        then sent a resync once it does. Returns at once while Redis is
+        unavailable, since the hub resyncs everyone when it is back.
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._failing = True
+            return False
+
+    def _subscribed(self):
+        if self._failing:
+            # Events published while we were not subscribed are lost
+            self._resync_all()
+        self._failing = False
+        self._ready.set()
+
+    async def _listen(self):
+        from redis import asyncio as redis_asyncio
+
+        while self._subscribers:
+            client = redis_asyncio.Redis.from_url(self.redis_url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(STOCK_EVENTS_CHANNEL)
+                    while self._subscribers:
+                        message = await pubsub.get_message(timeout=STOCK_EVENTS_KEEPALIVE)
+                        if message is None:
+                            continue
+                        if message['type'] == 'subscribe':
+                            self._subscribed()
+                        elif message['type'] == 'message':
+                            self.deliver(message['data'].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as cache_error:
+                if not self._failing:
+                    print(f"Cache operation failed (non-critical): {str(cache_error)}")
+                self._failing = True
+                self._ready.set()
+                await asyncio.sleep(STOCK_EVENTS_RETRY_DELAY)
+            finally:
+                await client.aclose()
+        # The next subscriber starts a new subscription and waits for it
+        self._ready.clear()
+        self._failing = False
+
+    def _resync_all(self):
+        for store_id in list(self._subscribers):
+            self.deliver(json.dumps(resync_message(store_id)))
+
+
+_hub = {'instance': None}
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """Return the hub of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    with _hub_lock:
+        hub = _hub['instance']
+        if hub is None or hub.loop is not loop:
+            hub = _hub['instance'] = StockEventHub(loop)
+    return hub
+
+
+def format_event(message):
+    """Format a message as a Server-Sent Event."""
+    return f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+
+
+async def event_stream(store_ids, keepalive=STOCK_EVENTS_KEEPALIVE):
+    """
+    Yield Server-Sent Events for the given stores until the client disconnects.
+
+    The stream opens with a ``resync`` per store, since changes made before
+    the subscription (or during a reconnect) were not seen. It is sent once
+    the hub's Redis subscription is confirmed, so a client that reloads on
+    it cannot miss a change made while the hub was still subscribing.
+    """
+    hub = get_hub()
+    subscription = hub.subscribe(store_ids)
+    try:
+        yield f"retry: {STOCK_EVENTS_RETRY_DELAY * 1000}\n\n"
+        await hub.wait_ready()
+        for store_id in sorted(subscription.store_ids):
+            yield format_event(resync_message(store_id))
+
+        while True:
+            if subscription.overflowed:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                for store_id in sorted(subscription.store_ids):
+                    yield format_event(resync_message(store_id))
+                continue
+            try:
+                event, payload = await asyncio.wait_for(subscription.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event}\ndata: {payload}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
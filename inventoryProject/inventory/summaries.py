@@ -0,0 +1,112 @@
+"""
+Per-store stock status summaries.
+
+StoreStockSummary holds, for every store, how many SKUs are out of stock, low
+on stock (below the store's low_stock_threshold) and in stock, plus the total
+units on hand. Movement processing applies deltas as Stock quantities change,
+so dashboards read one row per store instead of scanning Stock.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Stock, Store, StoreStockSummary
+
+STATUS_FIELDS = ('out_of_stock', 'low_stock', 'in_stock')
+
+
+def stock_status(quantity, threshold):
+    """Return the status bucket of a quantity for a store threshold."""
+    if quantity == 0:
+        return 'out_of_stock'
+    if quantity < threshold:
+        return 'low_stock'
+    return 'in_stock'
+
+
+def status_filter(status):
+    """
+    Return a Stock filter for a status bucket, or None for unknown statuses.
+    """
+    if status == 'out_of_stock':
+        return Q(quantity=0)
+    if status == 'low_stock':
+        return Q(quantity__gt=0, quantity__lt=F('store__low_stock_threshold'))
+    if status == 'in_stock':
+        return Q(quantity__gte=F('store__low_stock_threshold'))
+    return None
+
+
+def summary_deltas(changes, threshold):
+    """
+    Turn Stock quantity changes into summary counter deltas.
+
+    Args:
+        changes: Iterable of (old_quantity, new_quantity) pairs; old_quantity is
+            None for Stock rows created by the change, new_quantity None for
+            deleted ones
+        threshold: The store's low stock threshold
+    """
+    deltas = Counter()
+    for old, new in changes:
+        if old is not None:
+            deltas[stock_status(old, threshold)] -= 1
+            deltas['total_units'] -= old
+        if new is not None:
+            deltas[stock_status(new, threshold)] += 1
+            deltas['total_units'] += new
+    return deltas
+
+
+def apply_summary_deltas(store_id, deltas, rebuild_missing=True):
+    """
+    Apply counter deltas to a store's summary.
+
+    Runs inside the caller's transaction. If the store has no summary yet it
+    is rebuilt from the Stock table instead, which already includes the
+    caller's changes, unless rebuild_missing is False, e.g. while the store
+    itself is being deleted.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return
+    updated = StoreStockSummary.objects.filter(store_id=store_id).update(updated_at=timezone.now(), **updates)
+    if not updated and rebuild_missing:
+        rebuild_store_summaries([store_id])
+
+
+def rebuild_store_summaries(store_ids=None):
+    """
+    Recompute summaries from the Stock table.
+
+    Args:
+        store_ids: Optional list of store ids; all stores when omitted
+    """
+    stores = Store.objects.all()
+    if store_ids is not None:
+        stores = stores.filter(id__in=store_ids)
+    store_ids = list(stores.values_list('id', flat=True))
+
+    counts = {
+        row['store_id']: row
+        for row in Stock.objects.filter(store_id__in=store_ids).values('store_id').annotate(
+            out_of_stock=Count('id', filter=status_filter('out_of_stock')),
+            low_stock=Count('id', filter=status_filter('low_stock')),
+            in_stock=Count('id', filter=status_filter('in_stock')),
+            total_units=Sum('quantity'),
+        ).order_by()
+    }
+
+    for store_id in store_ids:
+        row = counts.get(store_id, {})
+        StoreStockSummary.objects.update_or_create(
+            store_id=store_id,
+            defaults={
+                'out_of_stock': row.get('out_of_stock', 0),
+                'low_stock': row.get('low_stock', 0),
+                'in_stock': row.get('in_stock', 0),
+                'total_units': row.get('total_units') or 0,
+            }
+        )
+    return len(store_ids)
@@ -1,6 +1,21 @@
+from collections import defaultdict
+
 from celery import shared_task
+from django.conf import settings
 from django.core.cache import cache
-from .models import StockMovement, Stock, AuditLog, User
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from . import movement_queues, partitions, stock_cache, stock_events, versions
+from .audit import audit_sink
+from .models import StockMovement, Stock, Store, AuditLog, User
+from .snapshots import record_snapshots
+from .summaries import apply_summary_deltas, summary_deltas
+
+# Cache flag used to coalesce drain requests into a single queued task
+DRAIN_SCHEDULED_KEY = 'stock_movement_drain_scheduled'
+DRAIN_SCHEDULED_TIMEOUT = getattr(settings, 'STOCK_MOVEMENT_DRAIN_SCHEDULED_TIMEOUT', 30)
+DRAIN_BATCH_SIZE = getattr(settings, 'STOCK_MOVEMENT_DRAIN_BATCH_SIZE', 5000)
 
 @shared_task
 def process_stock_movement(movement_id, user_id=None):
@@ -13,68 +28,396 @@ def process_stock_movement(movement_id, user_id=None):
         user_id: Optional ID of the user who created the movement
     """
     try:
-        # Get the movement
-        movement = StockMovement.objects.get(id=movement_id)
-        
-        # Get the user if user_id is provided
-        user = None
-        if user_id:
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                pass
-        
-        # Check if this movement has already been processed
-        if movement.processed:
+        movement = apply_stock_movement(movement_id, user_id=user_id)
+        if movement is None:
             print(f"Movement {movement_id} already processed. Skipping.")
             return f"Movement {movement_id} already processed. Skipping."
         
-        # Clear any cache
-        cache_key = f"stock_{movement.store.id}_{movement.product.id}"
-        cache.delete(cache_key)
-        
-        # Get or create the stock object
-        stock, created = Stock.objects.get_or_create(
-            store=movement.store, 
-            product=movement.product,
-            defaults={'quantity': 0}
-        )
-        
-        # Update the stock quantity based on movement type
-        if movement.movement_type == 'IN':
-            # For stock in, add the quantity
-            stock.quantity += movement.quantity
-        elif movement.movement_type in ('OUT', 'REM'):
-            # For stock out or removal, subtract the quantity
-            if stock.quantity >= movement.quantity:
-                stock.quantity -= movement.quantity
-            else:
-                # Not enough stock available
-                stock.quantity = 0
-        
-        # Save the updated stock
-        stock.save()
-        
-        # Mark this movement as processed to prevent double-processing
-        movement.processed = True
-        movement.save(update_fields=['processed'])
-        
-        # Create an audit log
-        AuditLog.objects.create(
-            action=f'stock_{movement.movement_type.lower()}',
-            store=movement.store,
-            product=movement.product,
-            user=user,  # Add the user to the audit log
-            details={
-                'movement_id': movement.id,
-                'quantity': movement.quantity,
-                'timestamp': movement.timestamp.isoformat()
-            }
-        )
-        
         return f"Processed movement {movement_id}: {movement.movement_type} - {movement.quantity} units"
     except Exception as e:
         # Log the error
         print(f"Error processing stock movement {movement_id}: {str(e)}")
         # Re-raise the exception to mark the task as failed
-        raise
\ No newline at end of file
+        raise
+
+
+def apply_stock_movement(movement_id, user_id=None):
+    """
+    Atomically apply a single movement to its Stock row.
+
+    The movement is claimed with a conditional UPDATE on processed, so it is
+    applied at most once even if several workers pick it up. The quantity is
+    changed with database-side arithmetic rather than a read-modify-write, so
+    concurrent movements on the same Stock row cannot overwrite each other,
+    and the clamp to zero is evaluated against the current row value.
+
+    Returns the movement, or None if it had already been processed.
+    """
+    pair = None
+    try:
+        with transaction.atomic():
+            claimed = StockMovement.objects.filter(id=movement_id, processed=False).update(processed=True)
+            if not claimed:
+                return None
+
+            movement = StockMovement.objects.only(
+                'id', 'store_id', 'product_id', 'created_by_id', 'movement_type', 'quantity', 'timestamp'
+            ).get(id=movement_id)
+            pair = (movement.store_id, movement.product_id)
+
+            _, created = Stock.objects.get_or_create(
+                store_id=movement.store_id,
+                product_id=movement.product_id,
+                defaults={'quantity': 0}
+            )
+            stock = Stock.objects.filter(store_id=movement.store_id, product_id=movement.product_id)
+            old_quantity = stock.select_for_update().values_list('quantity', flat=True).get()
+            if movement.movement_type == 'IN':
+                stock.update(quantity=F('quantity') + movement.quantity)
+            elif movement.movement_type in ('OUT', 'REM'):
+                # Not enough stock available clamps to zero
+                stock.update(quantity=Greatest(F('quantity') - movement.quantity, Value(0)))
+            quantity = stock.values_list('quantity', flat=True).get()
+            record_snapshots([(movement.store_id, movement.product_id, movement.timestamp,
+                               movement.movement_type, movement.quantity, old_quantity, quantity)])
+
+            threshold = Store.objects.values_list('low_stock_threshold', flat=True).get(id=movement.store_id)
+            # A created row was already counted at quantity 0 when it was saved
+            apply_summary_deltas(movement.store_id, summary_deltas([(old_quantity, quantity)], threshold))
+
+            if not movement.created_by_id and user_id and User.objects.filter(id=user_id).exists():
+                movement.created_by_id = user_id
+
+            audit_sink.record([AuditLog(
+                action=f'stock_{movement.movement_type.lower()}',
+                store_id=movement.store_id,
+                product_id=movement.product_id,
+                user_id=movement.created_by_id,
+                details={
+                    'movement_id': movement.id,
+                    'quantity': movement.quantity,
+                    'timestamp': movement.timestamp.isoformat()
+                }
+            )])
+
+            # Reloaded after the commit, when readers can no longer see the old quantity
+            transaction.on_commit(lambda: stock_cache.refresh_stock_entries([pair]))
+            if created:
+                transaction.on_commit(lambda: stock_cache.invalidate_store_sheets([movement.store_id]))
+            versions.bump_stores([movement.store_id])
+            stock_events.publish_changes_on_commit([(*pair, None if created else old_quantity, quantity)])
+    except Exception:
+        if pair:
+            stock_cache.invalidate_stock_entries([pair])
+        raise
+
+    return movement
+
+
+def apply_movement(quantity, movement_type, amount):
+    """
+    Return the stock quantity after applying a single movement.
+
+    Stock in adds to the quantity; sales and removals subtract from it
+    and clamp at zero when there is not enough stock available.
+    """
+    if movement_type == 'IN':
+        return quantity + amount
+    if movement_type in ('OUT', 'REM'):
+        return quantity - amount if quantity >= amount else 0
+    return quantity
+
+
+def schedule_movement_drain(pairs=None):
+    """
+    Queue a process_pending_movements task unless one is already waiting.
+
+    Many movements created in a burst share a single queued drain instead of
+    one task each. With partitioned queues (see movement_queues), a
+    process_partition_movements task is queued instead for the partition of
+    each (store_id, product_id) pair, or for every partition without pairs.
+    Raises if a task cannot be queued so callers can fall back to direct
+    processing.
+
+    Args:
+        pairs: Optional (store_id, product_id) pairs of the new movements
+    """
+    count = movement_queues.partition_count()
+    if not count:
+        return _schedule_drain(DRAIN_SCHEDULED_KEY, process_pending_movements.delay)
+
+    if pairs is None:
+        targets = range(count)
+    else:
+        targets = sorted({movement_queues.partition_of(store_id, product_id, count) for store_id, product_id in pairs})
+    scheduled = False
+    for partition in targets:
+        queue = lambda partition=partition: process_partition_movements.apply_async(
+            args=[partition], queue=movement_queues.queue_name(partition)
+        )
+        scheduled = _schedule_drain(partition_drain_key(partition), queue) or scheduled
+    return scheduled
+
+
+def partition_drain_key(partition):
+    return f"{DRAIN_SCHEDULED_KEY}_{partition}"
+
+
+def _schedule_drain(key, queue):
+    try:
+        if not cache.add(key, True, timeout=DRAIN_SCHEDULED_TIMEOUT):
+            return False
+    except Exception as cache_error:
+        # Without the cache we cannot coalesce, so always queue
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+    try:
+        queue()
+    except Exception:
+        try:
+            cache.delete(key)
+        except Exception:
+            pass
+        raise
+    return True
+
+
+@shared_task
+def process_pending_movements(batch_size=None):
+    """
+    Drain all unprocessed stock movements in batches.
+    This task is executed asynchronously by Celery.
+
+    With partitioned queues, the periodic run only queues the partition
+    drains; called directly, e.g. when the broker is down, it still drains
+    everything itself.
+
+    Args:
+        batch_size: Optional number of movements to process per transaction
+    """
+    if movement_queues.partition_count() and not process_pending_movements.request.called_directly:
+        schedule_movement_drain()
+        return "Scheduled the partition drains"
+
+    # Clear the flag first so movements created while we drain queue a new task
+    try:
+        cache.delete(DRAIN_SCHEDULED_KEY)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+    batch_size = batch_size or DRAIN_BATCH_SIZE
+    total = 0
+    while True:
+        count = process_movement_batch(batch_size)
+        total += count
+        if count < batch_size:
+            break
+
+    return f"Processed {total} pending movements"
+
+
+@shared_task
+def process_partition_movements(partition, batch_size=None):
+    """
+    Drain the unprocessed stock movements of one partition in batches.
+    This task is executed asynchronously by Celery, on the partition's queue.
+
+    Returns early if another drain holds the partition, the drains are
+    paused for a rebalance, or the partition is no longer in the layout.
+
+    Args:
+        partition: Index of the partition to drain
+        batch_size: Optional number of movements to process per transaction
+    """
+    try:
+        cache.delete(partition_drain_key(partition))
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+    batch_size = batch_size or DRAIN_BATCH_SIZE
+    total = 0
+    while True:
+        with movement_queues.owning(partition) as count:
+            if count is None:
+                break
+            processed = process_movement_batch(batch_size, partition=(partition, count))
+        total += processed
+        if processed < batch_size:
+            break
+
+    return f"Processed {total} pending movements of partition {partition}"
+
+
+def pending_movements(batch_size, partition=None):
+    """
+    Return the next batch_size unprocessed movements, locking them.
+
+    Must be evaluated inside a transaction. skip_locked lets concurrent drains
+    work on disjoint batches; the scan uses the partial index on unprocessed
+    movements.
+
+    Args:
+        batch_size: Maximum number of movements to return
+        partition: Optional (index, count) to only return the movements of one partition
+    """
+    movements = StockMovement.objects.select_for_update(skip_locked=True).filter(processed=False)
+    if partition is not None:
+        index, count = partition
+        movements = movements.alias(
+            movement_partition=movement_queues.partition_expression(count)
+        ).filter(movement_partition=index)
+    return (
+        movements
+        .only('id', 'store_id', 'product_id', 'created_by_id', 'movement_type', 'quantity', 'timestamp')
+        .order_by('id')[:batch_size]
+    )
+
+
+def pair_filter(pairs):
+    """Return a Q matching the Stock rows of exactly the given (store_id, product_id) pairs."""
+    products_by_store = defaultdict(set)
+    for store_id, product_id in pairs:
+        products_by_store[store_id].add(product_id)
+    condition = Q(pk__in=[])
+    for store_id in sorted(products_by_store):
+        condition |= Q(store_id=store_id, product_id__in=sorted(products_by_store[store_id]))
+    return condition
+
+
+def lock_stocks(pairs):
+    """
+    Lock the Stock rows of the given (store_id, product_id) pairs in id order.
+
+    Only the rows of these pairs are locked, not every row of their stores
+    and products, so drains of other pairs never wait on them. Must be
+    called inside a transaction. Returns {(store_id, product_id): Stock}
+    for the pairs that have a row.
+    """
+    locked = Stock.objects.select_for_update().filter(pair_filter(pairs)).order_by('id')
+    return {(stock.store_id, stock.product_id): stock for stock in locked}
+
+
+def create_stocks(pairs):
+    """
+    Create empty Stock rows for the given (store_id, product_id) pairs.
+
+    One INSERT per chunk, skipping the pairs another transaction created
+    meanwhile. Returns the set of pairs this call created. bulk_create()
+    cannot tell those apart when it ignores conflicts, and unlike save() no
+    post_save signal fires, so the caller counts the new rows itself.
+    """
+    pairs = sorted(pairs)
+    table = connection.ops.quote_name(Stock._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in ('store_id', 'product_id', 'quantity'))
+    fields = [Stock._meta.get_field(name) for name in ('store', 'product', 'quantity')]
+    chunk_size = connection.ops.bulk_batch_size(fields, pairs) or len(pairs)
+    created = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start:start + chunk_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join(['(%s, %s, 0)'] * len(chunk))} "
+                f"ON CONFLICT DO NOTHING RETURNING store_id, product_id",
+                [value for pair in chunk for value in pair]
+            )
+            created.update(tuple(row) for row in cursor.fetchall())
+    return created
+
+
+def process_movement_batch(batch_size, partition=None):
+    """
+    Process up to batch_size unprocessed movements in one transaction.
+
+    Movements are grouped by (store, product) and applied in id order to each
+    Stock row, so the result matches processing them one by one. Each Stock row
+    is written once, the processed flags are flipped with a single UPDATE, the
+    audit logs are handed to the audit sink in one list and the daily
+    snapshots are written in bulk.
+
+    Args:
+        batch_size: Maximum number of movements to process
+        partition: Optional (index, count) to only process one partition
+
+    Returns the number of movements processed.
+    """
+    grouped = defaultdict(list)
+    try:
+        with transaction.atomic():
+            movements = list(pending_movements(batch_size, partition))
+            if not movements:
+                return 0
+
+            for movement in movements:
+                grouped[(movement.store_id, movement.product_id)].append(movement)
+
+            # Lock the existing Stock rows in a stable order, then create and lock the missing ones
+            stocks = lock_stocks(grouped)
+            missing = [key for key in grouped if key not in stocks]
+            created = set()
+            if missing:
+                created = create_stocks(missing)
+                stocks.update(lock_stocks(missing))
+
+            old_quantities = {key: None if key in created else stock.quantity for key, stock in stocks.items()}
+
+            audit_logs = []
+            snapshot_changes = []
+            for key, group in grouped.items():
+                stock = stocks[key]
+                for movement in group:
+                    before = stock.quantity
+                    stock.quantity = apply_movement(stock.quantity, movement.movement_type, movement.quantity)
+                    snapshot_changes.append((movement.store_id, movement.product_id, movement.timestamp,
+                                             movement.movement_type, movement.quantity, before, stock.quantity))
+                    audit_logs.append(AuditLog(
+                        action=f'stock_{movement.movement_type.lower()}',
+                        store_id=movement.store_id,
+                        product_id=movement.product_id,
+                        user_id=movement.created_by_id,
+                        details={
+                            'movement_id': movement.id,
+                            'quantity': movement.quantity,
+                            'timestamp': movement.timestamp.isoformat()
+                        }
+                    ))
+
+            Stock.objects.bulk_update(list(stocks.values()), ['quantity'])
+            StockMovement.objects.filter(id__in=[movement.id for movement in movements]).update(processed=True)
+            audit_sink.record(audit_logs)
+            record_snapshots(snapshot_changes)
+
+            changes = defaultdict(list)
+            for (store_id, product_id), stock in stocks.items():
+                changes[store_id].append((old_quantities[(store_id, product_id)], stock.quantity))
+            thresholds = dict(Store.objects.filter(id__in=changes).values_list('id', 'low_stock_threshold'))
+            for store_id in sorted(changes):
+                apply_summary_deltas(store_id, summary_deltas(changes[store_id], thresholds[store_id]))
+
+            # Reloaded after the commit, when readers can no longer see the old quantities
+            transaction.on_commit(lambda: stock_cache.refresh_stock_entries(list(stocks)))
+            if created:
+                transaction.on_commit(lambda: stock_cache.invalidate_store_sheets(
+                    {store_id for store_id, _ in created}
+                ))
+            versions.bump_stores(changes)
+            stock_events.publish_changes_on_commit(
+                (*key, old_quantities[key], stock.quantity) for key, stock in stocks.items()
+            )
+    except Exception:
+        stock_cache.invalidate_stock_entries(list(grouped))
+        raise
+
+    return len(movements)
+
+
+@shared_task
+def maintain_partitions():
+    """
+    Create upcoming monthly partitions and apply retention to old ones.
+    This task is executed daily by Celery beat.
+    """
+    created = partitions.ensure_partitions()
+    dropped = []
+    for table, months in partitions.retention_months().items():
+        dropped += partitions.apply_retention(table, months)
+    return f"Created {len(created)} and dropped {len(dropped)} partitions"
@@ -1,2 +1,925 @@
-from django.test import TestCase
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import (audit, bulk_io, db_router, metrics, movement_queues, movement_stream, partitions, reference_cache,
+               stock_cache, stock_events, tasks)
+from .datasets import generate_dataset
+from .management.commands.check_query_counts import endpoints
+from .management.commands.check_query_plans import index_names, query_plans
+from .middleware import ReplicaRoutingMiddleware
+from .models import (AuditLog, DailyStockSnapshot, Product, Stock, StockMovement, Store, StoreStockSummary, Supplier,
+                     User)
+from .serializers import AuditLogFlatSerializer, AuditLogSerializer, StockFlatSerializer, StockSerializer
+from .summaries import rebuild_store_summaries
+from .views import ticket_user
+
+
+class MovementBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Main Street', location='Lahore', low_stock_threshold=5)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Batch Product {i}', sku=f'BATCH-{i}') for i in range(8)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        rebuild_store_summaries([self.store.id])
+
+    def test_new_stock_rows_are_created_in_bulk(self):
+        counts = []
+        for products, quantity in ((self.products[:2], 3), (self.products[2:], 9)):
+            StockMovement.objects.bulk_create([
+                StockMovement(store=self.store, product=product, movement_type='IN', quantity=quantity)
+                for product in products
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(tasks.process_movement_batch(100), len(products))
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(sorted(Stock.objects.filter(store=self.store).values_list('quantity', flat=True)),
+                         [3] * 2 + [9] * 6)
+        summary = StoreStockSummary.objects.values('low_stock', 'in_stock', 'total_units').get(store=self.store)
+        self.assertEqual(summary, {'low_stock': 2, 'in_stock': 6, 'total_units': 60})
+
+
+class PartitionedDrainTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        stores = Store.objects.bulk_create([Store(name=f'Drain Store {i}', location='Quetta') for i in range(2)])
+        products = Product.objects.bulk_create([
+            Product(name=f'Drain Product {i}', sku=f'DRAIN-{i}') for i in range(6)
+        ])
+        # Half the pairs have no Stock row yet, so the drains also create rows
+        Stock.objects.bulk_create([Stock(store=stores[0], product=product, quantity=10) for product in products])
+        StockMovement.objects.bulk_create([
+            StockMovement(store=store, product=product, movement_type='IN', quantity=1)
+            for store in stores for product in products
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_partition_batches_lock_disjoint_rows(self):
+        count = 2
+        locked = {}
+        lock_stocks = tasks.lock_stocks
+        for partition in range(count):
+            rows = {}
+
+            def recording(pairs):
+                stocks = lock_stocks(pairs)
+                rows.update({stock.id: key for key, stock in stocks.items()})
+                return stocks
+
+            with mock.patch('inventory.tasks.lock_stocks', side_effect=recording):
+                tasks.process_movement_batch(100, partition=(partition, count))
+            locked[partition] = rows
+
+        self.assertTrue(locked[0] and locked[1])
+        self.assertFalse(set(locked[0]) & set(locked[1]))
+        for partition, rows in locked.items():
+            for store_id, product_id in rows.values():
+                self.assertEqual(movement_queues.partition_of(store_id, product_id, count), partition)
+        self.assertFalse(StockMovement.objects.filter(processed=False).exists())
+        self.assertEqual(sorted(Stock.objects.values_list('quantity', flat=True)), [1] * 6 + [11] * 6)
+
+
+class StockCacheInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.stores = Store.objects.bulk_create([
+            Store(name=f'Cache Store {i}', location='Karachi') for i in range(2)
+        ])
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Cache Product {i}', sku=f'CACHE-{i}') for i in range(3)
+        ])
+        Stock.objects.bulk_create([
+            Stock(store=store, product=product, quantity=5) for store in cls.stores for product in cls.products
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def move(self, quantity):
+        store, product = self.stores[0], self.products[0]
+        movement = StockMovement.objects.create(store=store, product=product, movement_type='IN', quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.apply_stock_movement(movement.id)
+
+    def test_renames_reach_cached_rows(self):
+        store, product = self.stores[0], self.products[0]
+        stock_cache.get_store_stock(store.id)
+        stock_cache.get_stock(self.stores[1].id, product.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed Product'
+            product.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            store.name = 'Renamed Store'
+            store.save()
+
+        rows = {row['product']['id']: row for row in stock_cache.get_store_stock(store.id)}
+        self.assertEqual(rows[product.id]['product']['name'], 'Renamed Product')
+        self.assertEqual(rows[product.id]['store']['name'], 'Renamed Store')
+        self.assertEqual(stock_cache.get_stock(self.stores[1].id, product.id)['product']['name'], 'Renamed Product')
+
+    def test_movements_reach_cached_rows(self):
+        store, product = self.stores[0], self.products[0]
+        self.assertEqual(stock_cache.get_stock(store.id, product.id)['quantity'], 5)
+        stock_cache.get_store_stock(store.id)
+
+        self.move(3)
+        self.assertEqual(stock_cache.get_stock(store.id, product.id)['quantity'], 8)
+        rows = {row['product']['id']: row for row in stock_cache.get_store_stock(store.id)}
+        self.assertEqual(rows[product.id]['quantity'], 8)
+
+    def test_miss_loaded_before_a_movement_is_not_kept(self):
+        store, product = self.stores[0], self.products[0]
+        serialize_stocks = stock_cache.serialize_stocks
+        interleaved = []
+
+        def load_then_move(queryset):
+            rows = serialize_stocks(queryset)
+            if not interleaved:
+                # The movement commits between the reader's query and its cache write
+                interleaved.append(True)
+                self.move(3)
+            return rows
+
+        with mock.patch('inventory.stock_cache.serialize_stocks', side_effect=load_then_move):
+            self.assertEqual(stock_cache.get_stock(store.id, product.id)['quantity'], 5)
+        self.assertEqual(stock_cache.get_stock(store.id, product.id)['quantity'], 8)
+        self.assertEqual(async_to_sync(stock_cache.aget_stock)(store.id, product.id)['quantity'], 8)
+
+
+class StockSummaryTests(TestCase):
+    fields = ('out_of_stock', 'low_stock', 'in_stock', 'total_units')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Summary Store', location='Peshawar', low_stock_threshold=10)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Summary Product {i}', sku=f'SUMMARY-{i}') for i in range(3)
+        ])
+        Stock.objects.bulk_create([
+            Stock(store=cls.store, product=product, quantity=quantity)
+            for product, quantity in zip(cls.products, (0, 5, 40))
+        ])
+
+    def setUp(self):
+        cache.clear()
+        rebuild_store_summaries([self.store.id])
+
+    def assertSummaryCurrent(self):
+        summary = StoreStockSummary.objects.filter(store=self.store)
+        maintained = summary.values(*self.fields).get()
+        rebuild_store_summaries([self.store.id])
+        self.assertEqual(maintained, summary.values(*self.fields).get())
+
+    def test_direct_saves_update_summary_and_cache(self):
+        stock, other = Stock.objects.filter(store=self.store).order_by('-quantity')[:2]
+        stock_cache.get_stock(self.store.id, stock.product_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.quantity = 0
+            stock.save()
+        self.assertEqual(stock_cache.get_stock(self.store.id, stock.product_id)['quantity'], 0)
+        self.assertSummaryCurrent()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertSummaryCurrent()
+
+        product = Product.objects.create(name='New Product', sku='NEW-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(store=self.store, product=product, quantity=500)
+        self.assertSummaryCurrent()
+        self.assertEqual(len(stock_cache.get_store_stock(self.store.id)), 3)
+
+    def test_processing_counts_created_rows_once(self):
+        product = Product.objects.create(name='New Product', sku='NEW-2')
+        movement = StockMovement.objects.create(store=self.store, product=product, movement_type='IN', quantity=7)
+        tasks.apply_stock_movement(movement.id)
+        self.assertSummaryCurrent()
+
+        product = Product.objects.create(name='Other Product', sku='NEW-3')
+        StockMovement.objects.create(store=self.store, product=product, movement_type='IN', quantity=50)
+        tasks.process_movement_batch(100)
+        self.assertSummaryCurrent()
+
+    def test_summary_api_counts_with_each_store_threshold(self):
+        # 5 units are low stock here but in stock at a store with a threshold of 5
+        other = Store.objects.create(name='Other Summary Store', location='Gilgit', low_stock_threshold=5)
+        Stock.objects.create(store=other, product=self.products[0], quantity=5)
+        client = APIClient()
+        client.force_authenticate(User.objects.create(email='summary@example.com'))
+
+        data = client.get('/api/stock/summary/').data
+        counts = {row['store_id']: (row['out_of_stock'], row['low_stock'], row['in_stock'], row['total_units'])
+                  for row in data['stores']}
+        self.assertEqual(counts, {self.store.id: (1, 1, 1, 45), other.id: (0, 0, 1, 5)})
+        self.assertEqual(data['totals'], {'out_of_stock': 1, 'low_stock': 1, 'in_stock': 2, 'total_units': 50})
+
+        movement = StockMovement.objects.create(store=self.store, product=self.products[0],
+                                                movement_type='IN', quantity=3)
+        tasks.apply_stock_movement(movement.id)
+        data = client.get(f'/api/stock/summary/?store={self.store.id}').data
+        self.assertEqual(data['totals'], {'out_of_stock': 0, 'low_stock': 2, 'in_stock': 1, 'total_units': 48})
+
+        low = client.get('/api/stock/?status=low_stock').data
+        self.assertEqual(sorted(row['quantity'] for row in low), [3, 5])
+
+
+class BulkMovementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Bulk Store', location='Hyderabad')
+        cls.product = Product.objects.create(name='Bulk Product', sku='BULK-1')
+        cls.user = User.objects.create(email='bulk@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.line = {'store_id': self.store.id, 'product_id': self.product.id, 'movement_type': 'IN'}
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('inventory.views.schedule_movement_drain')
+    def test_quantities_must_be_whole_and_in_range(self, schedule):
+        quantities = [2.9, 10 ** 20, '3', 2.0, '1.5', 2147483648]
+        response = self.client.post('/api/stock-movements/bulk/', [
+            {**self.line, 'quantity': quantity} for quantity in quantities
+        ], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        statuses = {result['line']: result['status'] for result in response.data['results']}
+        self.assertEqual(statuses, {1: 'error', 2: 'error', 3: 'created', 4: 'created', 5: 'error', 6: 'error'})
+        self.assertEqual(sorted(StockMovement.objects.values_list('quantity', flat=True)), [2, 3])
+
+
+class ReferenceCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Reference Product {i}', sku=f'REF-{i}') for i in range(2)
+        ])
+
+    def setUp(self):
+        for lru in reference_cache._caches.values():
+            lru.clear()
+
+    def test_lru_evicts_the_least_recent_entry_and_expires_entries(self):
+        lru = reference_cache.LRUCache(maxsize=2, ttl=60)
+        lru.set(1, 'one')
+        lru.set(2, 'two')
+        lru.get(1)
+        lru.set(3, 'three')
+        self.assertEqual((lru.get(1), lru.get(2), lru.get(3)), ('one', None, 'three'))
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+        with mock.patch('inventory.reference_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(lru.get(1))
+        self.assertEqual(lru.stats()['size'], 1)
+
+    def test_reads_are_served_until_a_save_invalidates(self):
+        ids = [product.id for product in self.products]
+        with self.assertNumQueries(1):
+            reference_cache.get_many(Product, ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(sorted(reference_cache.get_many(Product, ids)), sorted(ids))
+
+        product = Product.objects.get(id=ids[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed Reference'
+            product.save()
+        self.assertEqual(reference_cache.get(Product, product.id).name, 'Renamed Reference')
+        self.assertIsNone(reference_cache.get(Product, max(ids) + 1))
+
+
+class BulkImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Import Store', location='Mardan')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Import Product {i}', sku=f'IMPORT-{i}') for i in range(2)
+        ])
+        Stock.objects.create(store=cls.store, product=cls.products[0], quantity=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def import_stock(self, rows, **options):
+        lines = ['store_id,product_id,sku,quantity\n'] + [f'{row}\n' for row in rows]
+        return bulk_io.import_stock(lines, **options)
+
+    def quantities(self):
+        return dict(Stock.objects.filter(store=self.store).values_list('product__sku', 'quantity'))
+
+    def test_stock_import_upserts_and_reports_failed_lines(self):
+        first, second = self.products
+        result = self.import_stock([
+            f'{self.store.id},{first.id},,9',
+            f'{self.store.id},,{second.sku},4',
+            f'{self.store.id},{first.id},,-1',
+            f'{self.store.id + 100},{first.id},,3',
+            f'{self.store.id},,UNKNOWN,3',
+            f'{self.store.id},{first.id},,11',
+        ])
+
+        self.assertEqual((result['lines'], result['created'], result['updated'], result['failed']), (6, 1, 1, 4))
+        self.assertEqual(sorted(error['line'] for error in result['errors']), [2, 4, 5, 6])
+        self.assertEqual(self.quantities(), {'IMPORT-0': 11, 'IMPORT-1': 4})
+
+        result = self.import_stock([f'{self.store.id},{first.id},,0'], dry_run=True)
+        self.assertEqual((result['updated'], result['dry_run']), (1, True))
+        self.assertEqual(self.quantities()['IMPORT-0'], 11)
+
+    def test_exports_can_be_imported_again(self):
+        exported = b''.join(bulk_io.export_stock('ndjson', store_ids=[self.store.id])).decode()
+        self.assertEqual([json.loads(line) for line in exported.splitlines()], [
+            {'store_id': self.store.id, 'product_id': self.products[0].id, 'sku': 'IMPORT-0', 'quantity': 5},
+        ])
+        result = bulk_io.import_stock(exported.splitlines(keepends=True), fmt='ndjson', dry_run=True)
+        self.assertEqual((result['updated'], result['failed']), (1, 0))
+
+        exported = b''.join(bulk_io.export_stock('csv')).decode()
+        self.assertEqual(exported.splitlines()[0], 'store_id,product_id,sku,quantity')
+
+    def test_movement_import_appends_history_with_snapshots(self):
+        day = timezone.localdate() - timedelta(days=2)
+        lines = [
+            json.dumps({'store_id': self.store.id, 'sku': 'IMPORT-0', 'movement_type': 'IN', 'quantity': 3,
+                        'timestamp': f'{day}T10:00:00'}) + '\n',
+            json.dumps({'store_id': self.store.id, 'sku': 'IMPORT-0', 'movement_type': 'SWAP', 'quantity': 3}) + '\n',
+            'not json\n',
+        ]
+        result = bulk_io.import_movements(lines, fmt='ndjson')
+
+        self.assertEqual((result['created'], result['failed']), (1, 2))
+        movement = StockMovement.objects.get(store=self.store)
+        self.assertEqual((movement.quantity, movement.processed), (3, True))
+        self.assertTrue(DailyStockSnapshot.objects.filter(store=self.store, product=self.products[0],
+                                                          day=day, in_quantity=3).exists())
+
+
+class MovementStreamIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Stream Store', location='Sialkot')
+        cls.product = Product.objects.create(name='Stream Product', sku='STREAM-1')
+
+    def setUp(self):
+        cache.clear()
+
+    def entry(self, entry_id, store_id=None, created_by_id=''):
+        return entry_id, {
+            b'store_id': str(store_id or self.store.id).encode(), b'product_id': str(self.product.id).encode(),
+            b'supplier_id': b'', b'created_by_id': str(created_by_id).encode(),
+            b'movement_type': b'IN', b'quantity': b'4',
+        }
+
+    def test_entries_delivered_twice_are_stored_once(self):
+        entries = [self.entry(b'1760000000000-0'), self.entry(b'1760000000000-1', created_by_id=999999),
+                   self.entry(b'1760000000500-0', store_id=999999)]
+        with mock.patch('inventory.movement_stream.schedule_movement_drain') as drain:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(movement_stream.store_entries(entries), (2, 1))
+            drain.assert_called_once_with({(self.store.id, self.product.id)})
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(movement_stream.store_entries(entries[:2]), (0, 0))
+            drain.assert_called_once()
+
+        movements = StockMovement.objects.order_by('ingest_id')
+        self.assertEqual([(m.ingest_id, m.created_by_id, m.processed) for m in movements],
+                         [('1760000000000-0', None, False), ('1760000000000-1', None, False)])
+        self.assertEqual(movements[0].timestamp, datetime(2025, 10, 9, 8, 53, 20, tzinfo=dt_timezone.utc))
+
+
+class StockEventsTicketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='events@example.com')
+        self.client = APIClient()
+
+    def test_tickets_identify_the_user_until_they_expire(self):
+        self.assertEqual(self.client.post('/api/stock/events/ticket/').status_code, 401)
+        self.client.force_authenticate(self.user)
+        ticket = self.client.post('/api/stock/events/ticket/').data['ticket']
+
+        self.assertEqual(async_to_sync(ticket_user)(ticket), self.user)
+        self.assertIsNone(async_to_sync(ticket_user)(ticket + 'x'))
+        with mock.patch.object(stock_events, 'STOCK_EVENTS_TICKET_MAX_AGE', -1):
+            self.assertIsNone(async_to_sync(ticket_user)(ticket))
+
+
+class AsyncEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='async@example.com')
+        cls.token = Token.objects.create(user=cls.user)
+        store = Store.objects.create(name='Async Store', location='Multan')
+        products = Product.objects.bulk_create([
+            Product(name=f'Async Product {i}', sku=f'ASYNC-{i}') for i in range(3)
+        ])
+        Stock.objects.bulk_create([Stock(store=store, product=product, quantity=i) for i, product in enumerate(products)])
+        AuditLog.objects.bulk_create([
+            AuditLog(action='stock_in', user=cls.user, store=store, product=product, details={'quantity': 1})
+            for product in products
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def get(self, path, **extra):
+        return self.client.get(path, HTTP_AUTHORIZATION=f'Token {self.token.key}', **extra)
+
+    def test_async_endpoints_answer_like_the_sync_ones(self):
+        for sync_path, async_path in (('/api/stock/', '/api/async/stock/'), ('/api/logs/', '/api/async/logs/')):
+            with self.subTest(path=async_path):
+                response = self.get(async_path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), json.loads(self.api.get(sync_path).content))
+
+                # Same pages, with next links back to the async endpoint
+                first = self.get(f'{async_path}?page_size=2').json()
+                self.assertTrue(first['next'].startswith(f'http://testserver{async_path}?cursor='))
+                second = self.get(first['next']).json()
+                self.assertIsNone(second['next'])
+                self.assertEqual(first['results'] + second['results'], response.json())
+
+    async def test_async_stock_streams_ndjson(self):
+        response = await self.async_client.get('/api/async/stock/?stream=1',
+                                                headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)['quantity'] for line in lines), [0, 1, 2])
+
+    def test_async_endpoints_need_a_valid_token_and_get(self):
+        self.assertEqual(self.client.get('/api/async/stock/').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/logs/', HTTP_AUTHORIZATION='Token wrong').status_code, 401)
+        self.assertEqual(self.client.post('/api/async/stock/', HTTP_AUTHORIZATION=f'Token {self.token.key}').status_code, 405)
+        self.assertEqual(self.get('/api/async/logs/?limit=x').status_code, 400)
+
+
+class StockDateFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Date Store', location='Multan')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Dated Product {i}', sku=f'DATED-{i}') for i in range(3)
+        ])
+        cls.user = User.objects.create(email='dates@example.com')
+
+    def setUp(self):
+        cache.clear()
+        # The first product moved ten days ago, the second two days ago, the third never
+        for product, days_ago in zip(self.products, (10, 2)):
+            self.move(product, days_ago)
+        Stock.objects.create(store=self.store, product=self.products[2], quantity=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def move(self, product, days_ago, processed=True):
+        movement = StockMovement.objects.create(store=self.store, product=product, movement_type='IN', quantity=5)
+        StockMovement.objects.filter(pk=movement.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        if processed:
+            tasks.process_movement_batch(100)
+
+    def moved(self, **days_ago):
+        """Return the indexes of the products listed for start_date/end_date given in days ago."""
+        today = timezone.localdate()
+        query = '&'.join(f'{name}={today - timedelta(days=days)}' for name, days in days_ago.items())
+        indexes = {product.id: index for index, product in enumerate(self.products)}
+        return sorted(indexes[row['product']['id']] for row in self.client.get(f'/api/stock/?{query}').data)
+
+    def test_movement_date_range(self):
+        self.assertEqual(self.moved(start_date=5), [1])
+        self.assertEqual(self.moved(end_date=5), [0])
+        self.assertEqual(self.moved(start_date=10, end_date=2), [0, 1])
+        self.assertEqual(self.moved(start_date=1), [])
+
+    def test_unprocessed_movements_count(self):
+        # Not processed yet, so there is no snapshot of its day
+        self.move(self.products[2], 7, processed=False)
+        self.assertEqual(self.moved(start_date=8, end_date=6), [2])
+        self.assertEqual(self.moved(start_date=6), [1])
+        self.assertEqual(self.moved(end_date=8), [0])
+
+    def test_invalid_bounds_are_ignored(self):
+        rows = self.client.get('/api/stock/?start_date=not-a-day&end_date=2020-13-40').data
+        self.assertEqual(len(rows), 2)
+
+
+class StockListingPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        stores = Store.objects.bulk_create([Store(name=f'Page Store {i}', location='Quetta') for i in range(2)])
+        products = Product.objects.bulk_create([
+            Product(name=f'Page Product {i}', sku=f'PAGE-{i}') for i in range(4)
+        ])
+        # Repeated quantities make the pages break ties on id
+        Stock.objects.bulk_create([
+            Stock(store=store, product=product, quantity=(index % 3) * 10)
+            for store in stores for index, product in enumerate(products)
+        ])
+        cls.user = User.objects.create(email='pages@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        expected = list(Stock.objects.order_by('-quantity', '-id').values_list('id', flat=True))
+        url = '/api/stock/?sort=quantity&order=desc&page_size=3'
+        ids = []
+        while url and len(ids) <= len(expected):
+            page = self.client.get(url).data
+            self.assertLessEqual(len(page['results']), 3)
+            ids.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('not-base64!', 'WzFd', 'eyJhIjogMX0='):
+            response = self.client.get(f'/api/stock/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404)
+
+    def test_stream_is_ndjson_of_every_row(self):
+        response = self.client.get('/api/stock/?stream=1')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(Stock.objects.values_list('id', flat=True)))
+        self.assertEqual(rows[0], self.client.get(f"/api/stock/?product={rows[0]['product']['id']}"
+                                                  f"&store={rows[0]['store']['id']}").data[0])
+
+
+class FlatSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        stores = [Store.objects.create(name='Flat Store', location='Sialkot'),
+                  Store.objects.create(name='Unlocated Store', location='')]
+        product = Product.objects.create(name='Flat Product', sku='FLAT-1')
+        for store in stores:
+            Stock.objects.create(store=store, product=product, quantity=12)
+        user = User.objects.create(email='flat@example.com')
+        AuditLog.objects.create(action='stock_in', user=user, store=stores[0], product=product,
+                                details={'quantity': 12})
+        AuditLog.objects.create(action='stock_out', details={})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rows_match_the_model_serializers(self):
+        stocks = Stock.objects.select_related('store', 'product').order_by('id')
+        self.assertEqual(StockFlatSerializer().serialize(stocks), StockSerializer(stocks, many=True).data)
+
+        logs = AuditLog.objects.select_related('user').order_by('id')
+        self.assertEqual(AuditLogFlatSerializer().serialize(logs), AuditLogSerializer(logs, many=True).data)
+
+
+class StockHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='History Store', location='Bahawalpur')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'History Product {i}', sku=f'HISTORY-{i}') for i in range(4)
+        ])
+        Stock.objects.bulk_create([Stock(store=cls.store, product=product, quantity=10) for product in cls.products])
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+
+    def move(self, product, movement_type, quantity, days_ago=0):
+        movement = StockMovement.objects.create(store=self.store, product=product,
+                                                movement_type=movement_type, quantity=quantity)
+        StockMovement.objects.filter(pk=movement.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        tasks.process_movement_batch(100)
+
+    def snapshots(self, product):
+        return list(DailyStockSnapshot.objects.filter(store=self.store, product=product).order_by('day')
+                    .values_list('day', 'opening_quantity', 'closing_quantity'))
+
+    def test_backdated_movements_shift_later_snapshots(self):
+        product = self.products[0]
+        start = Stock.objects.get(store=self.store, product=product).quantity
+        self.move(product, 'IN', 10)
+        self.move(product, 'IN', 5, days_ago=3)
+        self.move(product, 'IN', 2, days_ago=1)
+
+        self.assertEqual(self.snapshots(product), [
+            (self.today - timedelta(days=3), start, start + 5),
+            (self.today - timedelta(days=1), start + 5, start + 7),
+            (self.today, start + 7, start + 17),
+        ])
+        self.assertEqual(Stock.objects.get(store=self.store, product=product).quantity, start + 17)
+
+    def test_as_of_pages_follow_as_of_quantities(self):
+        # Today's movements reverse the order of yesterday's quantities
+        for index, product in enumerate(self.products):
+            Stock.objects.filter(store=self.store, product=product).update(quantity=index * 10)
+            self.move(product, 'IN', 100 - index * 30)
+        yesterday = (self.today - timedelta(days=1)).isoformat()
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create(email='history@example.com'))
+        url = f'/api/stock/?store={self.store.id}&sort=quantity&as_of={yesterday}&page_size=1'
+        quantities = []
+        while url and len(quantities) <= len(self.products):
+            page = client.get(url).data
+            quantities.extend(row['quantity'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(quantities, [0, 10, 20, 30])
+
+
+class DatasetGeneratorTests(TestCase):
+    options = {'stores': 3, 'products': 20, 'movements': 300, 'suppliers': 2, 'assortment': 8, 'days': 5,
+               'pending': 4, 'seed': 7, 'end_date': date(2025, 3, 31), 'log': lambda message: None}
+
+    def setUp(self):
+        cache.clear()
+
+    def generated_rows(self):
+        return {
+            'movements': list(StockMovement.objects.order_by('timestamp', 'id').values_list(
+                'store__name', 'product__sku', 'movement_type', 'quantity', 'timestamp', 'processed')),
+            'stock': list(Stock.objects.order_by('store__name', 'product__sku').values_list(
+                'store__name', 'product__sku', 'quantity')),
+            'audit_logs': list(AuditLog.objects.order_by('timestamp', 'id').values_list(
+                'action', 'store__name', 'product__sku', 'timestamp')),
+        }
+
+    def test_same_seed_generates_the_same_consistent_rows(self):
+        counts = generate_dataset(**self.options)
+        self.assertEqual((counts['movements'], counts['pending'], counts['audit_logs']), (300, 4, 300))
+        first = self.generated_rows()
+
+        # Quantities agree with the last snapshot of every moved pair
+        closing = {}
+        for store_id, product_id, quantity in DailyStockSnapshot.objects.order_by('day').values_list(
+                'store_id', 'product_id', 'closing_quantity'):
+            closing[(store_id, product_id)] = quantity
+        for stock in Stock.objects.filter(product__sku__startswith='GEN7-'):
+            if (stock.store_id, stock.product_id) in closing:
+                self.assertEqual(stock.quantity, closing[(stock.store_id, stock.product_id)])
+
+        with self.assertRaises(ValueError):
+            generate_dataset(**self.options)
+
+        AuditLog.objects.all().delete()
+        for model in (Store, Product, Supplier):
+            model.objects.all().delete()
+        generate_dataset(**self.options)
+        self.assertEqual(self.generated_rows(), first)
+
+
+class PerformanceBudgetTests(TestCase):
+    @mock.patch.dict(metrics.PERFORMANCE_BUDGETS, {'budget_test': {'queries': 1}})
+    def test_over_budget_measurements_are_logged(self):
+        measurement = metrics.Measurement()
+        measurement.queries = 3
+        with self.assertLogs('inventory.metrics', 'WARNING') as logs:
+            metrics.finish('request', 'budget_test', measurement, enforce=False, flush=False)
+        self.assertIn('budget_test: queries 3 > 1', logs.output[0])
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def route(self, method, authorization):
+        """Return the alias Stock reads are routed to during a request."""
+        routed = []
+
+        def view(request):
+            routed.append(router.db_for_read(Stock))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/api/stock/', HTTP_AUTHORIZATION=authorization)
+        ReplicaRoutingMiddleware(view)(request)
+        return routed[0]
+
+    @mock.patch.object(db_router, 'DATABASE_REPLICAS', ['replica'])
+    def test_reads_stay_on_the_primary_after_a_write(self):
+        self.assertEqual(self.route('get', 'Token first'), 'replica')
+        self.assertEqual(self.route('post', 'Token first'), 'default')
+        self.assertEqual(self.route('get', 'Token first'), 'default')
+        self.assertEqual(self.route('get', 'Token second'), 'replica')
+
+        later = time.time() + db_router.REPLICA_STICKY_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.route('get', 'Token first'), 'replica')
+
+    @mock.patch.object(db_router, 'DATABASE_REPLICAS', [])
+    def test_without_replicas_the_cache_is_not_read(self):
+        with mock.patch.object(db_router, 'cache') as sticky_cache:
+            sticky_cache.get.side_effect = RuntimeError('cache unavailable')
+            self.assertFalse(db_router.is_sticky('auth:client'))
+            self.assertEqual(self.route('get', 'Token first'), 'default')
+        sticky_cache.get.assert_not_called()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs partitioned tables')
+class PartitionRetentionTests(TestCase):
+    table = 'inventory_stockmovement'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Retention Store', location='Sukkur')
+        cls.product = Product.objects.create(name='Retention Product', sku='RETAIN-1')
+
+    def setUp(self):
+        cache.clear()
+
+    def partitions(self):
+        with connection.cursor() as cursor:
+            return partitions.list_partitions(cursor, self.table)
+
+    def move(self, movement_type, quantity, timestamp, processed=True):
+        movement = StockMovement.objects.create(store=self.store, product=self.product,
+                                                movement_type=movement_type, quantity=quantity)
+        StockMovement.objects.filter(pk=movement.pk).update(timestamp=timestamp, processed=processed)
+
+    def test_partitions_are_created_for_months_ahead(self):
+        created = partitions.ensure_partitions(months_ahead=2, today=date(2040, 1, 15))
+        self.assertEqual(sorted(created), sorted(
+            partitions.partition_name(table, month) for table in partitions.PARTITIONED_TABLES
+            for month in (date(2040, 1, 1), date(2040, 2, 1), date(2040, 3, 1))
+        ))
+        self.assertEqual(partitions.ensure_partitions(months_ahead=2, today=date(2040, 1, 15)), [])
+
+    def test_retention_rolls_up_old_months_before_dropping_them(self):
+        march, april = date(2020, 3, 1), date(2020, 4, 1)
+        self.move('IN', 5, datetime(2020, 3, 10, 12, tzinfo=dt_timezone.utc))
+        self.move('OUT', 2, datetime(2020, 3, 10, 13, tzinfo=dt_timezone.utc))
+        self.move('IN', 1, datetime(2020, 4, 2, 12, tzinfo=dt_timezone.utc), processed=False)
+        # The rows sat in the default partition until their months were created
+        partitions.ensure_partition_range(march, april)
+
+        dropped = partitions.apply_retention(self.table, keep_months=13)
+
+        self.assertEqual(dropped, [partitions.partition_name(self.table, march)])
+        self.assertNotIn(march, self.partitions())
+        self.assertIn(april, self.partitions())
+        snapshot = DailyStockSnapshot.objects.values_list(
+            'in_quantity', 'out_quantity', 'movement_count', 'closing_quantity'
+        ).get(store=self.store, product=self.product, day=date(2020, 3, 10))
+        self.assertEqual(snapshot, (5, 2, 2, None))
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent row locks')
+class ConcurrentMovementTests(TransactionTestCase):
+    initial = 10 ** 6  # high enough that no sale clamps to zero
+
+    def setUp(self):
+        cache.clear()
+        self.stores = [Store.objects.create(name=f'Store {i}', location='Lahore') for i in range(2)]
+        self.products = [Product.objects.create(name=f'Product {i}', sku=f'RACE-{i}') for i in range(3)]
+        for store in self.stores:
+            for product in self.products:
+                Stock.objects.create(store=store, product=product, quantity=self.initial)
+
+    def queue_movements(self, pairs, count):
+        """Create count movements spread over pairs; returns the expected quantity of each pair."""
+        movements = StockMovement.objects.bulk_create([
+            StockMovement(store=pairs[i % len(pairs)][0], product=pairs[i % len(pairs)][1],
+                          movement_type='IN' if i % 3 else 'OUT', quantity=i % 50 + 1)
+            for i in range(count)
+        ])
+        expected = {}
+        for movement in movements:
+            change = movement.quantity if movement.movement_type == 'IN' else -movement.quantity
+            key = (movement.store_id, movement.product_id)
+            expected[key] = expected.get(key, self.initial) + change
+        return movements, expected
+
+    def run_threads(self, func, args, workers=6):
+        def run(arg):
+            try:
+                func(arg)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, args))
+
+    def quantities(self):
+        return {(stock.store_id, stock.product_id): stock.quantity for stock in Stock.objects.all()}
+
+    def test_single_movements_lose_no_updates(self):
+        store, product = self.stores[0], self.products[0]
+        movements, expected = self.queue_movements([(store, product)], 300)
+        # Every movement is submitted twice to exercise the processed claim
+        self.run_threads(tasks.apply_stock_movement, [movement.id for movement in movements] * 2)
+
+        self.assertEqual(self.quantities()[store.id, product.id], expected[store.id, product.id])
+        self.assertEqual(AuditLog.objects.filter(store=store, product=product).count(), 300)
+
+    @mock.patch('inventory.tasks.schedule_movement_drain')
+    def test_concurrent_drains_lose_no_updates(self, schedule):
+        pairs = [(store, product) for store in self.stores for product in self.products]
+        _, expected = self.queue_movements(pairs, 600)
+
+        def drain(_):
+            while tasks.process_movement_batch(25):
+                pass
+
+        self.run_threads(drain, range(6))
+        self.assertEqual(self.quantities(), expected)
+        self.assertFalse(StockMovement.objects.filter(processed=False).exists())
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        if connection.vendor == 'postgresql':
+            # Empty test tables would otherwise be sequentially scanned
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for description, queryset, index in query_plans():
+            with self.subTest(description):
+                plan = queryset.explain()
+                self.assertTrue(any(name in plan for name in index_names(index)), plan)
+
+
+class QueryCountTests(TestCase):
+    def add_rows(self, size):
+        """Add two stores with ten stocked products each, size movements and size audit logs."""
+        stores = Store.objects.bulk_create([
+            Store(name=f'Count Store {size}-{i}', location='Lahore') for i in range(2)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'Count Product {size}-{i}', sku=f'COUNT-{size}-{i}') for i in range(10)
+        ])
+        Stock.objects.bulk_create([
+            Stock(store=store, product=product, quantity=index * 7 % 60)
+            for store in stores for index, product in enumerate(products)
+        ])
+        StockMovement.objects.bulk_create([
+            StockMovement(store=stores[i % 2], product=products[i % 10],
+                          movement_type=('IN', 'OUT', 'REM')[i % 3], quantity=i % 50 + 1)
+            for i in range(size)
+        ])
+        AuditLog.objects.bulk_create([
+            AuditLog(action='query_count', store=stores[i % 2], product=products[i % 10],
+                     details={'sequence': i})
+            for i in range(size)
+        ])
+        return stores
+
+    def test_listings_stay_within_their_query_budget(self):
+        factory = APIRequestFactory()
+        user = User.objects.create(email='query-counts@example.com')
+        for size in (20, 200):
+            stores = self.add_rows(size)
+            for description, view, path, budget in endpoints():
+                path = path.format(store=stores[0].id)
+                requests = [factory.get(path), factory.get(path)]
+                for request in requests:
+                    force_authenticate(request, user)
+                # The first request warms the reference cache
+                view(requests[0]).render()
+                with self.subTest(description, rows=size), self.assertNumQueries(budget):
+                    view(requests[1]).render()
+
+
+class AuditSinkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Audit Store', location='Faisalabad')
+        cls.product = Product.objects.create(name='Audit Product', sku='AUDIT-1')
+
+    def setUp(self):
+        cache.clear()
+        self.entry = {'action': 'audit_test', 'store': self.store, 'product': self.product, 'details': {}}
+
+    def test_failed_flushes_keep_a_bounded_buffer(self):
+        sink = audit.AuditSink('buffered', buffer_size=2, flush_interval=60, max_buffered=3)
+        with mock.patch.object(sink, '_write', side_effect=RuntimeError('database unavailable')), \
+                self.assertLogs('inventory.audit', 'WARNING') as logs:
+            for _ in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    sink.record([AuditLog(**self.entry), AuditLog(**self.entry)])
+
+        self.assertEqual((len(sink._buffer), sink.dropped, audit.dropped_total()), (3, 3, 3))
+        self.assertTrue(any('dropped' in line for line in logs.output))
+        self.assertEqual(sink.flush(), 3)
+        self.assertEqual(AuditLog.objects.filter(action='audit_test').count(), 3)
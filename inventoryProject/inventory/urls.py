@@ -3,7 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (ProductViewSet, StockMovementViewSet, StoreViewSet, 
                    SupplierViewSet, StockViewSet,
                    generate_dummy_data, test_celery_connection, login_view, logout_view,
-             register_view, stock_api, logs_api)
+             register_view, stock_api, logs_api, stock_cache_stats, stock_summary_api, stock_events_api,
+             stock_events_ticket,
+             reference_cache_stats, metrics_api, stock_api_async, logs_api_async)
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
@@ -20,5 +22,14 @@ urlpatterns = [
     path('register/', register_view, name='register'),
     path('api/logout/', logout_view, name='logout'),
     path('api/stock/', stock_api, name='stock_api'),
+    path('api/stock/cache-stats/', stock_cache_stats, name='stock_cache_stats'),
+    path('api/stock/summary/', stock_summary_api, name='stock_summary_api'),
+    path('api/stock/events/', stock_events_api, name='stock_events_api'),
+    path('api/stock/events/ticket/', stock_events_ticket, name='stock_events_ticket'),
     path('api/logs/', logs_api, name='logs_api'),
+    # Async variants of the read endpoints, for ASGI servers
+    path('api/async/stock/', stock_api_async, name='stock_api_async'),
+    path('api/async/logs/', logs_api_async, name='logs_api_async'),
+    path('api/reference-cache/stats/', reference_cache_stats, name='reference_cache_stats'),
+    path('api/metrics/', metrics_api, name='metrics_api'),
 ]
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Version counters for conditional GETs.
+
+Every store has a counter that is bumped whenever its stock rows or daily
+snapshots change, and the catalog (products, stores and suppliers) has one
+shared counter. Counters are bumped once the changing transaction commits,
+so a version is never visible before the data it stands for. A response
+carries the versions it was built from as its ETag, and a request whose
+If-None-Match still matches is answered with 304 Not Modified before the
+view queries or serializes anything.
+
+Counters live in the Django cache and are incremented atomically. A counter
+that is missing (evicted, or the cache was flushed) is recreated from the
+current time in microseconds rather than from zero, so it never returns to
+a value that an old ETag carries. Without a working cache, no ETags are
+sent and every request is served in full.
+
+With read replicas, a request that arrives just after a version changed
+could read rows from a replica that has not caught up yet and tag them with
+the new version. Responses for versions changed within the last
+REPLICA_STICKY_SECONDS are therefore built from the primary.
+"""
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from . import async_cache
+from .db_router import DATABASE_REPLICAS, REPLICA_STICKY_SECONDS, primary_reads
+
+CATALOG_VERSION_KEY = 'version_catalog'
+ALL_STORES_VERSION_KEY = 'version_stores'  # bumped with every store, for lists across stores
+
+
+def store_version_key(store_id):
+    return f"version_store_{store_id}"
+
+
+def _changed_at_key(key):
+    return f"{key}_changed_at"
+
+
+def _seed():
+    return time.time_ns() // 1000
+
+
+def _bump(keys):
+    try:
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                if not cache.add(key, _seed(), timeout=None):
+                    cache.incr(key)
+        if DATABASE_REPLICAS:
+            now = time.time()
+            cache.set_many({_changed_at_key(key): now for key in keys}, timeout=REPLICA_STICKY_SECONDS * 2)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+
+
+def bump_stores(store_ids):
+    """Bump the versions of the given stores once the current transaction commits."""
+    keys = [store_version_key(store_id) for store_id in sorted(set(store_ids))]
+    if keys:
+        transaction.on_commit(lambda: _bump(keys + [ALL_STORES_VERSION_KEY]))
+
+
+def bump_catalog():
+    """Bump the catalog version once the current transaction commits."""
+    transaction.on_commit(lambda: _bump([CATALOG_VERSION_KEY]))
+
+
+def get_versions(keys):
+    """
+    Return (versions, recently_changed) for the given counter keys, creating
+    missing counters, or (None, False) if the cache is unavailable.
+    """
+    try:
+        lookup = list(keys)
+        if DATABASE_REPLICAS:
+            lookup += [_changed_at_key(key) for key in keys]
+        values = cache.get_many(lookup)
+        versions = []
+        for key in keys:
+            version = values.get(key)
+            if version is None:
+                cache.add(key, _seed(), timeout=None)
+                version = cache.get(key)
+            versions.append(version)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return None, False
+    if None in versions:
+        return None, False
+    return versions, _recently_changed(keys, values)
+
+
+async def aget_versions(keys):
+    """Async get_versions(); missing counters are created by get_versions() in a thread."""
+    lookup = list(keys)
+    if DATABASE_REPLICAS:
+        lookup += [_changed_at_key(key) for key in keys]
+    try:
+        values = await async_cache.aget_many(lookup)
+    except Exception as cache_error:
+        print(f"Cache operation failed (non-critical): {str(cache_error)}")
+        return None, False
+    versions = [values.get(key) for key in keys]
+    if None in versions:
+        return await sync_to_async(get_versions)(keys)
+    return versions, _recently_changed(keys, values)
+
+
+def _recently_changed(keys, values):
+    if not DATABASE_REPLICAS:
+        return False
+    cutoff = time.time() - REPLICA_STICKY_SECONDS
+    return any(values.get(_changed_at_key(key), 0) > cutoff for key in keys)
+
+
+def stock_version_keys(request, *args, **kwargs):
+    """
+    Counter keys of a stock response: the store's given store=<id>, else the
+    one bumped with every store, plus the catalog's for product and store names.
+    """
+    store_id = request.GET.get('store', '')
+    store_key = store_version_key(store_id) if store_id.isdigit() else ALL_STORES_VERSION_KEY
+    return [store_key, CATALOG_VERSION_KEY]
+
+
+def catalog_version_keys(request, *args, **kwargs):
+    return [CATALOG_VERSION_KEY]
+
+
+def _matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    # Weak comparison, as required for If-None-Match
+    return '*' in tags or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in tags)
+
+
+def conditional_get(version_keys):
+    """
+    Decorate a DRF view function or (with method_decorator) a view method so
+    that GETs get an ETag from the version counters that version_keys(request,
+    *args, **kwargs) returns, and matching If-None-Match requests get 304.
+
+    Apply it inside @api_view so authentication and permissions run first.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            versions, recently_changed = get_versions(version_keys(request, *args, **kwargs))
+            if versions is None:
+                return view(request, *args, **kwargs)
+
+            renderer = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+            etag = _etag(versions, renderer)
+            if _matches(request, etag):
+                response = HttpResponseNotModified()
+            elif recently_changed:
+                with primary_reads():
+                    response = view(request, *args, **kwargs)
+            else:
+                response = view(request, *args, **kwargs)
+            return _tag(response, etag)
+        return wrapper
+    return decorator
+
+
+def async_conditional_get(version_keys):
+    """
+    conditional_get() for async views, which answer in JSON. The versions are
+    read on the event loop, and the ETags match those of the DRF views.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+
+            versions, recently_changed = await aget_versions(version_keys(request, *args, **kwargs))
+            if versions is None:
+                return await view(request, *args, **kwargs)
+
+            etag = _etag(versions, 'json')
+            if _matches(request, etag):
+                response = HttpResponseNotModified()
+            elif recently_changed:
+                with primary_reads():
+                    response = await view(request, *args, **kwargs)
+            else:
+                response = await view(request, *args, **kwargs)
+            return _tag(response, etag)
+        return wrapper
+    return decorator
+
+
+def _etag(versions, renderer):
+    return f'W/"{"-".join(str(version) for version in versions)}-{renderer}"'
+
+
+def _tag(response, etag):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        # Clients may keep the response but must revalidate it every time
+        response['Cache-Control'] = 'private, no-cache'
+    return response
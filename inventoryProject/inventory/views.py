@@ -1,19 +1,24 @@
 import json
 import random
 from datetime import datetime, timedelta
+from functools import wraps
+from asgiref.sync import sync_to_async
 from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import make_password
-from django.db import models
+from django.db import transaction
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from celery import Celery
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import permission_classes
@@ -21,7 +26,7 @@ from rest_framework.permissions import IsAuthenticated
 
 from django.contrib.auth.decorators import login_required
 from celery import Celery
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
 from .models import (
     Product, 
@@ -30,18 +35,35 @@ from .models import (
     Supplier, 
     Stock, 
     User, 
-    AuditLog
+    AuditLog,
+    StoreStockSummary
 )
 from .serializers import (
     ProductSerializer, 
     StockMovementSerializer, 
     StoreSerializer, 
+    StoreDetailSerializer,
     SupplierSerializer, 
     StockSerializer,
     UserSerializer, 
-    AuditLogSerializer
+    AuditLogSerializer,
+    StockFlatSerializer,
+    StockAsOfFlatSerializer,
+    AuditLogFlatSerializer
 )
-from .tasks import process_stock_movement
+from . import audit, metrics, movement_stream, reference_cache, stock_cache, stock_events
+from .pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, keyset_result, keyset_slice, ndjson_astream, ndjson_stream,
+    wants_page, wants_stream,
+)
+from .summaries import STATUS_FIELDS, rebuild_store_summaries, status_filter, stock_status
+from .bulk_io import decode_lines, export_movements, export_stock, file_format, import_movements, import_stock
+from .datasets import generate_dataset
+from .ingest import IngestError, parse_movement_lines, validate_movement_lines
+from .search import rank_search, search_filter, sku_prefix_filter
+from .versions import async_conditional_get, catalog_version_keys, conditional_get, stock_version_keys
+from .snapshots import parse_day, quantity_as_of, rebuild_snapshots, snapshot_date_filter
+from .tasks import apply_stock_movement, process_pending_movements, schedule_movement_drain
 
 
 
@@ -224,7 +246,276 @@ def logout_view(request):
 
 
 
+# Audit logs page by timestamp, newest first
+AUDIT_LOG_SORT_KEYS = {
+    'timestamp': lambda row: row['timestamp'],
+}
+
+STOCK_EVENTS_MAX_STORES = 100  # stores one event stream may follow
+
+# Query parameters that can be answered from the stock cache
+CACHEABLE_STOCK_PARAMS = {'store', 'product', 'status', 'sort', 'order'}
+
+# Map stock_api field names to model field names
+STOCK_API_FIELD_MAPPING = {
+    'product_name': 'product__name',
+    'sku': 'product__sku',
+    'store_name': 'store__name',
+    'quantity': 'quantity',
+    'updated_at': 'id',
+}
+
+# Sortable stock fields, with how to read each one from a serialized row
+STOCK_SORT_KEYS = {
+    'product__name': lambda row: row['product']['name'],
+    'product__sku': lambda row: row['product']['sku'],
+    'store__name': lambda row: row['store']['name'],
+    'quantity': lambda row: row['quantity'],
+    # as_of listings report quantity_as_of as the quantity
+    'quantity_as_of': lambda row: row['quantity'],
+    'id': lambda row: row['id'],
+}
+
+
+def cached_stock_lookup(params, field_mapping, default_sort=None):
+    """
+    Return (store_id, product_id or None, sort_field) of a stock list the
+    stock cache can answer, or None if the query needs the database (no store
+    given, or filters the cache cannot answer).
+    """
+    store_id = params.get('store')
+    if not store_id or not set(params) <= CACHEABLE_STOCK_PARAMS:
+        return None
+
+    sort_field = params.get('sort', default_sort)
+    sort_field = field_mapping.get(sort_field, sort_field)
+    if sort_field and sort_field not in STOCK_SORT_KEYS:
+        return None
+
+    try:
+        product_id = params.get('product')
+        return int(store_id), int(product_id) if product_id else None, sort_field
+    except ValueError:
+        return None
+
+
+def filter_cached_rows(rows, params, sort_field, threshold=None):
+    """Apply the status filter and sorting of a cached stock list to its rows."""
+    status = params.get('status')
+    if status in STATUS_FIELDS:
+        rows = [row for row in rows if stock_status(row['quantity'], threshold) == status]
+
+    if sort_field:
+        rows = sorted(rows, key=STOCK_SORT_KEYS[sort_field], reverse=params.get('order') == 'desc')
+    return rows
+
+
+def cached_stock_rows(params, field_mapping, default_sort=None):
+    """
+    Serve a single store's stock list from the stock cache.
+    
+    Returns the serialized rows, or None if the query needs the database
+    (no store given, or filters the cache cannot answer).
+    """
+    lookup = cached_stock_lookup(params, field_mapping, default_sort)
+    if lookup is None:
+        return None
+    store_id, product_id, sort_field = lookup
+
+    if product_id is not None:
+        row = stock_cache.get_stock(store_id, product_id)
+        rows = [row] if row else []
+    else:
+        rows = stock_cache.get_store_stock(store_id)
+
+    threshold = None
+    if params.get('status') in STATUS_FIELDS:
+        threshold = stock_cache.get_low_stock_threshold(store_id)
+    return filter_cached_rows(rows, params, sort_field, threshold)
+
+
+async def acached_stock_rows(params, field_mapping, default_sort=None):
+    """Async cached_stock_rows(), serving cache hits on the event loop."""
+    lookup = cached_stock_lookup(params, field_mapping, default_sort)
+    if lookup is None:
+        return None
+    store_id, product_id, sort_field = lookup
+
+    if product_id is not None:
+        row = await stock_cache.aget_stock(store_id, product_id)
+        rows = [row] if row else []
+    else:
+        rows = await stock_cache.aget_store_stock(store_id)
+
+    threshold = None
+    if params.get('status') in STATUS_FIELDS:
+        threshold = await stock_cache.aget_low_stock_threshold(store_id)
+    return filter_cached_rows(rows, params, sort_field, threshold)
+
+
+def filter_stocks(params):
+    """
+    Apply the stock_api filters in params to the Stock queryset.
+
+    Returns (queryset, serializer); the serializer reports the quantities at
+    the end of the as_of day when one is given. Only a search term is looked
+    up in the database right away (see search_filter).
+    """
+    store_id = params.get('store')
+    status = params.get('status')
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    supplier_id = params.get('supplier')
+    product_name = params.get('product_name')
+    search = params.get('search')
+
+    # Base queryset with related data
+    stocks = Stock.objects.select_related('product', 'store').all()
+
+    # Apply filters
+    if store_id:
+        stocks = stocks.filter(store_id=store_id)
+
+    product_id = params.get('product')
+    if product_id:
+        stocks = stocks.filter(product_id=product_id)
+    
+    if status in STATUS_FIELDS:
+        # Low stock is relative to each store's low_stock_threshold
+        stocks = stocks.filter(status_filter(status))
+    
+    if start_date or end_date:
+        stocks = stocks.filter(snapshot_date_filter(start_date, end_date))
+    
+    if supplier_id:
+        supplier_movements = StockMovement.objects.filter(supplier_id=supplier_id).values_list('product_id', flat=True).distinct()
+        stocks = stocks.filter(product_id__in=supplier_movements)
+    
+    if product_name:
+        stocks = stocks.filter(product__name__icontains=product_name)
+    
+    if search:
+        stocks = stocks.filter(search_filter(search))
+
+    # SKU prefix, e.g. from a barcode scanner
+    sku = params.get('sku')
+    if sku:
+        stocks = stocks.filter(sku_prefix_filter(sku))
+
+    # Historical quantities come from the daily stock snapshots
+    serializer = StockFlatSerializer()
+    as_of = parse_day(params.get('as_of'))
+    if as_of:
+        stocks = stocks.annotate(quantity_as_of=quantity_as_of(as_of))
+        serializer = StockAsOfFlatSerializer()
+    return stocks, serializer
+
+
+def stock_api_sort(params):
+    """Return the model field and direction (descending or not) a stock_api request sorts by."""
+    sort_field = params.get('sort', 'product__name')
+    sort_field = STOCK_API_FIELD_MAPPING.get(sort_field, sort_field)
+    if sort_field == 'quantity' and parse_day(params.get('as_of')):
+        # Sort (and seek) on the quantities the rows report
+        sort_field = 'quantity_as_of'
+    return sort_field, params.get('order', 'asc') == 'desc'
+
+
+def order_stocks(stocks, params):
+    """Apply sorting; searches without an explicit sort list the best matches first."""
+    search = params.get('search')
+    if search and 'sort' not in params:
+        return rank_search(stocks, search)
+    sort_field, descending = stock_api_sort(params)
+    sort_prefix = '-' if descending else ''
+    return stocks.order_by(f'{sort_prefix}{sort_field}')
+
+
+def filter_audit_logs(params):
+    """
+    Apply the logs_api filters in params to the AuditLog queryset.
+
+    Raises ValueError with a message for the client when store or product
+    is not an id.
+    """
+    action_filter = params.get('action')
+    date_from = params.get('start_date')
+    date_to = params.get('end_date')
+    user = params.get('user')
+    store_id = params.get('store')
+    product_id = params.get('product')
+
+    logs = AuditLog.objects.all()
+
+    if action_filter:
+        logs = logs.filter(action__icontains=action_filter)
+
+    if date_from:
+        try:
+            date_from_aware = timezone.make_aware(datetime.strptime(date_from, '%Y-%m-%d'))
+            logs = logs.filter(timestamp__gte=date_from_aware)
+        except (ValueError, TypeError):
+            pass
+
+    if date_to:
+        try:
+            date_to_aware = timezone.make_aware(datetime.strptime(date_to, '%Y-%m-%d'))
+            logs = logs.filter(timestamp__lt=date_to_aware + timedelta(days=1))
+        except (ValueError, TypeError):
+            pass
+
+    if user:
+        if user.isdigit():
+            logs = logs.filter(user_id=user)
+        else:
+            logs = logs.filter(user__email__icontains=user)
+
+    for field, value in (('store_id', store_id), ('product_id', product_id)):
+        if value:
+            if not value.isdigit():
+                raise ValueError(f'{field[:-3]} must be an id')
+            logs = logs.filter(**{field: value})
+    return logs
+
+
+def import_response(result):
+    """Build the response of a bulk import: 201 when every line was imported, 207 when some failed."""
+    if result['dry_run']:
+        response_status = status.HTTP_200_OK
+    elif not result['failed']:
+        response_status = status.HTTP_201_CREATED
+    elif result['created'] or result.get('updated'):
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response(result, status=response_status)
+
+
+def bulk_import_options(request):
+    """Return the (format, dry_run) of a bulk import request."""
+    return file_format(request.content_type), request.query_params.get('dry_run') in ('1', 'true')
+
+
+def export_store_ids(params):
+    """Parse the comma separated store ids of an export, returning None when invalid."""
+    store = params.get('store', '')
+    if not store:
+        return []
+    store_ids = store.split(',')
+    return [int(store_id) for store_id in store_ids] if all(store_id.isdigit() for store_id in store_ids) else None
+
+
+def export_response(chunks, fmt, name):
+    """Stream export chunks as a file download."""
+    extension = 'ndjson' if fmt == 'ndjson' else 'csv'
+    response = StreamingHttpResponse(chunks, content_type='application/x-ndjson' if fmt == 'ndjson' else 'text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    return response
+
+
 # Model ViewSets
+@method_decorator(conditional_get(catalog_version_keys), name='list')
+@method_decorator(conditional_get(catalog_version_keys), name='retrieve')
 class ProductViewSet(viewsets.ModelViewSet):
     """
     API endpoint for CRUD operations on Products.
@@ -235,6 +526,8 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
 
 
+@method_decorator(conditional_get(catalog_version_keys), name='list')
+@method_decorator(conditional_get(catalog_version_keys), name='retrieve')
 class StoreViewSet(viewsets.ModelViewSet):
     """
     API endpoint for CRUD operations on Stores.
@@ -242,9 +535,11 @@ class StoreViewSet(viewsets.ModelViewSet):
     Provides list, create, retrieve, update, and delete functionality.
     """
     queryset = Store.objects.all()
-    serializer_class = StoreSerializer
+    serializer_class = StoreDetailSerializer
 
 
+@method_decorator(conditional_get(catalog_version_keys), name='list')
+@method_decorator(conditional_get(catalog_version_keys), name='retrieve')
 class SupplierViewSet(viewsets.ModelViewSet):
     """
     API endpoint for CRUD operations on Suppliers.
@@ -255,6 +550,7 @@ class SupplierViewSet(viewsets.ModelViewSet):
     serializer_class = SupplierSerializer
 
 
+@method_decorator(conditional_get(stock_version_keys), name='retrieve')
 class StockViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for read-only operations on Stock.
@@ -266,73 +562,73 @@ class StockViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['store', 'product']
     search_fields = ['product__name', 'product__sku', 'store__name']
     ordering_fields = ['quantity', 'product__name', 'store__name']
+    # Map frontend field names to model field names
+    sort_field_mapping = {
+        'product_name': 'product__name',
+        'sku': 'product__sku',
+        'store_name': 'store__name',
+        'quantity': 'quantity',
+        'updated_at': 'id'  
+    }
+
+    @method_decorator(conditional_get(stock_version_keys))
+    def list(self, request, *args, **kwargs):
+        """
+        List stock, serving single-store lookups from the stock cache.
+        
+        Pass page_size/cursor for keyset pagination or stream=1 for an NDJSON export.
+        Answers If-None-Match with 304 while the stock is unchanged (see versions).
+        """
+        rows = cached_stock_rows(request.query_params, self.sort_field_mapping)
+        if rows is not None:
+            return Response(rows)
+
+        params = request.query_params
+        if wants_stream(params) or wants_page(params):
+            queryset = self.filter_queryset(self.get_queryset())
+            sort_field = params.get('sort', 'id')
+            sort_field = self.sort_field_mapping.get(sort_field, sort_field)
+            descending = params.get('order') == 'desc'
+            if wants_stream(params):
+                return ndjson_stream(StockFlatSerializer().iter_rows(queryset))
+            return keyset_page(request, queryset, sort_field, descending,
+                               StockFlatSerializer().serialize, STOCK_SORT_KEYS)
+
+        # Build rows from values_list() tuples instead of DRF serializer fields
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(StockFlatSerializer().serialize(queryset))
 
     def get_queryset(self):
         """
         Customize the returned queryset based on request parameters.
         
-        Supports filtering by search, status, date range, supplier, and custom sorting.
+        Supports filtering by search (ranked unless sorted), SKU prefix, status,
+        date range, supplier, and custom sorting.
         """
         queryset = super().get_queryset()
         
         # Get search parameter
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                models.Q(product__name__icontains=search) |
-                models.Q(product__sku__icontains=search) |
-                models.Q(store__name__icontains=search)
-            )
+            queryset = queryset.filter(search_filter(search))
+
+        # SKU prefix, e.g. from a barcode scanner
+        sku = self.request.query_params.get('sku')
+        if sku:
+            queryset = queryset.filter(sku_prefix_filter(sku))
         
         # Status filtering
         status = self.request.query_params.get('status')
-        if status:
-            if status == 'out_of_stock':
-                queryset = queryset.filter(quantity=0)
-            elif status == 'low_stock':
-                queryset = queryset.filter(quantity__gt=0, quantity__lt=20)
-            elif status == 'in_stock':
-                queryset = queryset.filter(quantity__gte=20)
-
-        # Date filtering based on related stock movements
+        if status in STATUS_FIELDS:
+            # Low stock is relative to each store's low_stock_threshold
+            queryset = queryset.filter(status_filter(status))
+
+        # Date filtering based on the daily stock snapshots
         start_date = self.request.query_params.get('start_date')
         end_date = self.request.query_params.get('end_date')
         
         if start_date or end_date:
-            # Start with all stock movement product and store combinations
-            stock_movements_query = StockMovement.objects.all()
-            
-            if start_date:
-                try:
-                    # Convert to timezone-aware datetime
-                    start_date_aware = timezone.make_aware(datetime.strptime(start_date, '%Y-%m-%d'))
-                    stock_movements_query = stock_movements_query.filter(timestamp__gte=start_date_aware)
-                except (ValueError, TypeError):
-                    pass
-                    
-            if end_date:
-                try:
-                    # Convert to timezone-aware datetime and set to end of day
-                    end_date_aware = timezone.make_aware(datetime.strptime(end_date, '%Y-%m-%d'))
-                    end_date_aware = end_date_aware.replace(hour=23, minute=59, second=59)
-                    stock_movements_query = stock_movements_query.filter(timestamp__lte=end_date_aware)
-                except (ValueError, TypeError):
-                    pass
-            
-            # Get the product-store combinations from filtered movements
-            if start_date or end_date:  
-                product_store_pairs = stock_movements_query.values('product_id', 'store_id').distinct()
-                
-                # If there are no movements in the date range, return empty queryset
-                if not product_store_pairs.exists():
-                    return Stock.objects.none()
-                    
-                stock_filters = models.Q()
-                for pair in product_store_pairs:
-                    stock_filters |= models.Q(product_id=pair['product_id'], store_id=pair['store_id'])
-                
-                if stock_filters:  # Only apply if we have at least one pair
-                    queryset = queryset.filter(stock_filters)
+            queryset = queryset.filter(snapshot_date_filter(start_date, end_date))
 
         # Supplier filtering
         supplier_id = self.request.query_params.get('supplier')
@@ -349,22 +645,42 @@ class StockViewSet(viewsets.ReadOnlyModelViewSet):
         sort_order = self.request.query_params.get('order', 'asc')
         
         if sort_field:
-            # Map frontend field names to model field names
-            field_mapping = {
-                'product_name': 'product__name',
-                'sku': 'product__sku',
-                'store_name': 'store__name',
-                'quantity': 'quantity',
-                'updated_at': 'id'  
-            }
-            
-            sort_field = field_mapping.get(sort_field, sort_field)
+            sort_field = self.sort_field_mapping.get(sort_field, sort_field)
             if sort_order == 'desc':
                 sort_field = f'-{sort_field}'
             queryset = queryset.order_by(sort_field)
+        elif search:
+            # Best matches first
+            queryset = rank_search(queryset, search)
 
         return queryset
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_rows(self, request):
+        """
+        Set stock levels from a CSV (with a header line) or NDJSON
+        (Content-Type: application/x-ndjson) upload.
+
+        Each line has store_id, product_id or sku, and quantity. Existing rows
+        get the new quantity and missing ones are created; no stock movements
+        are recorded. Pass dry_run=1 to only validate.
+        """
+        fmt, dry_run = bulk_import_options(request)
+        result = import_stock(decode_lines(request.stream or []), fmt, dry_run=dry_run, user=request.user)
+        return import_response(result)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Download all stock rows, or those of store=<id>[,<id>...], as CSV or
+        with file_format=ndjson as NDJSON, in the format import_rows accepts.
+        """
+        store_ids = export_store_ids(request.query_params)
+        if store_ids is None:
+            return Response({'error': 'store must be a comma separated list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = file_format(request.query_params.get('file_format'))
+        return export_response(export_stock(fmt, store_ids), fmt, 'stock')
+
 class StockMovementViewSet(viewsets.ModelViewSet):
     """
     API endpoint for CRUD operations on Stock Movements.
@@ -378,79 +694,165 @@ class StockMovementViewSet(viewsets.ModelViewSet):
     search_fields = ['product__name', 'product__sku']
     ordering_fields = ['timestamp']
 
+    def create(self, request, *args, **kwargs):
+        """
+        Create a stock movement.
+
+        In the stream ingest mode (see movement_stream), the validated movement
+        is appended to the ingest stream instead, and the response is 202
+        Accepted with its ingest_id; it is stored and processed shortly after.
+        Falls back to storing it directly if the stream is unavailable.
+        """
+        if not movement_stream.is_enabled():
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user if request.user.is_authenticated else None
+        try:
+            ingest_id, = movement_stream.append([StockMovement(created_by=user, **serializer.validated_data)])
+        except Exception as e:
+            print(f"Movement stream append failed: {str(e)}")
+            print("Storing stock movement directly...")
+            self.perform_create(serializer)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response({'status': 'queued', 'ingest_id': ingest_id}, status=status.HTTP_202_ACCEPTED)
+
     def perform_create(self, serializer):
         """
         Process the stock movement after saving, using Celery if available.
         
-        Falls back to direct processing if Celery task fails.
+        Movements are picked up by a coalesced batch drain task instead of
+        one task per movement. Falls back to direct processing if Celery task fails.
         """
-        instance = serializer.save()
+        user = self.request.user if self.request.user.is_authenticated else None
+        instance = serializer.save(created_by=user)
         try:
-            user_id = self.request.user.id if self.request.user.is_authenticated else None
-            process_stock_movement.delay(instance.id, user_id=user_id)
+            schedule_movement_drain([(instance.store_id, instance.product_id)])
 
         except Exception as e:
             print(f"Celery task failed: {str(e)}")
             print("Processing stock movement directly...")
             self.process_stock_movement_directly(instance)
     
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Create many stock movements in one request.
+        
+        Accepts a JSON array or an NDJSON body (Content-Type: application/x-ndjson)
+        of movements with product_id, store_id, optional supplier_id, movement_type
+        and quantity. Valid lines are inserted with bulk_create and processed by a
+        single batch drain; the response has one result per line. In the stream
+        ingest mode, valid lines are appended to the ingest stream instead and
+        their results carry an ingest_id.
+        """
+        try:
+            lines = parse_movement_lines(request.body, request.content_type or '')
+        except IngestError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        movements, errors = validate_movement_lines(lines)
+
+        user = request.user if request.user.is_authenticated else None
+        for _, movement in movements:
+            movement.created_by = user
+
+        if movements and movement_stream.is_enabled():
+            try:
+                ingest_ids = movement_stream.append([movement for _, movement in movements])
+            except Exception as e:
+                print(f"Movement stream append failed: {str(e)}")
+                print("Storing stock movements directly...")
+            else:
+                return self._bulk_response(
+                    [{'line': number, 'status': 'queued', 'ingest_id': ingest_id}
+                     for (number, _), ingest_id in zip(movements, ingest_ids)],
+                    errors, 'queued', status.HTTP_202_ACCEPTED
+                )
+
+        with transaction.atomic():
+            StockMovement.objects.bulk_create([movement for _, movement in movements], batch_size=2000)
+
+        if movements:
+            try:
+                schedule_movement_drain({(movement.store_id, movement.product_id) for _, movement in movements})
+            except Exception as e:
+                print(f"Celery task failed: {str(e)}")
+                print("Processing stock movements directly...")
+                process_pending_movements()
+
+        return self._bulk_response(
+            [{'line': number, 'status': 'created', 'id': movement.id} for number, movement in movements],
+            errors, 'created', status.HTTP_201_CREATED
+        )
+
+    @staticmethod
+    def _bulk_response(results, errors, outcome, success_status):
+        accepted = len(results)
+        results.extend({'line': number, 'status': 'error', 'errors': line_errors} for number, line_errors in errors.items())
+        results.sort(key=lambda result: result['line'])
+
+        if not errors:
+            response_status = success_status
+        elif accepted:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            outcome: accepted,
+            'failed': len(errors),
+            'results': results
+        }, status=response_status)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_rows(self, request):
+        """
+        Import a movement history from a CSV (with a header line) or NDJSON
+        (Content-Type: application/x-ndjson) upload.
+
+        Each line has store_id, product_id or sku, movement_type, quantity and
+        optionally supplier_id and timestamp. Movements are stored as processed
+        history and the daily snapshots of their stores are rebuilt; pass
+        process=1 to apply them to the stock levels instead. Pass dry_run=1 to
+        only validate.
+        """
+        fmt, dry_run = bulk_import_options(request)
+        process = request.query_params.get('process') in ('1', 'true')
+        result = import_movements(decode_lines(request.stream or []), fmt, process=process, dry_run=dry_run,
+                                  user=request.user)
+        return import_response(result)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Download movements in id order as CSV, or with file_format=ndjson as
+        NDJSON. Filter with store=<id>[,<id>...] and start_date/end_date
+        (YYYY-MM-DD, inclusive).
+        """
+        params = request.query_params
+        store_ids = export_store_ids(params)
+        if store_ids is None:
+            return Response({'error': 'store must be a comma separated list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        for param in ('start_date', 'end_date'):
+            if params.get(param) and parse_day(params[param]) is None:
+                return Response({'error': f'{param} must be a date in YYYY-MM-DD format'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        fmt = file_format(params.get('file_format'))
+        chunks = export_movements(fmt, store_ids, params.get('start_date'), params.get('end_date'))
+        return export_response(chunks, fmt, 'stock-movements')
+
     def process_stock_movement_directly(self, movement):
         """
         Process a stock movement directly without using Celery.
         
-        Updates stock quantities and creates audit logs.
+        Updates stock quantities atomically and creates audit logs.
         """
         try:
-            # Check if this movement has already been processed
-            if movement.processed:
+            user_id = self.request.user.id if hasattr(self, 'request') and self.request.user.is_authenticated else None
+            if apply_stock_movement(movement.id, user_id=user_id) is None:
                 print(f"Movement {movement.id} already processed. Skipping.")
                 return
-                
-            stock, created = Stock.objects.get_or_create(
-                store=movement.store, 
-                product=movement.product,
-                defaults={'quantity': 0}
-            )
-            
-            # Update the stock quantity based on movement type
-            if movement.movement_type == 'IN':
-                stock.quantity += movement.quantity
-            elif movement.movement_type in ('OUT', 'REM'):
-                if stock.quantity >= movement.quantity:
-                    stock.quantity -= movement.quantity
-                else:
-                    # Not enough stock available
-                    stock.quantity = 0
-            
-            stock.save()
-            
-            # Mark this movement as processed to prevent double processing
-            movement.processed = True
-            movement.save(update_fields=['processed'])
-            
-            try:
-                cache_key = f"stock_{movement.store.id}_{movement.product.id}"
-                cache.delete(cache_key)
-            except Exception as cache_error:
-                print(f"Cache operation failed (non-critical): {str(cache_error)}")
-            
-            # Create an audit log
-            try:
-                user = self.request.user if hasattr(self, 'request') and self.request.user.is_authenticated else None
-                
-                AuditLog.objects.create(
-                    action=f'stock_{movement.movement_type.lower()}',
-                    store=movement.store,
-                    product=movement.product,
-                    user=user,  
-                    details={
-                        'movement_id': movement.id,
-                        'quantity': movement.quantity,
-                        'timestamp': movement.timestamp.isoformat()
-                    }
-                )
-            except Exception as audit_error:
-                print(f"Audit log creation failed (non-critical): {str(audit_error)}")
             
             print(f"Stock movement processed: {movement.movement_type} - {movement.quantity} units of {movement.product.name} at {movement.store.name}")
         except Exception as e:
@@ -463,120 +865,12 @@ def generate_dummy_data(request):
     """
     Generate sample data for testing the application.
     
-    Creates stores, suppliers, products, stock entries, movements and log entries.
+    Creates a small synthetic dataset (stores, suppliers, products, stock
+    entries, processed movements, daily snapshots and their log entries) with
+    the same generator as the generate_dataset management command.
     """
-    # Create Stores
-    stores = [
-        Store(name=f"Store {i}", location=f"Location {i}")
-        for i in range(1, 6)  # 5 stores
-    ]
-    Store.objects.bulk_create(stores)
-
-    # Create Suppliers
-    suppliers = [
-        Supplier(name=f"Supplier {i}", contact_info=f"contact{i}@bazaartech.com")
-        for i in range(1, 4)  # 3 suppliers
-    ]
-    Supplier.objects.bulk_create(suppliers)
-
-    # Create Products
-    products = [
-        Product(name=f"Product {i}", sku=f"SKU{i:03d}")
-        for i in range(1, 11)  # 10 products
-    ]
-    Product.objects.bulk_create(products)
-
-    # Create Initial Stock
-    stock_entries = []
-    for store in Store.objects.all():
-        for product in Product.objects.all():
-            stock_entries.append(
-                Stock(store=store, product=product, quantity=random.randint(50, 200))
-            )
-    Stock.objects.bulk_create(stock_entries)
-
-    # Create Stock Movements
-    movement_types = ['IN', 'OUT', 'REM']
-    movements = []
-    for _ in range(50):  # 50 random movements
-        store = random.choice(stores)
-        product = random.choice(products)
-        supplier = random.choice(suppliers) if random.choice([True, False]) else None
-        movement_type = random.choice(movement_types)
-        quantity = random.randint(1, 50)
-        timestamp = datetime.now() - timedelta(days=random.randint(0, 30))
-
-        movement = StockMovement(
-            product=product,
-            store=store,
-            supplier=supplier,
-            movement_type=movement_type,
-            quantity=quantity,
-            timestamp=timestamp
-        )
-        movements.append(movement)
-
-        stock, _ = Stock.objects.get_or_create(store=store, product=product, defaults={'quantity': 0})
-        if movement_type == 'IN':
-            stock.quantity += quantity
-        elif movement_type in ('OUT', 'REM') and stock.quantity >= quantity:
-            stock.quantity -= quantity
-        stock.save()
-
-    StockMovement.objects.bulk_create(movements)
-    
-    # Create sample log entries
-    log_actions = ['LOGIN', 'LOGOUT', 'CREATE_PRODUCT', 'UPDATE_STOCK', 'DELETE_PRODUCT', 'STOCK_IN', 'STOCK_OUT']
-    log_entries = []
-    
-    try:
-        # get the first user from the database
-        log_user = User.objects.first()
-        if not log_user:
-            # If no user exists, create a default admin
-            log_user = User.objects.create(
-                email="admin@example.com",
-                first_name="Admin",
-                last_name="User",
-                is_active=True,
-                role="admin",
-            )
-            print("Created default admin user for logs")
-    except Exception as e:
-        log_user = None
-        print(f"Error getting/creating user for logs: {str(e)}")
-    
-    for _ in range(30):  
-        action = random.choice(log_actions)
-        store = random.choice(stores) if random.choice([True, False]) else None
-        product = random.choice(products) if random.choice([True, False]) else None
-        timestamp = datetime.now() - timedelta(days=random.randint(0, 30), 
-                                             hours=random.randint(0, 23),
-                                             minutes=random.randint(0, 59))
-        
-        if action == 'LOGIN':
-            details = {'ip_address': f'192.168.1.{random.randint(1, 255)}'}
-        elif action == 'LOGOUT':
-            details = {'duration': f'{random.randint(1, 120)} minutes'}
-        elif action in ['CREATE_PRODUCT', 'UPDATE_STOCK', 'DELETE_PRODUCT']:
-            details = {'product_name': product.name if product else 'Unknown', 
-                      'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-        else:  
-            details = {'quantity': random.randint(1, 100),
-                     'store': store.name if store else 'Unknown',
-                     'product': product.name if product else 'Unknown'}
-            
-        log_entry = AuditLog(
-            action=action,
-            timestamp=timestamp,
-            store=store,
-            product=product,
-            user=log_user,  
-            details=details
-        )
-        log_entries.append(log_entry)
-    
-    AuditLog.objects.bulk_create(log_entries)
+    generate_dataset(stores=5, products=10, suppliers=3, movements=50, assortment=10, days=30,
+                     seed=random.randrange(10 ** 9), log=lambda message: None)
 
     return Response({"message": "Dummy data generated successfully"}, status=status.HTTP_201_CREATED)
 
@@ -601,100 +895,38 @@ def test_celery_connection(request):
 # API Endpoints for Frontend
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(stock_version_keys)
 def stock_api(request):
     """
     API endpoint for filtering stocks data for AJAX requests.
     
-    Provides filtering by store, status, date, supplier, product name, and search term.
-    Supports custom sorting and ordering of results.
+    Provides filtering by store, status, date, supplier, product name, SKU prefix (sku)
+    and search term; searches are ranked best match first unless sort is given.
+    Supports custom sorting and ordering of results. Requests for a single store
+    (optionally a single product) are served from the stock cache.
+    Pass page_size/cursor for keyset pagination or stream=1 for an NDJSON export,
+    and as_of=YYYY-MM-DD to report quantities at the end of that day.
+    Responses carry an ETag of the store (or all stores) and catalog versions;
+    If-None-Match requests are answered with 304 while they are unchanged.
     """
-    # Get query parameters for filtering
-    store_id = request.GET.get('store')
-    status = request.GET.get('status')
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    supplier_id = request.GET.get('supplier')
-    product_name = request.GET.get('product_name')
-    search = request.GET.get('search')
-    sort_field = request.GET.get('sort', 'product__name')
-    sort_order = request.GET.get('order', 'asc')
+    rows = cached_stock_rows(request.GET, STOCK_API_FIELD_MAPPING, default_sort='product__name')
+    if rows is not None:
+        return Response(rows)
 
-    # Map frontend field names to model field names
-    field_mapping = {
-        'product_name': 'product__name',
-        'sku': 'product__sku',
-        'store_name': 'store__name',
-        'quantity': 'quantity',
-        'updated_at': 'id'  
-    }
-    
-    # Map the sort field if it's in our mapping
-    if sort_field in field_mapping:
-        sort_field = field_mapping[sort_field]
+    stocks, serializer = filter_stocks(request.GET)
 
-    # Base queryset with related data
-    stocks = Stock.objects.select_related('product', 'store').all()
+    if wants_page(request.GET):
+        sort_field, descending = stock_api_sort(request.GET)
+        return keyset_page(request, stocks, sort_field, descending,
+                           serializer.serialize, STOCK_SORT_KEYS)
 
-    # Apply filters
-    if store_id:
-        stocks = stocks.filter(store_id=store_id)
-    
-    if status:
-        if status == 'out_of_stock':
-            stocks = stocks.filter(quantity=0)
-        elif status == 'low_stock':
-            stocks = stocks.filter(quantity__gt=0, quantity__lt=20)
-        elif status == 'in_stock':
-            stocks = stocks.filter(quantity__gte=20)
-    
-    if start_date or end_date:
-        stock_movements_query = StockMovement.objects.all()
-        
-        if start_date:
-            try:
-                start_date_aware = timezone.make_aware(datetime.strptime(start_date, '%Y-%m-%d'))
-                stock_movements_query = stock_movements_query.filter(timestamp__gte=start_date_aware)
-            except (ValueError, TypeError):
-                pass
-                
-        if end_date:
-            try:
-                end_date_aware = timezone.make_aware(datetime.strptime(end_date, '%Y-%m-%d'))
-                end_date_aware = end_date_aware.replace(hour=23, minute=59, second=59)
-                stock_movements_query = stock_movements_query.filter(timestamp__lte=end_date_aware)
-            except (ValueError, TypeError):
-                pass
-        
-        if start_date or end_date:  
-            product_store_pairs = stock_movements_query.values('product_id', 'store_id').distinct()
-            stock_filters = models.Q()
-            for pair in product_store_pairs:
-                stock_filters |= models.Q(product_id=pair['product_id'], store_id=pair['store_id'])
-            
-            if stock_filters:  # Only apply if we have at least one pair
-                stocks = stocks.filter(stock_filters)
-    
-    if supplier_id:
-        supplier_movements = StockMovement.objects.filter(supplier_id=supplier_id).values_list('product_id', flat=True).distinct()
-        stocks = stocks.filter(product_id__in=supplier_movements)
-    
-    if product_name:
-        stocks = stocks.filter(product__name__icontains=product_name)
-    
-    if search:
-        stocks = stocks.filter(
-            models.Q(product__name__icontains=search) |
-            models.Q(product__sku__icontains=search) |
-            models.Q(store__name__icontains=search)
-        )
+    stocks = order_stocks(stocks, request.GET)
 
-    # Apply sorting
-    sort_prefix = '-' if sort_order == 'desc' else ''
-    stocks = stocks.order_by(f'{sort_prefix}{sort_field}')
+    if wants_stream(request.GET):
+        return ndjson_stream(serializer.iter_rows(stocks))
 
-    # Serialize the results
-    serializer = StockSerializer(stocks, many=True)
-    return Response(serializer.data)
+    # Serialize the results straight from values_list() tuples
+    return Response(serializer.serialize(stocks))
 
 
 @api_view(['GET'])
@@ -703,44 +935,278 @@ def logs_api(request):
     """
     API endpoint to get system logs with filtering options.
     
-    Provides filtering by action, date range, and user.
-    Returns the 100 most recent logs matching the filters.
+    Provides filtering by action, date range, user (id or email), store and product.
+    Returns the most recent logs matching the filters as a list, limit (default 100)
+    at a time. Pass page_size/cursor to page through every match in (timestamp, id)
+    order, or stream=1 for an NDJSON export.
     """
     try:
-        action_filter = request.GET.get('action')
-        date_from = request.GET.get('start_date')
-        date_to = request.GET.get('end_date')
-        user_id = request.GET.get('user')
-        
-        logs = AuditLog.objects.all().order_by('-timestamp')
-        
-        if action_filter:
-            logs = logs.filter(action__icontains=action_filter)
-            
-        if date_from:
-            try:
-                date_from_aware = timezone.make_aware(datetime.strptime(date_from, '%Y-%m-%d'))
-                logs = logs.filter(timestamp__gte=date_from_aware)
-            except (ValueError, TypeError):
-                pass
-                
-        if date_to:
-            try:
-                date_to_aware = timezone.make_aware(datetime.strptime(date_to, '%Y-%m-%d'))
-                date_to_aware = date_to_aware.replace(hour=23, minute=59, second=59)
-                logs = logs.filter(timestamp__lte=date_to_aware)
-            except (ValueError, TypeError):
-                pass
-                
-        if user_id:
-            logs = logs.filter(user_id=user_id)
-        
-        logs = logs[:100]
-        
-        serializer = AuditLogSerializer(logs, many=True)
-        
-        return Response(serializer.data)
-        
-    except Exception as e:
-        print(f"Error fetching logs: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        logs = filter_audit_logs(request.GET)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # AuditLogFlatSerializer reads its columns (user email, store and product
+    # names) through joins in the same query, so pages cost one query
+    if wants_page(request.GET):
+        return keyset_page(request, logs, 'timestamp', True,
+                           AuditLogFlatSerializer().serialize, AUDIT_LOG_SORT_KEYS)
+
+    logs = logs.order_by('-timestamp', '-id')
+
+    if wants_stream(request.GET):
+        return ndjson_stream(AuditLogFlatSerializer().iter_rows(logs))
+
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(AuditLogFlatSerializer().serialize(logs[:max(limit, 1)]))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def stock_summary_api(request):
+    """
+    API endpoint returning per-store stock status counts.
+    
+    Reads the maintained StoreStockSummary rows, one per store, instead of
+    scanning Stock. Optionally filtered by store.
+    """
+    store_id = request.GET.get('store')
+    stores = Store.objects.all()
+    if store_id:
+        stores = stores.filter(id=store_id)
+
+    # Build summaries for stores that have never been summarized
+    missing = stores.filter(stock_summary__isnull=True).values_list('id', flat=True)
+    if missing:
+        rebuild_store_summaries(list(missing))
+
+    summaries = StoreStockSummary.objects.filter(store__in=stores).order_by('store_id').values_list(
+        'store_id', 'store__name', 'store__low_stock_threshold',
+        'out_of_stock', 'low_stock', 'in_stock', 'total_units'
+    )
+    rows = [
+        {
+            'store_id': summary_store_id,
+            'store_name': store_name,
+            'low_stock_threshold': threshold,
+            'out_of_stock': out_of_stock,
+            'low_stock': low_stock,
+            'in_stock': in_stock,
+            'total_units': total_units,
+        }
+        for summary_store_id, store_name, threshold, out_of_stock, low_stock, in_stock, total_units in summaries
+    ]
+    totals = {field: sum(row[field] for row in rows) for field in STATUS_FIELDS + ('total_units',)}
+    return Response({'totals': totals, 'stores': rows})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def stock_cache_stats(request):
+    """
+    API endpoint exposing the stock cache hit/miss counters.
+    """
+    return Response(stock_cache.stock_cache_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reference_cache_stats(request):
+    """
+    API endpoint exposing the reference cache counters of the process that
+    serves the request.
+    """
+    return Response(reference_cache.reference_cache_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metrics_api(request):
+    """
+    API endpoint exposing per-view and per-task query, database time, cache
+    and latency metrics in the Prometheus text format.
+
+    Scrape it with a token: Authorization: Token <key>. In the stream ingest
+    mode, the size and consumer lag of the ingest stream are included.
+    """
+    body = metrics.render_prometheus(metrics.metrics_registry.totals())
+    body += (
+        "# HELP inventory_audit_log_dropped_total Buffered audit log entries dropped while flushes failed\n"
+        "# TYPE inventory_audit_log_dropped_total counter\n"
+        f"inventory_audit_log_dropped_total {audit.dropped_total()}\n"
+    )
+    if movement_stream.is_enabled():
+        try:
+            body += movement_stream.render_prometheus(movement_stream.stream_stats())
+        except Exception as e:
+            print(f"Movement stream stats failed: {str(e)}")
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def async_user(request):
+    """Authenticate the request of an async view by token or session."""
+    header = request.headers.get('Authorization', '')
+    key = header[len('Token '):] if header.startswith('Token ') else None
+    if key:
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            return None
+        return token.user if token.user.is_active else None
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def ticket_user(ticket):
+    """Return the active user a stock events ticket was issued to, or None."""
+    user_id = stock_events.ticket_user_id(ticket)
+    if user_id is None:
+        return None
+    return await User.objects.filter(pk=user_id, is_active=True).afirst()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def stock_events_ticket(request):
+    """
+    Issue a short-lived ticket for opening a stock event stream, since
+    EventSource cannot send the token header (see stock_events).
+    """
+    return Response({
+        'ticket': stock_events.issue_ticket(request.user),
+        'expires_in': stock_events.STOCK_EVENTS_TICKET_MAX_AGE,
+    })
+
+
+async def stock_events_api(request):
+    """
+    Stream stock changes of the stores given as store=<id>[,<id>...] as
+    Server-Sent Events (see stock_events).
+
+    Authenticated by a ticket from stock_events_ticket given as the ticket
+    parameter, or like the other async views. Needs an ASGI server; each
+    worker serves its subscribers from a single Redis subscription, without
+    database queries once connected.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Stock events need an ASGI server (inventoryProject.asgi)'}, status=501)
+    ticket = request.GET.get('ticket')
+    user = await ticket_user(ticket) if ticket else await async_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    store_ids = export_store_ids(request.GET)
+    if not store_ids:
+        return JsonResponse({'error': 'store must be a comma separated list of ids'}, status=400)
+    if len(store_ids) > STOCK_EVENTS_MAX_STORES:
+        return JsonResponse({'error': f'At most {STOCK_EVENTS_MAX_STORES} stores per subscription'}, status=400)
+
+    response = StreamingHttpResponse(stock_events.event_stream(store_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def json_response(data, status=200):
+    """Build the JSON response of an async view, encoded like DRF's JSONRenderer does."""
+    return JsonResponse(data, status=status, safe=False,
+                        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def api_error_response(exc):
+    """Answer a DRF APIException raised in an async view the way DRF would."""
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(detail, status=exc.status_code)
+
+
+def async_api_view(view):
+    """
+    Serve GET requests authenticated by async_user() with an async view,
+    like @api_view(['GET']) with IsAuthenticated does for sync views.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        user = await async_user(request)
+        if user is None:
+            response = json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = user
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as e:
+            return api_error_response(e)
+    return wrapper
+
+
+@async_api_view
+@async_conditional_get(stock_version_keys)
+async def stock_api_async(request):
+    """
+    Async stock_api for ASGI servers, with the same parameters and responses.
+
+    Cached stock and versions are read on the event loop, so 304s and cache
+    hits hold no thread; other requests run their queries through the async
+    ORM, which holds a thread only while a query runs.
+    """
+    params = request.GET
+    rows = await acached_stock_rows(params, STOCK_API_FIELD_MAPPING, default_sort='product__name')
+    if rows is not None:
+        return json_response(rows)
+
+    if params.get('search'):
+        # search_filter looks up the matching stores
+        stocks, serializer = await sync_to_async(filter_stocks)(params)
+    else:
+        stocks, serializer = filter_stocks(params)
+
+    if wants_page(params):
+        sort_field, descending = stock_api_sort(params)
+        page, page_size = keyset_slice(params, stocks, sort_field, descending, STOCK_SORT_KEYS)
+        rows = await serializer.aserialize(page)
+        return json_response(keyset_result(request, rows, page_size, sort_field, STOCK_SORT_KEYS))
+
+    stocks = order_stocks(stocks, params)
+
+    if wants_stream(params):
+        return ndjson_astream(serializer.aiter_rows(stocks))
+
+    return json_response(await serializer.aserialize(stocks))
+
+
+@async_api_view
+async def logs_api_async(request):
+    """
+    Async logs_api for ASGI servers, with the same parameters and responses.
+    """
+    params = request.GET
+    try:
+        logs = filter_audit_logs(params)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = AuditLogFlatSerializer()
+    if wants_page(params):
+        page, page_size = keyset_slice(params, logs, 'timestamp', True, AUDIT_LOG_SORT_KEYS)
+        rows = await serializer.aserialize(page)
+        return json_response(keyset_result(request, rows, page_size, 'timestamp', AUDIT_LOG_SORT_KEYS))
+
+    logs = logs.order_by('-timestamp', '-id')
+
+    if wants_stream(params):
+        return ndjson_astream(serializer.aiter_rows(logs))
+
+    try:
+        limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return json_response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return json_response(await serializer.aserialize(logs[:max(limit, 1)]))
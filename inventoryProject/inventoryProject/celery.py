@@ -1,7 +1,37 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_project.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventoryProject.settings')
 app = Celery('inventoryProject')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def close_db_pools(**kwargs):
+    """
+    Close connection pools in the main worker process before it forks.
+
+    Pool connections and pool threads cannot be shared with child processes.
+    Plain connections are handled by Celery's Django fixup.
+    """
+    from django.db import connections
+
+    for conn in connections.all(initialized_only=True):
+        if getattr(conn, 'close_pool', None):
+            conn.close_pool()
+
+
+@worker_process_init.connect
+def forget_inherited_db_pools(**kwargs):
+    """
+    Drop any pool a child inherited without closing it; its sockets still
+    belong to the parent. The child opens its own pool on first use.
+    """
+    from django.db import connections
+
+    for conn in connections.all(initialized_only=True):
+        pools = getattr(type(conn), '_connection_pools', None)
+        if pools:
+            pools.pop(conn.alias, None)
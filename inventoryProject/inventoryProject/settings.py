@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,14 +48,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'inventory.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory.middleware.AuditLogFlushMiddleware',
 ]
 
 ROOT_URLCONF = 'inventoryProject.urls'
@@ -91,6 +96,50 @@ DATABASES = {
     }
 }
 
+# Database connection reuse, selected with DB_CONNECTION_MODE:
+#   persistent - each process (and thread) keeps its connection open for
+#                DB_CONN_MAX_AGE seconds, checked before reuse (the default)
+#   pool       - a psycopg 3 connection pool per process, sized by
+#                DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE; the better fit for ASGI
+#   pgbouncer  - persistent connections to a PgBouncer in transaction pooling
+#                mode, so no server-side cursors
+# Celery workers reuse connections the same way; inventoryProject/celery.py
+# makes sure no connection or pool crosses the prefork boundary.
+DB_CONNECTION_MODE = os.environ.get('DB_CONNECTION_MODE', 'persistent')
+if DB_CONNECTION_MODE == 'pool':
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured(
+            "DB_CONNECTION_MODE=pool needs psycopg 3 with its pool package: pip install 'psycopg[binary,pool]'"
+        )
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool owns connection lifetime
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = DB_CONNECTION_MODE == 'pgbouncer'
+
+# Read replica: GET requests read from it (see inventory/db_router.py). For a
+# local setup point it at a second database, or at a copy of a SQLite file.
+if os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        'HOST': os.environ.get('DATABASE_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['inventory.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))  # reads stay on the primary after a write
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -134,6 +183,21 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Warnings of the inventory app (performance budgets, audit log flushes) go to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'inventory': {
+            'handlers': ['console'],
+            'level': os.environ.get('INVENTORY_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
@@ -151,6 +215,18 @@ try:
     CELERY_BROKER_URL = 'redis://localhost:6379/0'
     CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
     CELERY_ENABLED = True
+    # Safety net: drain any movements whose coalesced drain task was lost
+    CELERY_BEAT_SCHEDULE = {
+        'drain-pending-stock-movements': {
+            'task': 'inventory.tasks.process_pending_movements',
+            'schedule': 10.0,
+        },
+        # Create next months' partitions and drop expired ones (inventory/partitions.py)
+        'maintain-partitions': {
+            'task': 'inventory.tasks.maintain_partitions',
+            'schedule': 24 * 60 * 60.0,
+        },
+    }
 except Exception as e:
     print(f"Warning: Celery configuration failed - tasks will be executed synchronously: {str(e)}")
     CELERY_ENABLED = False
@@ -174,6 +250,70 @@ except Exception as e:
         }
     }
 
+# Stock movement batch processing
+STOCK_MOVEMENT_DRAIN_BATCH_SIZE = int(os.environ.get('STOCK_MOVEMENT_DRAIN_BATCH_SIZE', 5000))
+STOCK_MOVEMENT_DRAIN_SCHEDULED_TIMEOUT = 30  # seconds before a lost drain can be rescheduled
+BULK_MOVEMENT_MAX_LINES = 50000  # movements accepted per bulk ingestion request
+# Partitioned queues (see inventory/movement_queues.py): movements are drained per
+# hash of (store, product) on queues stock_movements_0..N-1, each consumed by one
+# worker, e.g. celery -A inventoryProject worker -Q stock_movements_0 -c 1.
+# 0 keeps the single shared drain on the default queue.
+STOCK_MOVEMENT_PARTITIONS = int(os.environ.get('STOCK_MOVEMENT_PARTITIONS', 0))
+# Movement ingestion: 'database' stores each movement before queueing its processing;
+# 'stream' appends validated movements to a Redis Stream of the cache server, which
+# manage.py consume_movement_stream stores in batches (see inventory/movement_stream.py)
+STOCK_MOVEMENT_INGEST = os.environ.get('STOCK_MOVEMENT_INGEST', 'database')
+STOCK_MOVEMENT_STREAM = 'stock_movement_ingest'
+STOCK_MOVEMENT_STREAM_BATCH_SIZE = int(os.environ.get('STOCK_MOVEMENT_STREAM_BATCH_SIZE', 5000))
+STOCK_MOVEMENT_STREAM_CLAIM_IDLE = 60  # seconds before entries of a stalled consumer are taken over
+STOCK_MOVEMENT_STREAM_RETENTION_HOURS = 24  # stored entries are kept this long for replays
+
+# Monthly partitions of StockMovement and AuditLog (PostgreSQL only). Movements
+# older than the retention are rolled up into DailyStockSnapshot, then dropped.
+PARTITION_MONTHS_AHEAD = 3
+STOCK_MOVEMENT_RETENTION_MONTHS = int(os.environ.get('STOCK_MOVEMENT_RETENTION_MONTHS', 13))
+AUDIT_LOG_RETENTION_MONTHS = int(os.environ.get('AUDIT_LOG_RETENTION_MONTHS', 24))
+
+# Audit log writes: 'sync' (in the caller's transaction), 'on_commit' (one insert
+# after commit) or 'buffered' (batched per process, see inventory/audit.py)
+AUDIT_LOG_DURABILITY = os.environ.get('AUDIT_LOG_DURABILITY', 'sync')
+AUDIT_LOG_BUFFER_SIZE = int(os.environ.get('AUDIT_LOG_BUFFER_SIZE', 500))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.environ.get('AUDIT_LOG_FLUSH_INTERVAL', 2.0))
+AUDIT_LOG_MAX_BUFFERED = int(os.environ.get('AUDIT_LOG_MAX_BUFFERED', 50000))  # entries kept while flushes fail
+
+# Stock read-through cache; bump the version to retire every cached entry
+STOCK_CACHE_VERSION = int(os.environ.get('STOCK_CACHE_VERSION', 1))
+STOCK_CACHE_TIMEOUT = int(os.environ.get('STOCK_CACHE_TIMEOUT', 300))
+
+# Per-process LRU of products, stores and suppliers (see inventory/reference_cache.py)
+REFERENCE_CACHE_SIZE = int(os.environ.get('REFERENCE_CACHE_SIZE', 10000))  # entries per model
+REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', 60))  # seconds
+
+# Per-view and per-task metrics (see inventory/metrics.py). Budgets map a view or
+# task name to limits on 'queries', 'db_ms' and 'duration_ms'; set the action to
+# 'raise' in tests to fail on a request over budget instead of logging it.
+# Limits leave headroom over measured counts on a warm process: the listings run
+# 1-2 queries (4 with a cold reference cache); creating a movement runs 1 with a
+# broker and 14-22 plus the broker connect timeout when it is down and the
+# movement is processed inline; process_stock_movement runs 13-21.
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))  # seconds
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'false').lower() == 'true'
+PERFORMANCE_BUDGET_ACTION = os.environ.get('PERFORMANCE_BUDGET_ACTION', 'log')
+PERFORMANCE_BUDGETS = {
+    'stock_api': {'queries': 5, 'duration_ms': 500},
+    'logs_api': {'queries': 3, 'duration_ms': 500},
+    'StockMovementViewSet.list': {'queries': 6, 'duration_ms': 500},
+    'StockMovementViewSet.create': {'queries': 25, 'duration_ms': 1000},
+    'process_stock_movement': {'queries': 25, 'duration_ms': 1000},
+}
+
+# Stock change events pushed to /api/stock/events/ subscribers (see inventory/stock_events.py).
+# Serve them with an ASGI server, e.g. uvicorn inventoryProject.asgi:application
+STOCK_EVENTS_REDIS_URL = os.environ.get('STOCK_EVENTS_REDIS_URL', 'redis://localhost:6379/1')
+STOCK_EVENTS_QUEUE_SIZE = int(os.environ.get('STOCK_EVENTS_QUEUE_SIZE', 1000))  # events a slow client may fall behind
+STOCK_EVENTS_KEEPALIVE = int(os.environ.get('STOCK_EVENTS_KEEPALIVE', 15))  # seconds
+STOCK_EVENTS_TICKET_MAX_AGE = int(os.environ.get('STOCK_EVENTS_TICKET_MAX_AGE', 60))  # seconds a stream ticket is valid
+
 AUTH_USER_MODEL = 'inventory.User'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/home'